@@ -0,0 +1,183 @@
+"""Admin-jobs: lange FTP-overførsler og gendannelser kører på en tråd og
+rapporterer fremskridt i tabellen admin_jobs. Selve jobbene og
+statusendpointet ligger ved deres routes i app.py."""
+
+import os
+import json
+import secrets
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import select as sa_select
+from sqlalchemy.exc import IntegrityError
+from flask import jsonify, url_for
+from flask_login import current_user
+
+from backup_store import lease_owner, app_context
+from models import db, AdminJob, BackupLease
+
+
+# ── Admin jobs ──────────────────────────────────────────────────────────────────
+# FTP-overførsler og gendannelser kan tage længere end Gunicorn's worker-timeout,
+# så endpointene lægger et job i admin_jobs og svarer 202 med job-id'et. Jobbet
+# kører på en tråd i den worker der fik requesten; admin-panelet poller
+# /api/admin/jobs/<id> for fase, rækker behandlet og ETA.
+ADMIN_JOB_FLUSH_SECONDS = 0.5   # fremskridt skrives højst så ofte til DB
+ADMIN_JOB_STALE = timedelta(hours=1)  # 'running' ældre end dette regnes som død worker (anden host)
+ADMIN_JOB_LOCK = 'admin_jobs'  # backup_leases-række der serialiserer start af eksklusive jobs
+RESTORE_JOB_KINDS = ('restore', 'restore_team', 'restore_pit')
+_admin_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='admin-job')
+admin_job_live = {}  # job-id → seneste fremskridt i denne worker (nyere end DB)
+
+
+class _JobProgress:
+    """Fremskridt for ét admin-job. Holdes i admin_job_live og skrives til
+    admin_jobs ved faseskift og højst hver ADMIN_JOB_FLUSH_SECONDS. På SQLite
+    skrives kun ved faseskift: en anden forbindelse kan ikke skrive mens
+    gendannelsen holder skrivelåsen."""
+
+    def __init__(self, job_id: str, kind: str, created_at: datetime):
+        self.job_id = job_id
+        now = datetime.utcnow()
+        self.state = {'kind': kind, 'status': 'running', 'phase': None, 'done': 0, 'total': None,
+                      'phase_at': now, 'created_at': created_at, 'started_at': now, 'finished_at': None}
+        self._flushed = 0.0
+        admin_job_live[job_id] = self.state
+
+    def phase(self, name: str, total: int = None):
+        self.state.update(phase=name, done=0, total=total, phase_at=datetime.utcnow())
+        self.flush(force=True)
+
+    def advance(self, n: int = 1):
+        self.state['done'] += n
+        self.flush()
+
+    def track(self, items):
+        """Tæl hvert element i `items` (rækker eller (section, row)) mens det gives videre."""
+        for item in items:
+            yield item
+            self.advance()
+
+    def flush(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._flushed < ADMIN_JOB_FLUSH_SECONDS:
+            return
+        self._flushed = now
+        engine = db.engine
+        if not force and engine.dialect.name == 'sqlite':
+            return
+        jobs = AdminJob.__table__
+        try:
+            with engine.begin() as conn:
+                conn.execute(jobs.update().where(jobs.c.id == self.job_id).values(
+                    phase=self.state['phase'], done=self.state['done'], total=self.state['total'],
+                    phase_at=self.state['phase_at']))
+        except Exception as exc:
+            print(f'⚠ Admin-job {self.job_id}: fremskridt ikke gemt ({exc})')
+
+
+def _lock_admin_jobs(conn):
+    """Lås backup_leases-rækken ADMIN_JOB_LOCK til transaktionen på `conn` slutter
+    (rækkelås på PostgreSQL, skrivelås på SQLite). Rækken oprettes ved opstart."""
+    lease = BackupLease.__table__
+    values = {'owner': lease_owner(), 'expires_at': datetime.utcnow()}
+    if not conn.execute(lease.update().where(lease.c.name == ADMIN_JOB_LOCK).values(**values)).rowcount:
+        conn.execute(lease.insert().values(name=ADMIN_JOB_LOCK, **values))
+
+
+def _admin_job_busy(conn, kinds) -> str:
+    """Id på et ventende/kørende job af en af `kinds` (fra enhver worker), ellers None."""
+    jobs = AdminJob.__table__
+    return conn.execute(
+        sa_select(jobs.c.id)
+        .where(jobs.c.kind.in_(kinds), jobs.c.status.in_(('queued', 'running')),
+               jobs.c.created_at > datetime.utcnow() - ADMIN_JOB_STALE)
+        .limit(1)
+    ).scalar()
+
+
+def start_admin_job(kind: str, fn, exclusive=None, **params):
+    """Opret et admin-job og kør fn(progress, **params) i baggrunden. fn returnerer
+    (svar-dict, http-status) — det svar endpointet ellers ville have givet.
+    Med `exclusive` (job-kinds) tjekkes og oprettes jobbet i én transaktion under
+    ADMIN_JOB_LOCK, så to workers ikke kan starte hver sin gendannelse.
+    Returnerer 202-svaret med job-id og status-URL (409 hvis et exclusive-job kører)."""
+    job_id, now = secrets.token_hex(16), datetime.utcnow()
+    with db.engine.begin() as conn:
+        if exclusive:
+            _lock_admin_jobs(conn)
+            busy = _admin_job_busy(conn, exclusive)
+            if busy:
+                return jsonify({'error': 'En anden gendannelse kører allerede', 'job_id': busy}), 409
+        conn.execute(AdminJob.__table__.insert().values(
+            id=job_id, kind=kind, user_id=current_user.id, owner=lease_owner(),
+            status='queued', done=0, created_at=now))
+    _admin_executor.submit(_run_admin_job, job_id, kind, now, fn, params)
+    status_url = url_for('admin_job_status', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+
+
+def _owner_is_dead(owner: str) -> bool:
+    """True hvis `owner` (hostname:pid) er en worker på denne host der ikke kører
+    længere — eller denne pid, som ved opstart må være en tidligere proces.
+    Workers på andre hosts kan ikke tjekkes; dér gælder ADMIN_JOB_STALE."""
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def fail_orphaned_admin_jobs():
+    """Ved opstart: jobs der står queued/running hos en død worker markeres
+    'failed', så en genstartet worker ikke blokerer gendannelser i ADMIN_JOB_STALE.
+    Opretter også ADMIN_JOB_LOCK-rækken."""
+    jobs, lease = AdminJob.__table__, BackupLease.__table__
+    try:
+        with db.engine.begin() as conn:
+            if not conn.execute(sa_select(lease.c.name).where(lease.c.name == ADMIN_JOB_LOCK)).first():
+                conn.execute(lease.insert().values(name=ADMIN_JOB_LOCK, owner=lease_owner(),
+                                                   expires_at=datetime.utcnow()))
+    except IntegrityError:
+        pass  # en anden worker nåede det først
+    with db.engine.begin() as conn:
+        rows = conn.execute(sa_select(jobs.c.id, jobs.c.owner)
+                            .where(jobs.c.status.in_(('queued', 'running')))).all()
+        dead = [r.id for r in rows if _owner_is_dead(r.owner)]
+        if dead:
+            conn.execute(jobs.update().where(jobs.c.id.in_(dead)).values(
+                status='failed', http_status=500, finished_at=datetime.utcnow(),
+                result=json.dumps({'error': 'Workeren der kørte jobbet blev stoppet'})))
+    if dead:
+        print(f'⚠ {len(dead)} afbrudte admin-jobs markeret som fejlet')
+
+
+def _run_admin_job(job_id: str, kind: str, created_at: datetime, fn, params: dict):
+    jobs = AdminJob.__table__
+    with app_context():
+        engine = db.engine
+        progress = _JobProgress(job_id, kind, created_at)
+        with engine.begin() as conn:
+            conn.execute(jobs.update().where(jobs.c.id == job_id).values(
+                status='running', started_at=progress.state['started_at']))
+        try:
+            result, code = fn(progress, **params)
+        except Exception as exc:
+            db.session.rollback()
+            print(f'⚠ Admin-job {job_id} fejlede: {exc}')
+            result, code = {'error': str(exc)}, 500
+        state = admin_job_live.pop(job_id, progress.state)
+        with engine.begin() as conn:
+            conn.execute(jobs.update().where(jobs.c.id == job_id).values(
+                status='done' if code < 400 else 'failed', http_status=code, result=json.dumps(result),
+                phase=state['phase'], done=state['done'], total=state['total'], phase_at=state['phase_at'],
+                finished_at=datetime.utcnow()))
@@ -4,21 +4,45 @@ import json
 import ftplib
 import io
 import threading
+import time
 import secrets
-import calendar as cal_module
+import tempfile
 from datetime import datetime, date, timedelta, timezone
 
-from sqlalchemy import text as sa_text, inspect as sa_inspect
+from sqlalchemy import text as sa_text, inspect as sa_inspect, select as sa_select
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, g
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import dateparser
-from dateparser.search import search_dates
 from dotenv import load_dotenv
 
-load_dotenv()
+load_dotenv()  # før backup-modulerne, som læser konfigurationen ved import
+
+import backup_io
+from backup_io import BACKUP_SECTIONS
+from danish_dates import get_danish_holidays, parse_dates_from_message, format_dates_danish
+from models import (db, Team, UserTeam, User, UnavailableDate, GroupEvent, EventComment,
+                    PasswordResetToken, DataVersion, AdminJob)
+import backup_store
+from backup_store import (
+    BACKUP_DEBOUNCE_SECONDS, BACKUP_DIR, BACKUP_FILE, BACKUP_METRICS_WINDOW, BACKUP_SHARDS,
+    BACKUP_SPOOL_BYTES, BACKUP_STAGES, DATA_EPOCH_SCOPE, DELTA_STATE_FILE, FTP_DELTA,
+    HISTORY_CHECKPOINT_HOURS, HISTORY_DAYS, HISTORY_FILE, HISTORY_STATE_FILE, JOURNAL_FILE,
+    RESTORE_SHADOW, apply_journal, backup_status, bump_bulk_versions, clear_backup_tables,
+    db_fingerprint, drop_shadow_tables, empty_backup_sections, file_lock, format_restore_report,
+    ftp_lock, history_enabled, journal_length, last_snapshot, load_shadow, load_state_file,
+    metrics_lock, percentile, read_journal, record_stage, recover_compacting_journal,
+    request_history_checkpoint, restore_reset_tokens, restore_stream, restore_tables,
+    save_state_file, seed_data_versions, sink_status, stage_samples, stage_summary, stage_totals,
+    startup_state, stream_backup, swap_in_shadow, team_scope, team_shard, write_backup,
+    write_backup_now,
+)
+from backup_sync import (
+    fetch_ftp_shards, get_ftp_pool, history_range, history_state_at, outbox_status,
+    start_outbox_uploader, try_use_best_backup,
+)
+from scheduler import scheduler_status, start_scheduler
+from admin_jobs import RESTORE_JOB_KINDS, admin_job_live, fail_orphaned_admin_jobs, start_admin_job
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'ambrotos-dev-secret-change-in-production')
@@ -31,7 +55,8 @@ if _db_url.startswith('postgres://'):
 app.config['SQLALCHEMY_DATABASE_URI'] = _db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+db.init_app(app)
+backup_store.init_app(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Log venligst ind for at fortsætte.'
@@ -50,648 +75,95 @@ MEMBER_COLORS = [
 ]
 
 
-# ── Danish date helpers ─────────────────────────────────────────────────────────
-
-DANISH_MONTHS = {
-    'januar': 1, 'jan': 1,
-    'februar': 2, 'feb': 2,
-    'marts': 3, 'mar': 3,
-    'april': 4, 'apr': 4,
-    'maj': 5,
-    'juni': 6, 'jun': 6,
-    'juli': 7, 'jul': 7,
-    'august': 8, 'aug': 8,
-    'september': 9, 'sep': 9,
-    'oktober': 10, 'okt': 10,
-    'november': 11, 'nov': 11,
-    'december': 12, 'dec': 12,
-}
-
-DANISH_MONTH_NAMES = {
-    1: 'januar', 2: 'februar', 3: 'marts', 4: 'april',
-    5: 'maj', 6: 'juni', 7: 'juli', 8: 'august',
-    9: 'september', 10: 'oktober', 11: 'november', 12: 'december',
-}
-
-DANISH_WEEKDAYS = {
-    'mandag': 0, 'tirsdag': 1, 'onsdag': 2, 'torsdag': 3,
-    'fredag': 4, 'lørdag': 5, 'lordag': 5, 'søndag': 6, 'sondag': 6,
-}
-
-
-def calculate_easter(year: int) -> date:
-    """Calculate Easter Sunday using the Meeus/Jones/Butcher algorithm."""
-    a = year % 19
-    b = year // 100
-    c = year % 100
-    d = b // 4
-    e = b % 4
-    f = (b + 8) // 25
-    g = (b - f + 1) // 3
-    h = (19 * a + b - d - g + 15) % 30
-    i = c // 4
-    k = c % 4
-    l = (32 + 2 * e + 2 * i - h - k) % 7
-    m = (a + 11 * h + 22 * l) // 451
-    month = (h + l - 7 * m + 114) // 31
-    day = ((h + l - 7 * m + 114) % 31) + 1
-    return date(year, month, day)
-
-
-HOLIDAY_DESCRIPTIONS = {
-    'Nytårsdag':            'Det nye år begynder',
-    'Skærtorsdag':          'Jesu sidste nadver med disciplene',
-    'Langfredag':           'Mindes Jesu korsfæstelse og død',
-    'Påskedag':             'Fejrer Jesu opstandelse fra de døde',
-    '2. påskedag':          'Anden dag af påskefejringen',
-    'Kristi Himmelfartsdag':'Jesus steg op til Himmelen, 39 dage efter påske',
-    'Pinsedag':             'Helligåndens komme over apostlene, 50 dage efter påske',
-    '2. pinsedag':          'Anden dag af pinsefejringen',
-    'Grundlovsdag':         'Grundloven underskrevet 5. juni 1849',
-    'Juleaften':            'Traditionel julefejring og familiemiddag',
-    '1. juledag':           'Fejrer Jesu fødsel',
-    '2. juledag':           'Anden dag af julefejringen',
-}
-
-
-def get_danish_holidays(year: int) -> list:
-    """Return list of (date, name, description) tuples for Danish public holidays."""
-    easter = calculate_easter(year)
-    holidays = [
-        (date(year, 1, 1),               'Nytårsdag'),
-        (easter - timedelta(days=3),      'Skærtorsdag'),
-        (easter - timedelta(days=2),      'Langfredag'),
-        (easter,                          'Påskedag'),
-        (easter + timedelta(days=1),      '2. påskedag'),
-        (easter + timedelta(days=39),     'Kristi Himmelfartsdag'),
-        (easter + timedelta(days=49),     'Pinsedag'),
-        (easter + timedelta(days=50),     '2. pinsedag'),
-        (date(year, 6, 5),               'Grundlovsdag'),
-        (date(year, 12, 24),             'Juleaften'),
-        (date(year, 12, 25),             '1. juledag'),
-        (date(year, 12, 26),             '2. juledag'),
-    ]
-    return [(d, name, HOLIDAY_DESCRIPTIONS.get(name, '')) for d, name in sorted(holidays, key=lambda x: x[0])]
-
-
-def parse_dates_from_message(message: str) -> list:
-    """Extract date objects from a Danish natural-language message."""
-    today = date.today()
-    msg = message.lower().strip()
-
-    # Pattern 1: "alle <ugedag>e i <måned> [år]"
-    m = re.search(r'alle\s+(\w+)\s+i\s+(\w+)(?:\s+(\d{4}))?', msg)
-    if m:
-        wday_raw = m.group(1)
-        wday = DANISH_WEEKDAYS.get(wday_raw) or DANISH_WEEKDAYS.get(wday_raw.rstrip('e'))
-        month = DANISH_MONTHS.get(m.group(2))
-        year = int(m.group(3)) if m.group(3) else today.year
-        if wday is not None and month:
-            _, n = cal_module.monthrange(year, month)
-            return [date(year, month, d) for d in range(1, n + 1)
-                    if date(year, month, d).weekday() == wday]
-
-    # Pattern 2: "fra <d>. [m] til <d>. <m> [år]"
-    m = re.search(r'fra\s+(\d+)\.?\s*(\w+)?\s+til\s+(\d+)\.?\s*(\w+)(?:\s+(\d{4}))?', msg)
-    if m:
-        start_d = int(m.group(1))
-        start_mn = m.group(2)
-        end_d = int(m.group(3))
-        end_mn = m.group(4)
-        year = int(m.group(5)) if m.group(5) else today.year
-        end_month = DANISH_MONTHS.get(end_mn)
-        start_month = DANISH_MONTHS.get(start_mn) if start_mn else end_month
-        if start_month and end_month:
-            start = date(year, start_month, start_d)
-            end = date(year, end_month, end_d)
-            cur, result = start, []
-            while cur <= end:
-                result.append(cur)
-                cur += timedelta(days=1)
-            return result
-
-    # Pattern 3: list of days sharing one month — e.g. "5., 12. og 19. januar"
-    months_in_msg = set()
-    for name, num in DANISH_MONTHS.items():
-        if re.search(r'\b' + re.escape(name) + r'\b', msg):
-            months_in_msg.add(num)
-
-    if len(months_in_msg) == 1:
-        month = next(iter(months_in_msg))
-        year_m = re.search(r'\b(\d{4})\b', msg)
-        year = int(year_m.group(1)) if year_m else today.year
-        day_nums = [int(d) for d in re.findall(r'\b(\d{1,2})\.', msg) if int(d) <= 31]
-        result = []
-        for day in day_nums:
-            try:
-                d = date(year, month, day)
-                if d < today and not year_m:
-                    d = date(year + 1, month, day)
-                if d not in result:
-                    result.append(d)
-            except ValueError:
-                pass
-        if result:
-            return sorted(result)
-
-    # Fallback: dateparser.search.search_dates
-    settings = {
-        'LANGUAGES': ['da'],
-        'PREFER_DATES_FROM': 'future',
-        'RELATIVE_BASE': datetime.combine(today, datetime.min.time()),
-    }
-    found = search_dates(message, languages=['da'], settings=settings)
-    if found:
-        seen, result = set(), []
-        for _, dt in found:
-            d = dt.date()
-            if d not in seen:
-                seen.add(d)
-                result.append(d)
-        return result
-
-    return []
-
-
-def format_dates_danish(date_strings: list) -> str:
-    """Format a list of ISO date strings into a readable Danish string."""
-    if not date_strings:
-        return ""
-    dates_obj = [date.fromisoformat(s) for s in date_strings]
-    formatted = [f"{d.day}. {DANISH_MONTH_NAMES[d.month]}" for d in dates_obj]
-    if len(formatted) == 1:
-        return formatted[0]
-    return ", ".join(formatted[:-1]) + " og " + formatted[-1]
-
-
-# ── Models ─────────────────────────────────────────────────────────────────────
-
-class Team(db.Model):
-    __tablename__ = 'teams'
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-    description = db.Column(db.Text, default='')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-
-class UserTeam(db.Model):
-    __tablename__ = 'user_teams'
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
-    team_id = db.Column(db.Integer, db.ForeignKey('teams.id', ondelete='CASCADE'), primary_key=True)
-    is_team_admin = db.Column(db.Boolean, nullable=False, default=False)
-    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-
-class User(UserMixin, db.Model):
-    __tablename__ = 'users'
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=False)
-    color = db.Column(db.String(7), nullable=False, default='#1e88e5')
-    is_admin = db.Column(db.Boolean, nullable=False, default=False)
-    ics_token = db.Column(db.String(64), unique=True, nullable=True)
-    unavailable_dates = db.relationship(
-        'UnavailableDate', backref='user', lazy=True, cascade='all, delete-orphan'
-    )
-
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-    def is_team_admin_for(self, team_id: int) -> bool:
-        """Returnerer True hvis brugeren er team-admin ELLER global super-admin."""
-        if self.is_admin:
-            return True
-        ut = UserTeam.query.filter_by(user_id=self.id, team_id=team_id).first()
-        return ut.is_team_admin if ut else False
-
-
-class UnavailableDate(db.Model):
-    __tablename__ = 'unavailable_dates'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=True)
-    date = db.Column(db.Date, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    __table_args__ = (
-        db.UniqueConstraint('user_id', 'date', name='unique_user_date'),
-    )
-
-
-class GroupEvent(db.Model):
-    __tablename__ = 'group_events'
-    id = db.Column(db.Integer, primary_key=True)
-    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=True)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text, default='')
-    date = db.Column(db.Date, nullable=False)
-    end_date = db.Column(db.Date, nullable=True)
-    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    organizer1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    organizer2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    creator = db.relationship('User', foreign_keys=[created_by], backref='created_events')
-    organizer1 = db.relationship('User', foreign_keys=[organizer1_id])
-    organizer2 = db.relationship('User', foreign_keys=[organizer2_id])
-    comments = db.relationship(
-        'EventComment', backref='event', lazy=True,
-        cascade='all, delete-orphan', order_by='EventComment.created_at',
-    )
-
-
-class EventComment(db.Model):
-    __tablename__ = 'event_comments'
-    id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('group_events.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    text = db.Column(db.Text, nullable=False)
-    is_hidden = db.Column(db.Boolean, nullable=False, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    author = db.relationship('User')
-
-
-class PasswordResetToken(db.Model):
-    __tablename__ = 'password_reset_tokens'
-    id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(64), unique=True, nullable=False, index=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
-    used = db.Column(db.Boolean, nullable=False, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user = db.relationship('User')
-
-
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
 
-# ── Data backup / restore / ICS ────────────────────────────────────────────────
+# Varighed af skrivende /api-requests, til sammenligning i backup-metrics
+@app.before_request
+def _start_request_timer():
+    g._request_started = time.perf_counter()
 
-BACKUP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'calendar_backup.json')
 
-_backup_status = {
-    'local_ok': None,   # True / False / None (unknown)
-    'local_time': None, # ISO string
-    'ftp_ok': None,     # True / False / None (disabled or unknown)
-    'ftp_time': None,   # ISO string
-    'ftp_enabled': False,
-    'ftp_error': None,  # Sidst kendte fejlbesked fra FTP-upload
-}
-_ftp_lock    = threading.Lock()   # kun én FTP-worker ad gangen
-_ftp_pending = threading.Event()  # sættes når ny backup-fil er klar til upload
+@app.after_request
+def _record_request_time(response):
+    started = getattr(g, '_request_started', None)
+    if started is not None and request.method != 'GET' and request.path.startswith('/api/'):
+        record_stage('request', started)
+    return response
 
 
-def write_backup():
-    """Persist current calendar data to a git-tracked JSON file (version 2 format).
-    Called after every write so a redeploy always finds the latest state."""
-    try:
-        os.makedirs(os.path.dirname(BACKUP_FILE), exist_ok=True)
-        payload = {
-            'version': 2,
-            'exported_at': datetime.utcnow().isoformat(),
-            'teams': [
-                {'id': t.id, 'name': t.name, 'description': t.description or ''}
-                for t in Team.query.order_by(Team.id).all()
-            ],
-            'user_teams': [
-                {'user_id': ut.user_id, 'team_id': ut.team_id, 'is_team_admin': ut.is_team_admin}
-                for ut in UserTeam.query.all()
-            ],
-            'users': [
-                {
-                    'id': u.id,
-                    'username': u.username,
-                    'password_hash': u.password_hash,
-                    'color': u.color,
-                    'is_admin': u.is_admin,
-                }
-                for u in User.query.order_by(User.id).all()
-            ],
-            'unavailable_dates': [
-                {'user_id': ud.user_id, 'team_id': ud.team_id, 'date': ud.date.isoformat()}
-                for ud in UnavailableDate.query.all()
-            ],
-            'group_events': [
-                {
-                    'id': e.id,
-                    'team_id': e.team_id,
-                    'title': e.title,
-                    'description': e.description or '',
-                    'date': e.date.isoformat(),
-                    'end_date': e.end_date.isoformat() if e.end_date else None,
-                    'created_by': e.created_by,
-                    'organizer1_id': e.organizer1_id,
-                    'organizer2_id': e.organizer2_id,
-                    'created_at': e.created_at.isoformat(),
-                }
-                for e in GroupEvent.query.order_by(GroupEvent.id).all()
-            ],
-            'event_comments': [
-                {
-                    'event_id': c.event_id,
-                    'user_id': c.user_id,
-                    'text': c.text,
-                    'is_hidden': c.is_hidden,
-                    'created_at': c.created_at.isoformat(),
-                }
-                for c in EventComment.query.order_by(EventComment.id).all()
-            ],
-            'holidays': [
-                {'date': d.isoformat(), 'name': name, 'description': desc}
-                for year in range(date.today().year, date.today().year + 3)
-                for d, name, desc in get_danish_holidays(year)
-            ],
-        }
-        with open(BACKUP_FILE, 'w', encoding='utf-8') as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        _backup_status['local_ok'] = True
-        _backup_status['local_time'] = datetime.utcnow().isoformat()
-        _backup_status['ftp_enabled'] = bool(
-            os.environ.get('FTP_HOST') and os.environ.get('FTP_USER') and os.environ.get('FTP_PASS')
-        )
-        _rotate_and_push_backups()
-    except Exception as exc:
-        _backup_status['local_ok'] = False
-        _backup_status['local_time'] = datetime.utcnow().isoformat()
-        print(f'⚠ Backup write failed: {exc}')
+# ── Data restore / ICS ──────────────────────────────────────────────────────────
 
-
-def _ftp_ensure_dir(ftp, path):
-    """Navigate into the given directory on the FTP server, creating it if needed."""
-    dirs = [d for d in path.strip('/').split('/') if d]
-    for d in dirs:
-        try:
-            ftp.cwd(d)
-        except ftplib.error_perm:
-            ftp.mkd(d)
-            ftp.cwd(d)
-
-
-def _push_backup_to_ftp():
-    """Upload data/calendar_backup.json to FTP server.
-    Runs in a background daemon thread — never blocks a request."""
-    host = os.environ.get('FTP_HOST', '')
-    user = os.environ.get('FTP_USER', '')
-    passwd = os.environ.get('FTP_PASS', '')
-    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
-    if not host or not user or not passwd:
-        return
-    try:
-        with open(BACKUP_FILE, 'rb') as f:
-            file_data = f.read()
-
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(user, passwd)
-        ftp.prot_p()  # Secure data connection
-
-        _ftp_ensure_dir(ftp, remote_dir)
-        ftp.storbinary('STOR calendar_backup.json', io.BytesIO(file_data))
-        ftp.quit()
-        print(f'✓ Backup pushed til FTP ({host}:{remote_dir}/calendar_backup.json)')
-    except Exception as exc:
-        print(f'⚠ FTP upload failed ({host}:{remote_dir}): {exc}')
-
-
-def push_backup_to_ftp():
-    """Non-blocking wrapper — spawns a daemon thread."""
-    if os.environ.get('FTP_HOST') and os.environ.get('FTP_USER') and os.environ.get('FTP_PASS'):
-        threading.Thread(target=_push_backup_to_ftp, daemon=True).start()
-
-
-def _download_backup_from_ftp():
-    """Download calendar_backup.json from FTP server into local data/ directory.
-    Called once at startup if no local backup file exists."""
-    host = os.environ.get('FTP_HOST', '')
-    user = os.environ.get('FTP_USER', '')
-    passwd = os.environ.get('FTP_PASS', '')
-    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
-    if not host or not user or not passwd:
-        return
-    try:
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(user, passwd)
-        ftp.prot_p()
-        ftp.cwd(remote_dir)
-
-        os.makedirs(os.path.dirname(BACKUP_FILE), exist_ok=True)
-        with open(BACKUP_FILE, 'wb') as f:
-            ftp.retrbinary('RETR calendar_backup.json', f.write)
-        ftp.quit()
-        print(f'✓ Backup hentet fra FTP ({host}{remote_dir}/calendar_backup.json)')
-    except Exception as exc:
-        print(f'⚠ FTP download fejlede ({host}:{remote_dir}): {exc}')
-
-
-def _try_use_best_backup():
-    """Always try FTP. If both local and FTP backups exist, use the newer one."""
-    host = os.environ.get('FTP_HOST', '')
-    user = os.environ.get('FTP_USER', '')
-    passwd = os.environ.get('FTP_PASS', '')
-    if not host or not user or not passwd:
-        print('ℹ FTP ikke konfigureret — bruger kun lokal backup')
-        return
-
-    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
-    print(f'ℹ Forsøger FTP backup fra {host}:{remote_dir}/calendar_backup.json')
-
-    # Read local backup timestamp if available
-    local_ts = None
-    if os.path.exists(BACKUP_FILE):
-        try:
-            with open(BACKUP_FILE, encoding='utf-8') as f:
-                local_data = json.load(f)
-            local_ts = local_data.get('exported_at', '')
-        except Exception:
-            pass
-
-    # Download FTP version to a temp location
-    ftp_file = BACKUP_FILE + '.ftp_tmp'
-    try:
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(user, passwd)
-        ftp.prot_p()
-        ftp.cwd(remote_dir)
-        os.makedirs(os.path.dirname(BACKUP_FILE), exist_ok=True)
-        with open(ftp_file, 'wb') as f:
-            ftp.retrbinary('RETR calendar_backup.json', f.write)
-        ftp.quit()
-    except Exception as exc:
-        print(f'⚠ FTP download fejlede ({host}:{remote_dir}): {exc}')
-        if os.path.exists(ftp_file):
-            os.remove(ftp_file)
-        # Prøv nummererede backup-filer som fallback (backup_1 → backup_2 → backup_3)
-        for n in (1, 2, 3):
-            try:
-                ftp2 = ftplib.FTP_TLS(host, timeout=30)
-                ftp2.login(user, passwd)
-                ftp2.prot_p()
-                ftp2.cwd(remote_dir)
-                os.makedirs(os.path.dirname(BACKUP_FILE), exist_ok=True)
-                with open(ftp_file, 'wb') as f2:
-                    ftp2.retrbinary(f'RETR calendar_backup_{n}.json', f2.write)
-                ftp2.quit()
-                os.replace(ftp_file, BACKUP_FILE)
-                print(f'✓ Bruger FTP fallback: calendar_backup_{n}.json')
-                return
-            except Exception:
-                if os.path.exists(ftp_file):
-                    os.remove(ftp_file)
-        return
-
-    # Compare timestamps — use FTP version if newer
-    try:
-        with open(ftp_file, encoding='utf-8') as f:
-            ftp_data = json.load(f)
-        ftp_ts = ftp_data.get('exported_at', '')
-
-        if not local_ts or ftp_ts > local_ts:
-            # FTP is newer (or no local) — replace local
-            os.replace(ftp_file, BACKUP_FILE)
-            print(f'✓ FTP backup er nyere — bruger FTP version ({ftp_ts})')
-        else:
-            os.remove(ftp_file)
-            print(f'✓ Lokal backup er nyere — beholder lokal ({local_ts})')
-    except Exception as exc:
-        print(f'⚠ Kunne ikke sammenligne backups: {exc}')
-        # If comparison fails but FTP file exists and no local, use FTP
-        if not os.path.exists(BACKUP_FILE) and os.path.exists(ftp_file):
-            os.replace(ftp_file, BACKUP_FILE)
-        elif os.path.exists(ftp_file):
-            os.remove(ftp_file)
-
-
-def restore_from_backup():
+def restore_from_backup() -> bool:
     """Populate empty tables from the backup file.
-    Runs on startup so a fresh DB after redeploy gets its data back.
-    Always tries FTP and uses the newer backup (by exported_at timestamp).
-    Handles both version 1 (single-team) and version 2 (multi-team) formats."""
-    _try_use_best_backup()
+    Runs on startup so a fresh DB after redeploy gets its data back:
+
+    1. Er alle tabeller allerede fyldt (fx PostgreSQL efter en genstart, eller
+       den næste Gunicorn-worker), er restoren en no-op, og FTP kontaktes slet ikke.
+    2. Ellers sammenlignes den lokale backup (+ journal) med FTP's (+ delta-patches)
+       via headeren (try_use_best_backup); FTP-filen hentes kun hvis den er nyere
+       og har rækker til de tomme tabeller. Med BACKUP_SHARDS hentes nyere shards.
+    3. Den valgte backup (version 1, 2 eller 3) indlæses, journal-poster nyere end
+       snapshottet afspilles, og kun de tomme tabeller fyldes.
+
+    Returnerer True hvis der blev gendannet rækker (eller oprettet standardbrugere
+    for en backup uden brugere), ellers False — også når der intet var at gendanne."""
+    recover_compacting_journal()
+    empty = empty_backup_sections()
+    if not empty:
+        print('ℹ Databasen er allerede fyldt — springer backup-restore over')
+        return False
+    # Shard-mode: manifestet kan være nyere end calendar_backup.json, så dér
+    # afgør headeren ikke alene om der er noget at gendanne
+    partial = len(empty) < len(BACKUP_SECTIONS) and not BACKUP_SHARDS
+    if try_use_best_backup(empty if partial else None):
+        return False
+    if BACKUP_SHARDS:
+        fetch_ftp_shards()
     if not os.path.exists(BACKUP_FILE):
-        return
+        return False
+    db.session.info['skip_journal'] = True
     try:
-        with open(BACKUP_FILE, encoding='utf-8') as f:
-            data = json.load(f)
+        with open(BACKUP_FILE, 'rb') as f:
+            data = backup_io.load_backup(f)
+
+        journal = read_journal(since=data.get('exported_at', ''))
+        if journal:
+            apply_journal(data, journal)
+            print(f'✓ Afspillet {len(journal)} journal-poster oven på snapshot')
 
         version = data.get('version', 1)
-        restored_any = False
-
-        # ── Restore teams (version 2) ────────────────────────────────────────
-        if version >= 2 and Team.query.count() == 0:
-            team_id_map: dict[int, int] = {}
-            for item in data.get('teams', []):
-                t = Team(name=item['name'], description=item.get('description', ''))
-                db.session.add(t)
-                db.session.flush()
-                team_id_map[item['id']] = t.id
-            restored_any = bool(team_id_map)
-        else:
-            team_id_map = {t.id: t.id for t in Team.query.all()}
-
-        # ── Restore users ───────────────────────────────────────────────────
-        backup_users = data.get('users', [])
-        if User.query.count() == 0:
-            if backup_users:
-                for item in backup_users:
-                    u = User(
-                        id=item['id'],
-                        username=item['username'],
-                        password_hash=item['password_hash'],
-                        color=item['color'],
-                        is_admin=item.get('is_admin', False),
-                    )
-                    db.session.add(u)
-                db.session.flush()
-                restored_any = True
-            else:
-                # Old backup format without users — seed defaults
-                for i, name in enumerate(MEMBER_NAMES):
-                    user = User(username=name, color=MEMBER_COLORS[i], is_admin=(name in ADMIN_USERS))
-                    user.set_password('123')
-                    db.session.add(user)
-                db.session.flush()
-                restored_any = True
-                print('⚠ Backup mangler brugere — standardbrugere oprettet')
-
-        valid_user_ids = {u.id for u in User.query.all()}
-
-        # ── Restore user_teams (version 2) ──────────────────────────────────
-        if version >= 2 and UserTeam.query.count() == 0:
-            for item in data.get('user_teams', []):
-                new_tid = team_id_map.get(item['team_id'])
-                if new_tid and item['user_id'] in valid_user_ids:
-                    db.session.add(UserTeam(
-                        user_id=item['user_id'],
-                        team_id=new_tid,
-                        is_team_admin=item.get('is_team_admin', False),
-                    ))
-            restored_any = True
-
-        # ── Restore unavailable_dates ────────────────────────────────────────
-        if UnavailableDate.query.count() == 0:
-            for item in data.get('unavailable_dates', []):
-                if item['user_id'] not in valid_user_ids:
-                    continue
-                raw_tid = item.get('team_id')
-                new_tid = team_id_map.get(raw_tid) if raw_tid else None
-                db.session.add(UnavailableDate(
-                    user_id=item['user_id'],
-                    team_id=new_tid,
-                    date=date.fromisoformat(item['date']),
-                ))
-            restored_any = True
-
-        # ── Restore group_events (build old-id → new-id map for comments) ───
-        id_map: dict[int, int] = {}
-        if GroupEvent.query.count() == 0:
-            for item in data.get('group_events', []):
-                if item['created_by'] not in valid_user_ids:
-                    continue
-                raw_tid = item.get('team_id')
-                new_tid = team_id_map.get(raw_tid) if raw_tid else None
-                end_date_str = item.get('end_date')
-                org1 = item.get('organizer1_id')
-                org2 = item.get('organizer2_id')
-                ev = GroupEvent(
-                    team_id=new_tid,
-                    title=item['title'],
-                    description=item.get('description', ''),
-                    date=date.fromisoformat(item['date']),
-                    end_date=date.fromisoformat(end_date_str) if end_date_str else None,
-                    created_by=item['created_by'],
-                    organizer1_id=org1 if org1 in valid_user_ids else None,
-                    organizer2_id=org2 if org2 in valid_user_ids else None,
-                    created_at=datetime.fromisoformat(item.get('created_at', datetime.utcnow().isoformat())),
-                )
-                db.session.add(ev)
-                db.session.flush()
-                id_map[item['id']] = ev.id
-            restored_any = True
-
-        # ── Restore event_comments ───────────────────────────────────────────
-        if EventComment.query.count() == 0 and id_map:
-            for item in data.get('event_comments', []):
-                new_eid = id_map.get(item['event_id'])
-                if new_eid and item['user_id'] in valid_user_ids:
-                    db.session.add(EventComment(
-                        event_id=new_eid,
-                        user_id=item['user_id'],
-                        text=item['text'],
-                        is_hidden=item.get('is_hidden', False),
-                        created_at=datetime.fromisoformat(item.get('created_at', datetime.utcnow().isoformat())),
-                    ))
-            restored_any = True
+        seeded = False
+        if not data.get('users') and User.query.count() == 0:
+            # Old backup format without users — seed defaults
+            for i, name in enumerate(MEMBER_NAMES):
+                user = User(username=name, color=MEMBER_COLORS[i], is_admin=(name in ADMIN_USERS))
+                user.set_password('123')
+                db.session.add(user)
+            db.session.flush()
+            seeded = True
+            print('⚠ Backup mangler brugere — standardbrugere oprettet')
 
+        report = restore_tables(data, only_empty=True)
+        restored_any = seeded or any(r['rows'] for r in report.values())
         if restored_any:
             db.session.commit()
-            print(f'✓ Data gendannet fra {BACKUP_FILE} (format v{version})')
+            print(f'✓ Data gendannet fra {BACKUP_FILE} (format v{version}): {format_restore_report(report)}')
+        else:
+            db.session.rollback()
         return restored_any
     except Exception as exc:
+        db.session.rollback()
         print(f'⚠ Backup restore fejlede: {exc}')
         return False
+    finally:
+        db.session.info.pop('skip_journal', None)
+
+
+# Cache-Control max-age for ICS-feeds; derefter genvaliderer klienten med ETag (304)
+ICS_CACHE_SECONDS = int(os.environ.get('ICS_CACHE_SECONDS', '300'))
 
 
 def _ics_escape(text: str) -> str:
@@ -1046,19 +518,58 @@ def list_users():
     return jsonify([{'id': u.id, 'username': u.username, 'color': u.color} for u in users])
 
 
-@app.route('/calendar.ics')
-def serve_ics():
+def _ics_validators(team):
+    """(ETag, Last-Modified) for et ICS-feed ud fra DataVersion alene — ingen
+    event- eller dato-rækker læses. Et teams feed følger teamets eget scope samt
+    'users' (brugernavne i SUMMARY) og 'teams'; det samlede feed følger tabellerne.
+    Restores tæller alle team-scopes op (bump_bulk_versions), og databasens
+    epoch indgår, så en ny database ikke genbruger en gammel ETag."""
+    scopes = [team_scope(team.id), 'teams', 'users'] if team else ['group_events', 'unavailable_dates', 'users']
+    rows = {dv.scope: dv for dv in DataVersion.query.filter(DataVersion.scope.in_([DATA_EPOCH_SCOPE, *scopes]))}
+    epoch = rows[DATA_EPOCH_SCOPE].version if DATA_EPOCH_SCOPE in rows else 0
+    versions = '.'.join(str(rows[s].version if s in rows else 0) for s in scopes)
+    etag = f'ics-{team.id if team else "all"}-{epoch:x}-{versions}'
+    stamps = [rows[s].updated_at for s in scopes if s in rows and rows[s].updated_at]
+    last_modified = max(stamps).replace(microsecond=0, tzinfo=timezone.utc) if stamps else None
+    return etag, last_modified
+
+
+def _ics_response(team):
+    """ICS-svar med ETag/Last-Modified og Cache-Control. Har klienten allerede den
+    aktuelle version (If-None-Match / If-Modified-Since), svares 304 uden at
+    generate_ics() kører. ETag'en er svag: DTSTAMP skifter ved hver generering."""
     from flask import Response
-
-    # Bruges fra browser (session-login)
-    if current_user.is_authenticated:
-        team = get_current_team()
+    etag, last_modified = _ics_validators(team)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        # Last-Modified er hele sekunder: en ændring i samme sekund som `since`
+        # kan ikke skelnes, så kun en strengt ældre ændring giver 304
+        since = request.if_modified_since
+        fresh = bool(last_modified and since and last_modified < since)
+    if fresh:
+        response = Response(status=304)
+    else:
         filename = f"{team.name.lower().replace(' ', '_')}.ics" if team else 'ambrotos.ics'
-        return Response(
+        response = Response(
             generate_ics(team),
             mimetype='text/calendar; charset=utf-8',
             headers={'Content-Disposition': f'inline; filename="{filename}"'},
         )
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = f'private, max-age={ICS_CACHE_SECONDS}, must-revalidate'
+    return response
+
+
+@app.route('/calendar.ics')
+def serve_ics():
+    from flask import Response
+
+    # Bruges fra browser (session-login)
+    if current_user.is_authenticated:
+        return _ics_response(get_current_team())
 
     # Bruges fra kalender-app (HTTP Basic Auth)
     auth = request.authorization
@@ -1066,13 +577,7 @@ def serve_ics():
         user = User.query.filter_by(username=auth.username).first()
         if user and user.check_password(auth.password):
             ut = UserTeam.query.filter_by(user_id=user.id).order_by(UserTeam.joined_at).first()
-            team = db.session.get(Team, ut.team_id) if ut else None
-            filename = f"{team.name.lower().replace(' ', '_')}.ics" if team else 'ambrotos.ics'
-            return Response(
-                generate_ics(team),
-                mimetype='text/calendar; charset=utf-8',
-                headers={'Content-Disposition': f'inline; filename="{filename}"'},
-            )
+            return _ics_response(db.session.get(Team, ut.team_id) if ut else None)
 
     return Response(
         'Log ind for at hente kalenderen.',
@@ -1083,16 +588,9 @@ def serve_ics():
 
 @app.route('/feed/<token>.ics')
 def user_ics_feed(token):
-    from flask import Response
     user = User.query.filter_by(ics_token=token).first_or_404()
     team_ids = [ut.team_id for ut in UserTeam.query.filter_by(user_id=user.id).all()]
-    team = Team.query.get(team_ids[0]) if team_ids else None
-    filename = f"{team.name.lower().replace(' ', '_')}.ics" if team else 'ambrotos.ics'
-    return Response(
-        generate_ics(team),
-        mimetype='text/calendar; charset=utf-8',
-        headers={'Content-Disposition': f'inline; filename="{filename}"'},
-    )
+    return _ics_response(Team.query.get(team_ids[0]) if team_ids else None)
 
 
 @app.route('/api/my-ics-url')
@@ -1647,247 +1145,455 @@ def admin_generate_reset_token(user_id):
     return jsonify({'reset_url': reset_url, 'username': u.username})
 
 
+@app.route('/api/admin/jobs/<job_id>')
+@login_required
+@admin_required
+def admin_job_status(job_id):
+    """Status for et admin-job: fase, rækker behandlet/total og ETA i sekunder;
+    når jobbet er færdigt også `result` og `http_status` fra handlingen."""
+    live = admin_job_live.get(job_id)
+    if live:
+        # Kører i denne worker: svar fra hukommelsen, som er nyere end DB
+        # (på SQLite skrives fremskridt kun ved faseskift)
+        state, job = dict(live), None
+    else:
+        job = db.session.get(AdminJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Ukendt job'}), 404
+        state = {c: getattr(job, c) for c in ('kind', 'status', 'phase', 'done', 'total', 'phase_at',
+                                               'created_at', 'started_at', 'finished_at')}
+    eta = None
+    if state['status'] in ('queued', 'running') and state['total'] and state['done'] and state['phase_at']:
+        elapsed = (datetime.utcnow() - state['phase_at']).total_seconds()
+        eta = round(elapsed / state['done'] * max(0, state['total'] - state['done']), 1)
+    body = {
+        'job_id': job_id,
+        'kind': state['kind'],
+        'status': state['status'],
+        'phase': state['phase'],
+        'done': state['done'],
+        'total': state['total'],
+        'eta_seconds': eta,
+        **{c: state[c].isoformat() if state[c] else None for c in ('created_at', 'started_at', 'finished_at')},
+    }
+    if job is not None and job.result is not None:
+        body.update(http_status=job.http_status, result=json.loads(job.result))
+    return jsonify(body)
+
+
+def _backup_row_total(header: dict):
+    """Rækker i en v3-backup ifølge headeren (None for v1/v2 — ingen ETA)."""
+    return sum(s.get('rows', 0) for s in header.get('sections', [])) or None
+
+
 # ── Admin manual backup ─────────────────────────────────────────────────────────
+# manualbackup/catalog.json beskriver hver manuel backup (navn, exported_at,
+# størrelse, rækker pr. tabel, SHA-256) og opdateres efter hver upload. En lokal
+# kopi (CATALOG_CACHE_FILE) bruges i BACKUP_CATALOG_TTL sekunder, så listen i
+# admin-panelet normalt vises uden at logge ind på FTP.
+MANUAL_BACKUP_DIR  = '/ambrotos/manualbackup'
+MANUAL_BACKUP_LIST = 5   # antal backups i admin-panelets liste
+CATALOG_CACHE_FILE = os.path.join(BACKUP_DIR, '.ftp_catalog.json')
+BACKUP_CATALOG_TTL = float(os.environ.get('BACKUP_CATALOG_TTL', '300'))
+
+
+def _fetch_catalog(sess) -> dict:
+    """Hent catalog.json fra MANUAL_BACKUP_DIR. Findes det ikke endnu (backups fra
+    før kataloget), bygges det af NLST + SIZE — de filer får kun navn og størrelse."""
+    sess.cd(MANUAL_BACKUP_DIR)
+    buf = io.BytesIO()
+    try:
+        sess.ftp.retrbinary(f'RETR {backup_io.CATALOG_FILE}', buf.write)
+        return json.loads(buf.getvalue().decode('utf-8'))
+    except ftplib.error_perm:
+        pass
+    names = [n.rsplit('/', 1)[-1] for n in sess.ftp.nlst()]
+    names = sorted((n for n in names if n.endswith('.json') and n != backup_io.CATALOG_FILE), reverse=True)
+    return {'version': 1, 'backups': [{'name': n, 'size': sess.size(n)} for n in names]}
+
+
+def _cached_catalog():
+    """Den lokale kopi af kataloget hvis den er yngre end BACKUP_CATALOG_TTL, ellers None."""
+    cache = load_state_file(CATALOG_CACHE_FILE)
+    try:
+        age = (datetime.utcnow() - datetime.fromisoformat(cache['fetched_at'])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return None
+    return cache if 0 <= age < BACKUP_CATALOG_TTL else None
+
+
+def _cache_catalog(catalog: dict) -> dict:
+    cache = {'fetched_at': datetime.utcnow().isoformat(), 'catalog': catalog}
+    save_state_file(CATALOG_CACHE_FILE, cache)
+    return cache
+
+
+def _catalog_listing(cache: dict, cached: bool) -> dict:
+    entries = cache['catalog'].get('backups', [])[:MANUAL_BACKUP_LIST]
+    return {'backups': [e['name'] for e in entries], 'entries': entries,
+            'fetched_at': cache['fetched_at'], 'cached': cached}
+
+
+def _admin_backup_job(progress, pool):
+    file_data = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_BYTES)
+    try:
+        progress.phase('eksporterer', sum(t['rows'] for t in db_fingerprint().values()))
+        exported_at = datetime.utcnow().isoformat()
+        rows = stream_backup(file_data, progress=progress, exported_at=exported_at)
+        file_data.seek(0)
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        filename  = f'{timestamp}.json'
+        remote_dir = MANUAL_BACKUP_DIR
+        progress.phase('uploader')
+        size = pool.upload(remote_dir, filename, file_data)
+        print(f'✓ Manuel backup gemt: {remote_dir}/{filename}')
+        entry = {'name': filename, 'exported_at': exported_at, 'size': size, 'format': backup_io.BACKUP_FORMAT,
+                 'rows': {name: rows.get(name, 0) for name in BACKUP_SECTIONS},
+                 'sha256': backup_io.sha256_of(file_data)}
+        try:
+            progress.phase('opdaterer katalog')
+            catalog = pool.run(_fetch_catalog)
+            catalog['backups'] = sorted([e for e in catalog.get('backups', []) if e['name'] != filename] + [entry],
+                                        key=lambda e: e['name'], reverse=True)
+            catalog['updated_at'] = datetime.utcnow().isoformat()
+            pool.upload(remote_dir, backup_io.CATALOG_FILE, io.BytesIO(json.dumps(catalog).encode('utf-8')))
+            _cache_catalog(catalog)
+        except Exception as exc:
+            # Backup'en er gemt; kataloget genopbygges ved næste upload
+            print(f'⚠ Backup-katalog ikke opdateret: {exc}')
+        return {'filename': filename, 'path': f'{remote_dir}/{filename}', 'entry': entry}, 200
+    except Exception as exc:
+        print(f'⚠ Manuel backup fejlede: {exc}')
+        return {'error': str(exc)}, 500
+    finally:
+        file_data.close()
+
 
 @app.route('/api/admin/backup-now', methods=['POST'])
 @login_required
 @admin_required
 def admin_backup_now():
-    """Upload a timestamped manual backup to FTP /ambrotos/manualbackup/."""
-    host   = os.environ.get('FTP_HOST', '')
-    user   = os.environ.get('FTP_USER', '')
-    passwd = os.environ.get('FTP_PASS', '')
-    if not host or not user or not passwd:
+    """Upload a timestamped manual backup to FTP /ambrotos/manualbackup/ and add it
+    to catalog.json (som admin-job)."""
+    pool = get_ftp_pool()
+    if pool is None:
         return jsonify({'error': 'FTP er ikke konfigureret på serveren'}), 503
+    return start_admin_job('backup', _admin_backup_job, pool=pool)
 
-    # Build the same payload as write_backup()
-    payload = {
-        'version': 2,
-        'exported_at': datetime.utcnow().isoformat(),
-        'teams': [
-            {'id': t.id, 'name': t.name, 'description': t.description or ''}
-            for t in Team.query.order_by(Team.id).all()
-        ],
-        'user_teams': [
-            {'user_id': ut.user_id, 'team_id': ut.team_id, 'is_team_admin': ut.is_team_admin}
-            for ut in UserTeam.query.all()
-        ],
-        'users': [
-            {
-                'id': u.id,
-                'username': u.username,
-                'password_hash': u.password_hash,
-                'color': u.color,
-                'is_admin': u.is_admin,
-            }
-            for u in User.query.order_by(User.id).all()
-        ],
-        'unavailable_dates': [
-            {'user_id': ud.user_id, 'team_id': ud.team_id, 'date': ud.date.isoformat()}
-            for ud in UnavailableDate.query.all()
-        ],
-        'group_events': [
-            {
-                'id': e.id,
-                'team_id': e.team_id,
-                'title': e.title,
-                'description': e.description or '',
-                'date': e.date.isoformat(),
-                'end_date': e.end_date.isoformat() if e.end_date else None,
-                'created_by': e.created_by,
-                'organizer1_id': e.organizer1_id,
-                'organizer2_id': e.organizer2_id,
-                'created_at': e.created_at.isoformat(),
-            }
-            for e in GroupEvent.query.order_by(GroupEvent.id).all()
-        ],
-        'event_comments': [
-            {
-                'event_id': c.event_id,
-                'user_id': c.user_id,
-                'text': c.text,
-                'is_hidden': c.is_hidden,
-                'created_at': c.created_at.isoformat(),
-            }
-            for c in EventComment.query.order_by(EventComment.id).all()
-        ],
-    }
-    file_data = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
-    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-    filename  = f'{timestamp}.json'
-    remote_dir = '/ambrotos/manualbackup'
 
+def _admin_list_backups_job(progress, pool):
+    progress.phase('henter katalog')
     try:
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(user, passwd)
-        ftp.prot_p()
-        _ftp_ensure_dir(ftp, remote_dir)
-        ftp.storbinary(f'STOR {filename}', io.BytesIO(file_data))
-        ftp.quit()
-        print(f'✓ Manuel backup gemt: {remote_dir}/{filename}')
-        return jsonify({'filename': filename, 'path': f'{remote_dir}/{filename}'})
+        return _catalog_listing(_cache_catalog(pool.run(_fetch_catalog)), cached=False), 200
     except Exception as exc:
-        print(f'⚠ Manuel backup fejlede: {exc}')
-        return jsonify({'error': str(exc)}), 500
+        return {'error': str(exc)}, 500
 
 
 @app.route('/api/admin/list-backups')
 @login_required
 @admin_required
 def admin_list_backups():
-    """List de 5 seneste manuelle backups i FTP /ambrotos/manualbackup/."""
-    host     = os.environ.get('FTP_HOST', '')
-    ftp_user = os.environ.get('FTP_USER', '')
-    passwd   = os.environ.get('FTP_PASS', '')
-    if not (host and ftp_user and passwd):
+    """De MANUAL_BACKUP_LIST nyeste manuelle backups med metadata fra catalog.json.
+    Svarer fra den lokale kopi hvis den er frisk, ellers hentes kataloget fra FTP
+    (én lille fil). ?refresh=1 henter det forfra som admin-job (202)."""
+    pool = get_ftp_pool()
+    if pool is None:
         return jsonify({'error': 'FTP er ikke konfigureret på serveren'}), 503
+    if request.args.get('refresh'):
+        return start_admin_job('list_backups', _admin_list_backups_job, pool=pool)
+    cache = _cached_catalog()
+    if cache is not None:
+        return jsonify(_catalog_listing(cache, cached=True))
     try:
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(ftp_user, passwd)
-        ftp.prot_p()
-        _ftp_ensure_dir(ftp, '/ambrotos/manualbackup')
-        files = sorted([f for f in ftp.nlst() if f.endswith('.json')], reverse=True)
-        ftp.quit()
-        return jsonify({'backups': files[:5]})
+        return jsonify(_catalog_listing(_cache_catalog(pool.run(_fetch_catalog)), cached=False))
     except Exception as exc:
         return jsonify({'error': str(exc)}), 500
 
 
+def _admin_restore_job(progress, pool, filename: str):
+    # Download og gendan i ét stræk: rækkerne indsættes mens filen streames fra FTP —
+    # i skyggetabellerne (RESTORE_SHADOW), ellers direkte i én transaktion. Fejler
+    # download, checksum, validering eller insert, står de gamle data urørt
+    swap_ms = None
+
+    def _stream_restore(sess):
+        nonlocal swap_ms
+        progress.phase('henter')
+        sess.cd(MANUAL_BACKUP_DIR, create=False)
+        try:
+            with sess.retr_stream(filename) as fh:
+                header, rows = backup_io.iter_backup(fh)
+                progress.phase('gendanner', _backup_row_total(header))
+                if RESTORE_SHADOW:
+                    report = load_shadow(progress.track(rows))
+                else:
+                    tokens = clear_backup_tables()
+                    report = restore_stream(progress.track(rows))
+                    restore_reset_tokens(tokens)
+            if RESTORE_SHADOW:
+                progress.phase('skifter data ud')
+                swap_ms = swap_in_shadow()
+            db.session.commit()
+            return report
+        except Exception:
+            db.session.rollback()  # også før pool.run() prøver igen på en ny forbindelse
+            raise
+
+    db.session.info['skip_journal'] = True
+    try:
+        report = pool.run(_stream_restore)
+    except Exception as exc:
+        return {'error': f'Gendannelse fejlede: {exc}'}, 500
+    finally:
+        db.session.info.pop('skip_journal', None)
+        if RESTORE_SHADOW:
+            drop_shadow_tables()
+
+    progress.phase('skriver backup')
+    request_history_checkpoint()
+    write_backup(compact=True)
+    counts = {name: report.get(name, {}).get('rows', 0) for name in BACKUP_SECTIONS}
+    timings = {name: r['ms'] for name, r in report.items()}
+    print(f'✓ DB gendannet fra FTP manualbackup/{filename}: {format_restore_report(report)}'
+          + (f' — skiftet ud på {swap_ms} ms' if swap_ms is not None else ''))
+    return {'ok': True, 'filename': filename, 'restored': counts, 'timings_ms': timings, 'swap_ms': swap_ms}, 200
+
+
 @app.route('/api/admin/restore-from-ftp', methods=['POST'])
 @login_required
 @admin_required
 def admin_restore_from_ftp():
-    """Download en navngiven backup fra FTP /ambrotos/manualbackup/ og gendan hele DB."""
+    """Download en navngiven backup fra FTP /ambrotos/manualbackup/ og gendan hele DB
+    (som admin-job; 409 hvis en anden gendannelse kører)."""
     req_data = request.get_json() or {}
     filename = req_data.get('filename', '')
     if not filename or '/' in filename or '..' in filename:
         return jsonify({'error': 'Ugyldigt filnavn'}), 400
 
-    host     = os.environ.get('FTP_HOST', '')
-    ftp_user = os.environ.get('FTP_USER', '')
-    passwd   = os.environ.get('FTP_PASS', '')
-    if not (host and ftp_user and passwd):
+    pool = get_ftp_pool()
+    if pool is None:
         return jsonify({'error': 'FTP er ikke konfigureret på serveren'}), 503
+    return start_admin_job('restore', _admin_restore_job, exclusive=RESTORE_JOB_KINDS,
+                            pool=pool, filename=filename)
+
+
+def _team_backup_rows(rows, team_id: int):
+    """Filtrér (section, row) fra en hel backup til ét teams rækker: teamet selv,
+    dets medlemskaber, datoer, events og kommentarerne til de events."""
+    events = set()
+    for section, row in rows:
+        if section == 'teams':
+            keep = row['id'] == team_id
+        elif section == 'event_comments':
+            keep = row['event_id'] in events
+        elif section in ('user_teams', 'unavailable_dates', 'group_events'):
+            keep = row.get('team_id') == team_id
+        else:
+            keep = False
+        if keep:
+            if section == 'group_events':
+                events.add(row['id'])
+            yield section, row
+
+
+def _clear_team(team_id: int):
+    """Slet ét teams rækker (børn før forældre) i den aktuelle transaktion."""
+    team_events = sa_select(GroupEvent.__table__.c.id).where(GroupEvent.__table__.c.team_id == team_id)
+    EventComment.query.filter(EventComment.event_id.in_(team_events)).delete(synchronize_session=False)
+    GroupEvent.query.filter_by(team_id=team_id).delete()
+    UnavailableDate.query.filter_by(team_id=team_id).delete()
+    UserTeam.query.filter_by(team_id=team_id).delete()
+    Team.query.filter_by(id=team_id).delete()
+    bump_bulk_versions(db.session.connection(), BACKUP_SECTIONS, team_id)
+
+
+def _without_conflicts(rows, skipped: dict):
+    """Drop team rows that would collide with rows other teams own now: a user's
+    date is unique across teams, and event/comment ids may have been reused.
+    Comments on a dropped event go with it. Counts go to `skipped`."""
+    ud, ev, ec = UnavailableDate.__table__, GroupEvent.__table__, EventComment.__table__
+    taken_dates = {(u, d.isoformat() if hasattr(d, 'isoformat') else str(d))
+                   for u, d in db.session.execute(sa_select(ud.c.user_id, ud.c.date))}
+    taken_events = set(db.session.execute(sa_select(ev.c.id)).scalars())
+    taken_comments = set(db.session.execute(sa_select(ec.c.id)).scalars())
+    dropped_events = set()
+    for section, row in rows:
+        if ((section == 'unavailable_dates' and (row['user_id'], row['date']) in taken_dates)
+                or (section == 'group_events' and row['id'] in taken_events)
+                or (section == 'event_comments' and (row['event_id'] in dropped_events
+                                                     or row.get('id') in taken_comments))):
+            if section == 'group_events':
+                dropped_events.add(row['id'])
+            skipped[section] = skipped.get(section, 0) + 1
+            continue
+        yield section, row
 
-    # 1. Download fra FTP
+
+def _admin_restore_team_job(progress, pool, filename: str, team_id: int, preview: bool):
+    def _stream_restore(sess):
+        progress.phase('henter')
+        sess.cd(MANUAL_BACKUP_DIR, create=False)
+        skipped = {}
+        try:
+            with sess.retr_stream(filename) as fh:
+                header, rows = backup_io.iter_backup(fh)
+                progress.phase('gendanner', _backup_row_total(header))
+                _clear_team(team_id)
+                team_rows = _team_backup_rows(progress.track(rows), team_id)
+                report = restore_stream(_without_conflicts(team_rows, skipped))
+            if not report.get('teams', {}).get('rows'):
+                raise LookupError(f'Team {team_id} findes ikke i {filename}')
+            if preview:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            return report, skipped
+        except Exception:
+            db.session.rollback()
+            raise
+
+    db.session.info['skip_journal'] = True
     try:
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(ftp_user, passwd)
-        ftp.prot_p()
-        _ftp_ensure_dir(ftp, '/ambrotos/manualbackup')
-        buf = io.BytesIO()
-        ftp.retrbinary(f'RETR {filename}', buf.write)
-        ftp.quit()
-        backup_data = json.loads(buf.getvalue().decode('utf-8'))
+        report, skipped = pool.run(_stream_restore)
+    except LookupError as exc:
+        return {'error': str(exc)}, 404
     except Exception as exc:
-        return jsonify({'error': f'FTP download fejlede: {exc}'}), 500
+        return {'error': f'Gendannelse fejlede: {exc}'}, 500
+    finally:
+        db.session.info.pop('skip_journal', None)
 
-    version = backup_data.get('version', 1)
+    counts = {name: report.get(name, {}).get('rows', 0) for name in BACKUP_SECTIONS}
+    if not preview:
+        progress.phase('skriver backup')
+        request_history_checkpoint()
+        write_backup(compact=True, shards={team_shard(team_id), 'global'})
+        print(f'✓ Team {team_id} gendannet fra FTP manualbackup/{filename}: {format_restore_report(report)}')
+    return {'ok': True, 'filename': filename, 'team_id': team_id, 'preview': preview,
+            'restored': counts, 'skipped': skipped}, 200
 
-    # 2. Ryd alle tabeller i FK-sikker rækkefølge
+
+@app.route('/api/admin/restore-team', methods=['POST'])
+@login_required
+@admin_required
+def admin_restore_team():
+    """Gendan ét team fra en backup i FTP /ambrotos/manualbackup/: teamet, dets
+    medlemskaber, datoer, events og kommentarer erstattes; andre teams og brugerne
+    røres ikke. preview=true kører gendannelsen og ruller den tilbage. Kører som
+    admin-job (409 hvis en anden gendannelse kører)."""
+    req_data = request.get_json() or {}
+    filename = req_data.get('filename', '')
+    if not filename or '/' in filename or '..' in filename:
+        return jsonify({'error': 'Ugyldigt filnavn'}), 400
     try:
-        EventComment.query.delete()
-        GroupEvent.query.delete()
-        UnavailableDate.query.delete()
-        UserTeam.query.delete()
-        User.query.delete()
-        Team.query.delete()
-        db.session.commit()
-    except Exception as exc:
-        db.session.rollback()
-        return jsonify({'error': f'Sletning af eksisterende data fejlede: {exc}'}), 500
+        team_id = int(req_data.get('team_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'team_id mangler'}), 400
+
+    pool = get_ftp_pool()
+    if pool is None:
+        return jsonify({'error': 'FTP er ikke konfigureret på serveren'}), 503
+    return start_admin_job('restore_team', _admin_restore_team_job, exclusive=RESTORE_JOB_KINDS,
+                            pool=pool, filename=filename, team_id=team_id, preview=bool(req_data.get('preview')))
+
 
-    # 3. Gendan data (samme logik som restore_from_backup, men uden empty-check)
+def _parse_restore_time(value: str):
+    """Parse the admin's "at" (ISO fra <input type=datetime-local> eller fx
+    "i går 14:05") to a naive UTC datetime. Tider uden tidszone er dansk tid."""
+    from zoneinfo import ZoneInfo
+    tz = ZoneInfo('Europe/Copenhagen')
     try:
-        team_id_map: dict = {}
-        if version >= 2:
-            for item in backup_data.get('teams', []):
-                t = Team(name=item['name'], description=item.get('description', ''))
-                db.session.add(t)
-                db.session.flush()
-                team_id_map[item['id']] = t.id
-
-        for item in backup_data.get('users', []):
-            db.session.add(User(
-                id=item['id'],
-                username=item['username'],
-                password_hash=item['password_hash'],
-                color=item['color'],
-                is_admin=item.get('is_admin', False),
-            ))
-        db.session.flush()
-        valid_user_ids = {u.id for u in User.query.all()}
-
-        if version >= 2:
-            for item in backup_data.get('user_teams', []):
-                new_tid = team_id_map.get(item['team_id'])
-                if new_tid and item['user_id'] in valid_user_ids:
-                    db.session.add(UserTeam(
-                        user_id=item['user_id'],
-                        team_id=new_tid,
-                        is_team_admin=item.get('is_team_admin', False),
-                    ))
-
-        for item in backup_data.get('unavailable_dates', []):
-            if item['user_id'] not in valid_user_ids:
-                continue
-            raw_tid = item.get('team_id')
-            new_tid = team_id_map.get(raw_tid) if raw_tid else None
-            db.session.add(UnavailableDate(
-                user_id=item['user_id'],
-                team_id=new_tid,
-                date=date.fromisoformat(item['date']),
-            ))
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        dt = dateparser.parse(value, languages=['da', 'en'], settings={
+            'PREFER_DATES_FROM': 'past',
+            'TIMEZONE': 'Europe/Copenhagen',
+            'RETURN_AS_TIMEZONE_AWARE': True,
+        })
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
 
-        id_map: dict = {}
-        for item in backup_data.get('group_events', []):
-            if item['created_by'] not in valid_user_ids:
-                continue
-            raw_tid = item.get('team_id')
-            new_tid = team_id_map.get(raw_tid) if raw_tid else None
-            end_date_str = item.get('end_date')
-            org1 = item.get('organizer1_id')
-            org2 = item.get('organizer2_id')
-            ev = GroupEvent(
-                team_id=new_tid,
-                title=item['title'],
-                description=item.get('description', ''),
-                date=date.fromisoformat(item['date']),
-                end_date=date.fromisoformat(end_date_str) if end_date_str else None,
-                created_by=item['created_by'],
-                organizer1_id=org1 if org1 in valid_user_ids else None,
-                organizer2_id=org2 if org2 in valid_user_ids else None,
-                created_at=datetime.fromisoformat(item.get('created_at', datetime.utcnow().isoformat())),
-            )
-            db.session.add(ev)
-            db.session.flush()
-            id_map[item['id']] = ev.id
-
-        for item in backup_data.get('event_comments', []):
-            new_eid = id_map.get(item['event_id'])
-            if new_eid and item['user_id'] in valid_user_ids:
-                db.session.add(EventComment(
-                    event_id=new_eid,
-                    user_id=item['user_id'],
-                    text=item['text'],
-                    is_hidden=item.get('is_hidden', False),
-                    created_at=datetime.fromisoformat(item.get('created_at', datetime.utcnow().isoformat())),
-                ))
 
+@app.route('/api/admin/history')
+@login_required
+@admin_required
+def admin_history():
+    """Tidsrum der kan gendannes til (point-in-time) ud fra FTP history/."""
+    if not history_enabled():
+        return jsonify({'error': 'Historik kræver FTP og HISTORY_DAYS > 0'}), 503
+    try:
+        info = history_range(os.environ.get('FTP_PATH', '/ambrotos'))
+    except Exception as exc:
+        return jsonify({'error': str(exc)}), 500
+    return jsonify({**info, 'retention_days': HISTORY_DAYS,
+                    'checkpoint_hours': HISTORY_CHECKPOINT_HOURS})
+
+
+def _admin_restore_pit_job(progress, at_iso: str, preview: bool):
+    progress.phase('henter historik')
+    try:
+        data, info = history_state_at(os.environ.get('FTP_PATH', '/ambrotos'), at_iso)
+    except LookupError as exc:
+        return {'error': str(exc)}, 409
+    except Exception as exc:
+        return {'error': f'Historik kunne ikke hentes: {exc}'}, 500
+    counts = {name: len(data.get(name, [])) for name in BACKUP_SECTIONS}
+    if preview:
+        return {'ok': True, 'preview': True, 'at': at_iso, **info, 'restored': counts}, 200
+
+    progress.phase('gendanner', sum(counts.values()))
+    swap_ms = None
+    db.session.info['skip_journal'] = True
+    try:
+        if RESTORE_SHADOW:
+            report = load_shadow(progress.track(
+                (name, item) for name in BACKUP_SECTIONS for item in data.get(name, [])))
+            progress.phase('skifter data ud')
+            swap_ms = swap_in_shadow()
+        else:
+            tokens = clear_backup_tables()
+            report = restore_tables(data, progress=progress)
+            restore_reset_tokens(tokens)
         db.session.commit()
-        write_backup()
-        counts = {
-            'teams': Team.query.count(),
-            'users': User.query.count(),
-            'unavailable_dates': UnavailableDate.query.count(),
-            'group_events': GroupEvent.query.count(),
-            'event_comments': EventComment.query.count(),
-        }
-        print(f'✓ DB gendannet fra FTP manualbackup/{filename}: {counts}')
-        return jsonify({'ok': True, 'filename': filename, 'restored': counts})
     except Exception as exc:
         db.session.rollback()
-        return jsonify({'error': f'Gendannelse fejlede: {exc}'}), 500
+        return {'error': f'Gendannelse fejlede: {exc}'}, 500
+    finally:
+        db.session.info.pop('skip_journal', None)
+        if RESTORE_SHADOW:
+            drop_shadow_tables()
+
+    progress.phase('skriver backup')
+    request_history_checkpoint()
+    write_backup(compact=True)
+    counts = {name: report.get(name, {}).get('rows', 0) for name in BACKUP_SECTIONS}
+    timings = {name: r['ms'] for name, r in report.items()}
+    print(f'✓ DB gendannet til {at_iso} UTC (checkpoint {info["checkpoint"]} + '
+          f'{info["replayed"]} poster): {format_restore_report(report)}')
+    return {'ok': True, 'at': at_iso, **info, 'restored': counts, 'timings_ms': timings, 'swap_ms': swap_ms}, 200
+
+
+@app.route('/api/admin/restore-point-in-time', methods=['POST'])
+@login_required
+@admin_required
+def admin_restore_point_in_time():
+    """Gendan hele DB til et tidspunkt: nyeste checkpoint før tidspunktet + afspilning
+    af historikken frem til det. {"at": ..., "preview": true} viser kun rækkeantal.
+    Kører som admin-job (409 hvis en anden gendannelse kører)."""
+    if not history_enabled():
+        return jsonify({'error': 'Historik kræver FTP og HISTORY_DAYS > 0'}), 503
+    req_data = request.get_json() or {}
+    at = _parse_restore_time(str(req_data.get('at', '')).strip())
+    if at is None:
+        return jsonify({'error': 'Ugyldigt tidspunkt'}), 400
+    if at > datetime.utcnow():
+        return jsonify({'error': 'Tidspunktet ligger i fremtiden'}), 400
+    preview = bool(req_data.get('preview'))
+    return start_admin_job('restore_pit_preview' if preview else 'restore_pit', _admin_restore_pit_job,
+                            exclusive=None if preview else RESTORE_JOB_KINDS,
+                            at_iso=at.isoformat(), preview=preview)
 
 
 # ── Admin team management routes ────────────────────────────────────────────────
@@ -2024,18 +1730,121 @@ def admin_set_team_admin(team_id, user_id):
     return jsonify({'user_id': user_id, 'team_id': team_id, 'is_team_admin': ut.is_team_admin})
 
 
+def _backup_queue() -> dict:
+    """Hvad der venter på backup-writeren og FTP-workeren, og hvor mange bytes
+    journal/historik der endnu ikke er sendt til FTP."""
+    unsent = {}
+    if FTP_DELTA and os.path.exists(JOURNAL_FILE):
+        unsent['delta'] = max(0, os.path.getsize(JOURNAL_FILE) - load_state_file(DELTA_STATE_FILE).get('offset', 0))
+    if history_enabled() and os.path.exists(HISTORY_FILE):
+        unsent['history'] = max(0, os.path.getsize(HISTORY_FILE) - load_state_file(HISTORY_STATE_FILE).get('offset', 0))
+    return {
+        'writes_waiting': backup_status['coalesced'] if backup_status['pending'] else 0,
+        'ftp_worker_running': ftp_lock.locked(),
+        'outbox': outbox_status(),
+        'unsent_bytes': unsent,
+    }
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Backup-metrics i Prometheus' tekstformat. Værdierne er pr. Gunicorn-worker
+    (label `pid`). Kræver `Authorization: Bearer $METRICS_TOKEN` hvis sat."""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Forbidden\n', 403, {'Content-Type': 'text/plain'}
+    pid = os.getpid()
+    with metrics_lock:
+        samples = {stage: list(values) for stage, values in stage_samples.items()}
+        totals = {stage: list(t) for stage, t in stage_totals.items()}
+    lines = [
+        '# HELP ambrotos_backup_stage_seconds Varighed pr. backup-trin (kvantiler over de seneste kørsler).',
+        '# TYPE ambrotos_backup_stage_seconds summary',
+    ]
+    for stage in BACKUP_STAGES:
+        labels = f'pid="{pid}",stage="{stage}"'
+        for q in (0.5, 0.95):
+            value = percentile(samples[stage], q * 100)
+            lines.append(f'ambrotos_backup_stage_seconds{{{labels},quantile="{q}"}} '
+                         f'{value if value is not None else "NaN"}')
+        lines.append(f'ambrotos_backup_stage_seconds_sum{{{labels}}} {totals[stage][0]}')
+        lines.append(f'ambrotos_backup_stage_seconds_count{{{labels}}} {totals[stage][1]}')
+
+    def gauge(name, help_text, values):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in values:
+            extra = ''.join(f',{k}="{v}"' for k, v in labels.items())
+            lines.append(f'{name}{{pid="{pid}"{extra}}} {float(value)}')
+
+    def ts(iso):
+        return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp() if iso else 0
+
+    queue = _backup_queue()
+    if last_snapshot['bytes'] is not None:
+        gauge('ambrotos_backup_payload_bytes', 'Størrelse af seneste lokale snapshot.',
+              [({}, last_snapshot['bytes'])])
+        gauge('ambrotos_backup_rows', 'Rækker pr. tabel i seneste snapshot.',
+              [({'table': name}, n) for name, n in last_snapshot['rows'].items()])
+    if backup_status['ftp_last_bytes'] is not None:
+        gauge('ambrotos_backup_ftp_last_bytes', 'Bytes sendt ved seneste FTP-upload.',
+              [({}, backup_status['ftp_last_bytes'])])
+    gauge('ambrotos_backup_queue', 'Ventende arbejde i backup-pipelinen.', [
+        ({'queue': 'writes_waiting'}, queue['writes_waiting']),
+        ({'queue': 'outbox_pending'}, queue['outbox'].get('pending', 0)),
+        ({'queue': 'outbox_max_attempts'}, queue['outbox'].get('max_attempts', 0)),
+        ({'queue': 'ftp_worker_running'}, queue['ftp_worker_running']),
+    ])
+    gauge('ambrotos_backup_unsent_bytes', 'Journal/historik endnu ikke sendt til FTP.',
+          [({'kind': kind}, n) for kind, n in queue['unsent_bytes'].items()])
+    gauge('ambrotos_backup_ok', '1 hvis seneste backup lykkedes, 0 hvis den fejlede.',
+          [({'target': target}, backup_status[f'{target}_ok'])
+           for target in ('local', 'ftp') if backup_status[f'{target}_ok'] is not None]
+          + [({'target': f'sink:{name}'}, st['ok']) for name, st in sink_status.items() if st['ok'] is not None])
+    gauge('ambrotos_backup_last_timestamp_seconds', 'Tidspunkt for seneste backup-forsøg (unix).',
+          [({'target': target}, ts(backup_status[f'{target}_time']))
+           for target in ('local', 'ftp') if backup_status[f'{target}_time']]
+          + [({'target': f'sink:{name}'}, ts(st['time'])) for name, st in sink_status.items() if st['time']])
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app.route('/api/backup-status')
 @login_required
 def api_backup_status():
-    local_time = _backup_status['local_time']
-    ftp_time = _backup_status['ftp_time']
+    local_time = backup_status['local_time']
+    ftp_time = backup_status['ftp_time']
+    queued_since = backup_status['queued_since']
+    lag_seconds = None
+    if queued_since:
+        lag_seconds = round((datetime.utcnow() - datetime.fromisoformat(queued_since)).total_seconds(), 3)
     return jsonify({
-        'local_ok': _backup_status['local_ok'],
+        'local_ok': backup_status['local_ok'],
         'local_time': local_time,
-        'ftp_ok': _backup_status['ftp_ok'],
+        'ftp_ok': backup_status['ftp_ok'],
         'ftp_time': ftp_time,
-        'ftp_enabled': _backup_status['ftp_enabled'],
-        'ftp_error': _backup_status['ftp_error'],
+        'ftp_enabled': backup_status['ftp_enabled'],
+        'ftp_error': backup_status['ftp_error'],
+        'ftp_mode': backup_status['ftp_mode'],
+        'ftp_last_bytes': backup_status['ftp_last_bytes'],
+        'ftp_patches': backup_status['ftp_patches'],
+        'history_enabled': history_enabled(),
+        'history_ok': backup_status['history_ok'],
+        'history_time': backup_status['history_time'],
+        'history_checkpoint': backup_status['history_checkpoint'],
+        'sinks': sink_status,
+        'mode': backup_status['mode'],
+        'journal_entries': journal_length(),
+        'pending': backup_status['pending'],
+        'queued_since': backup_status['queued_since'],
+        'coalesced': backup_status['coalesced'],
+        'lag_seconds': lag_seconds,
+        'last_lag': backup_status['last_lag'],
+        'debounce_seconds': BACKUP_DEBOUNCE_SECONDS,
+        'jobs': scheduler_status(),
+        'stages_ms': stage_summary(),
+        'last_snapshot': last_snapshot,
+        'queue': _backup_queue(),
+        'metrics_window': BACKUP_METRICS_WINDOW,
     })
 
 
@@ -2069,6 +1878,10 @@ def migrate_db():
             cols = {c['name'] for c in inspector.get_columns('users')}
             if 'ics_token' not in cols:
                 conn.execute(sa_text("ALTER TABLE users ADD COLUMN ics_token VARCHAR(64)"))
+        if inspector.has_table('admin_jobs'):
+            cols = {c['name'] for c in inspector.get_columns('admin_jobs')}
+            if 'owner' not in cols:
+                conn.execute(sa_text("ALTER TABLE admin_jobs ADD COLUMN owner VARCHAR(128)"))
 
 
 def _migrate_to_teams() -> bool:
@@ -2232,214 +2045,110 @@ def _once_seed_activity_events_2026():
         print(f"✓ [én-gangs] Tilføjet {added} arrangement(er) fra aktivitetsplan 2026 + backup gemt")
 
 
-def _has_changes_since_backup() -> bool:
-    """Sammenlign live DB med seneste backup. True = der er ændringer."""
-    if not os.path.exists(BACKUP_FILE):
-        return True
-    try:
-        with open(BACKUP_FILE, encoding='utf-8') as f:
-            saved = json.load(f)
-    except Exception:
-        return True
-
-    live_ud = sorted(
-        [{'user_id': ud.user_id, 'team_id': ud.team_id, 'date': ud.date.isoformat()}
-         for ud in UnavailableDate.query.all()],
-        key=lambda x: (x['user_id'], str(x['date']))
-    )
-    live_ge = sorted(
-        [{'id': e.id, 'title': e.title, 'date': e.date.isoformat(),
-          'end_date': e.end_date.isoformat() if e.end_date else None}
-         for e in GroupEvent.query.all()],
-        key=lambda x: x['id']
-    )
-    live_ec = sorted(
-        [{'event_id': c.event_id, 'user_id': c.user_id, 'text': c.text}
-         for c in EventComment.query.all()],
-        key=lambda x: (x['event_id'], x['user_id'])
-    )
+# ── Startup / readiness ─────────────────────────────────────────────────────────
+# Skema oprettes synkront ved import; gendannelse fra backup (op til flere
+# FTPS-downloads) kører i baggrunden, så Gunicorn kan svare med det samme.
+# STARTUP_RESTORE=sync giver den gamle blokerende opstart (fx til scripts).
+STARTUP_RESTORE     = os.environ.get('STARTUP_RESTORE', 'background').strip().lower()
+STARTUP_RETRY_AFTER = 5   # sekunder — Retry-After mens data gendannes
+_startup_lock = threading.Lock()
+
+
+def init_db(block: bool = None):
+    """Create/migrate the schema, then restore data from backup — in a background
+    thread unless block=True (default from STARTUP_RESTORE).
+    Idempotent: once a restore has started or finished, further calls do nothing."""
+    if block is None:
+        block = STARTUP_RESTORE == 'sync'
+    with _startup_lock:
+        if startup_state['phase'] not in ('starting', 'failed'):
+            return
+        with app.app_context():
+            db.create_all()   # only creates tables that don't yet exist
+            migrate_db()      # add new columns to existing tables
+            seed_data_versions()
+            fail_orphaned_admin_jobs()
+        startup_state.update(phase='restoring', started=datetime.utcnow().isoformat(),
+                              finished=None, error=None)
+    if block:
+        _finish_startup()
+    else:
+        threading.Thread(target=_finish_startup, daemon=True, name='startup-restore').start()
 
-    saved_ud = sorted(saved.get('unavailable_dates', []),
-                      key=lambda x: (x['user_id'], str(x['date'])))
-    saved_ge = sorted(
-        [{'id': e['id'], 'title': e['title'], 'date': e['date'], 'end_date': e.get('end_date')}
-         for e in saved.get('group_events', [])],
-        key=lambda x: x['id']
-    )
-    saved_ec = sorted(
-        [{'event_id': c['event_id'], 'user_id': c['user_id'], 'text': c['text']}
-         for c in saved.get('event_comments', [])],
-        key=lambda x: (x['event_id'], x['user_id'])
-    )
 
-    live_users = sorted(
-        [{'id': u.id, 'username': u.username, 'color': u.color, 'is_admin': u.is_admin}
-         for u in User.query.all()],
-        key=lambda x: x['id']
-    )
-    saved_users = sorted(
-        [{'id': u['id'], 'username': u['username'], 'color': u['color'],
-          'is_admin': u.get('is_admin', False)}
-         for u in saved.get('users', [])],
-        key=lambda x: x['id']
-    )
-    return (live_ud != saved_ud or live_ge != saved_ge
-            or live_ec != saved_ec or live_users != saved_users)
-
-
-def _do_ftp_upload():
-    """Uploader BACKUP_FILE og backup_1 til FTP med rotation (backup_1→backup_2→backup_3).
-    Kaldes udelukkende fra _ftp_upload_worker() der holder _ftp_lock."""
-    host       = os.environ.get('FTP_HOST', '')
-    ftp_user   = os.environ.get('FTP_USER', '')
-    passwd     = os.environ.get('FTP_PASS', '')
-    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
-    if not (host and ftp_user and passwd):
-        return
+def _finish_startup():
+    """Gendan data og markér appen klar. Fil-låsen sørger for at kun én
+    Gunicorn-worker gendanner ad gangen; den næste finder tabellerne fyldte."""
     try:
-        ftp = ftplib.FTP_TLS(host, timeout=30)
-        ftp.login(ftp_user, passwd)
-        ftp.prot_p()
-        _ftp_ensure_dir(ftp, remote_dir)
-        for n in (2, 1):
-            try:
-                ftp.rename(f'calendar_backup_{n}.json', f'calendar_backup_{n + 1}.json')
-            except ftplib.error_perm:
-                pass  # Filen fandtes ikke endnu
-        backup_1 = os.path.join(os.path.dirname(BACKUP_FILE), 'calendar_backup_1.json')
-        with open(backup_1, 'rb') as f:
-            ftp.storbinary('STOR calendar_backup_1.json', f)
-        with open(BACKUP_FILE, 'rb') as f:
-            ftp.storbinary('STOR calendar_backup.json', f)
-        ftp.quit()
-        _backup_status['ftp_ok']    = True
-        _backup_status['ftp_time']  = datetime.utcnow().isoformat()
-        _backup_status['ftp_error'] = None
-        print('✓ FTP-backup uploadet (calendar_backup + backup_1/2/3 roteret)')
+        with file_lock(os.path.join(os.path.dirname(BACKUP_FILE), '.startup.lock')):
+            with app.app_context():
+                _restore_and_seed()
+        startup_state['phase'] = 'ready'
     except Exception as exc:
-        _backup_status['ftp_ok']    = False
-        _backup_status['ftp_time']  = datetime.utcnow().isoformat()
-        _backup_status['ftp_error'] = str(exc)
-        print(f'⚠ FTP-upload fejlede: {exc}')
-
-
-def _ftp_upload_worker():
-    """Kører i én baggrundstråd (holder _ftp_lock). Uploader til FTP i en løkke
-    så længe _ftp_pending er sat — garanterer at ingen skrivning mistes selvom
-    uploads overlapper: ny write sætter _ftp_pending, worker laver én ekstra tur."""
-    try:
-        while _ftp_pending.wait(timeout=0.5):  # True hvis event sat; False efter 0.5 s tomgang
-            _ftp_pending.clear()
-            _do_ftp_upload()
-        # Ingen ventende uploads i 0.5 s → worker afslutter og frigiver lock
+        startup_state['phase'] = 'failed'
+        startup_state['error'] = str(exc)
+        print(f'⚠ Opstart fejlede: {exc}')
     finally:
-        _ftp_lock.release()
-
-
-def _rotate_and_push_backups():
-    """Rotér backup-filer lokalt og start FTP-worker hvis ikke allerede kørende.
-    backup_1 = nyeste, backup_3 = ældste. Forudsætter at BACKUP_FILE netop er skrevet."""
-    import shutil
-    data_dir = os.path.dirname(BACKUP_FILE)
-
-    # Lokal rotation: 2→3, 1→2, current→1 (synkront)
-    for n in (2, 1):
-        src = os.path.join(data_dir, f'calendar_backup_{n}.json')
-        dst = os.path.join(data_dir, f'calendar_backup_{n + 1}.json')
-        if os.path.exists(src):
-            os.replace(src, dst)
-    if os.path.exists(BACKUP_FILE):
-        shutil.copy2(BACKUP_FILE, os.path.join(data_dir, 'calendar_backup_1.json'))
-
-    _ftp_pending.set()                         # signal: ny backup klar til FTP
-    if _ftp_lock.acquire(blocking=False):      # kun én worker ad gangen
-        threading.Thread(target=_ftp_upload_worker).start()
-    # Hvis lock er optaget: eksisterende worker ser _ftp_pending og laver én ekstra tur
-
-
-def _start_daily_backup_thread():
-    """Starter én daemon-tråd der kl. 06:00 (Copenhagen) tjekker for ændringer
-    og kører write_backup() + _rotate_and_push_backups() hvis nødvendigt.
-    fcntl-lås sikrer at kun én Gunicorn-worker kører scheduleren."""
-    import fcntl
-    import time
-    from zoneinfo import ZoneInfo
+        startup_state['finished'] = datetime.utcnow().isoformat()
 
-    lock_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '.backup.lock')
-    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
 
-    def _run():
-        try:
-            lf = open(lock_path, 'w')
-            fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except OSError:
-            return  # En anden worker kører allerede scheduleren
+def _restore_and_seed():
+    # Try to restore from backup first (includes users if available)
+    restored = restore_from_backup()
 
-        try:
-            tz = ZoneInfo('Europe/Copenhagen')
-        except Exception as exc:
-            print(f'⚠ Backup-scheduler: ZoneInfo fejlede ({exc}), falder tilbage til UTC')
-            tz = timezone.utc
-        BACKUP_HOURS = [6, 13, 22]
-        print('✓ Daglig backup-scheduler startet (kører kl. 06:00, 12:00 og 22:00 Copenhagen)')
-        while True:
-            now = datetime.now(tz)
-            candidates = [
-                now.replace(hour=h, minute=0, second=0, microsecond=0)
-                for h in BACKUP_HOURS
-            ]
-            future = [t for t in candidates if t > now]
-            target = min(future) if future else min(candidates) + timedelta(days=1)
-            time.sleep((target - now).total_seconds())
-            try:
-                with app.app_context():
-                    now_str = datetime.now(tz).strftime('%H:%M')
-                    if _has_changes_since_backup():
-                        write_backup()
-                        print(f'✓ Planlagt backup gennemført ({now_str})')
-                    else:
-                        print(f'✓ Planlagt backup: ingen ændringer siden sidst, springer over ({now_str})')
-            except Exception as exc:
-                print(f'⚠ Planlagt backup fejlede: {exc}')
+    # Fallback: seed default users only if no users exist (fresh install, no backup)
+    if User.query.count() == 0:
+        for i, name in enumerate(MEMBER_NAMES):
+            user = User(username=name, color=MEMBER_COLORS[i], is_admin=(name in ADMIN_USERS))
+            user.set_password('123')
+            db.session.add(user)
+        db.session.commit()
+        print(f"✓ Oprettet {len(MEMBER_NAMES)} standardbrugere (ingen backup fundet)")
+        # Vi skriver IKKE backup her: FTP-forbindelsen kan have fejlet midlertidigt
+        # på startup-tidspunktet, og vi vil ikke overskrive rigtig data på FTP
+        # med tomme standardbrugere.
+    else:
+        db_type = 'PostgreSQL' if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI'] else 'SQLite'
+        print(f"✓ Forbundet til {db_type} — {User.query.count()} brugere, data intakt")
+
+        # Migrate existing single-team data to multi-team structure
+        migrated = _migrate_to_teams()
 
-    threading.Thread(target=_run, daemon=True).start()
+        # Persist state to backup only when we actually have real data to save
+        if restored or migrated:
+            write_backup_now()
 
 
-def init_db():
-    with app.app_context():
-        db.create_all()   # only creates tables that don't yet exist
-        migrate_db()      # add new columns to existing tables
+@app.before_request
+def _wait_for_startup():
+    """Mens data gendannes: 503 + Retry-After i stedet for at servere en tom kalender."""
+    phase = startup_state['phase']
+    if phase == 'ready' or request.path in ('/healthz', '/readyz', '/metrics') or request.path.startswith('/static/'):
+        return None
+    headers = {'Retry-After': str(STARTUP_RETRY_AFTER)}
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Kalenderen gendanner data — prøv igen om lidt', 'phase': phase}), 503, headers
+    return render_template('restoring.html', phase=phase, retry_after=STARTUP_RETRY_AFTER), 503, headers
 
-        # Try to restore from backup first (includes users if available)
-        restored = restore_from_backup()
 
-        # Fallback: seed default users only if no users exist (fresh install, no backup)
-        if User.query.count() == 0:
-            for i, name in enumerate(MEMBER_NAMES):
-                user = User(username=name, color=MEMBER_COLORS[i], is_admin=(name in ADMIN_USERS))
-                user.set_password('123')
-                db.session.add(user)
-            db.session.commit()
-            print(f"✓ Oprettet {len(MEMBER_NAMES)} standardbrugere (ingen backup fundet)")
-            # Vi skriver IKKE backup her: FTP-forbindelsen kan have fejlet midlertidigt
-            # på startup-tidspunktet, og vi vil ikke overskrive rigtig data på FTP
-            # med tomme standardbrugere.
-        else:
-            db_type = 'PostgreSQL' if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI'] else 'SQLite'
-            print(f"✓ Forbundet til {db_type} — {User.query.count()} brugere, data intakt")
+@app.route('/healthz')
+def healthz():
+    """Liveness: processen kører og svarer (også mens data gendannes)."""
+    return jsonify({'status': 'ok', 'phase': startup_state['phase']})
 
-            # Migrate existing single-team data to multi-team structure
-            migrated = _migrate_to_teams()
 
-            # Persist state to backup only when we actually have real data to save
-            if restored or migrated:
-                write_backup()
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 først når backup-gendannelsen er færdig."""
+    ready = startup_state['phase'] == 'ready'
+    return jsonify({'ready': ready, **startup_state}), (200 if ready else 503)
 
 
 # Run on every startup (gunicorn imports this module, so __name__ != '__main__').
 # init_db() is idempotent — safe to call multiple times.
 init_db()
-_start_daily_backup_thread()
+start_scheduler()
+start_outbox_uploader()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
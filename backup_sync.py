@@ -0,0 +1,1009 @@
+"""FTP-siden af backuppen: FTPS-pool, upload med rotation, delta-patches,
+shards, valg af nyeste backup ved opstart, backup-sinks, outbox-uploaderen
+og point-in-time-historik. Lokale filer og køen ligger i backup_store.py."""
+
+import os
+import re
+import io
+import json
+import ftplib
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from sqlalchemy import select as sa_select, func as sa_func
+from sqlalchemy.exc import IntegrityError
+
+import backup_io
+from backup_store import (
+    BACKUP_FILE, BACKUP_SHARDS, BACKUP_SINKS, BACKUP_SPOOL_BYTES, COMPACTING_FILE, DELTA_PREFIX,
+    DELTA_STATE_FILE, FTP_DELTA, FTP_REBASE_EVERY, FTP_UPLOAD_STATE_FILE, HISTORY_CHECKPOINT_HOURS, HISTORY_DAYS,
+    HISTORY_FILE, HISTORY_STATE_FILE, HISTORY_SUBDIR, JOURNAL_FILE, SHARD_DIR, SHARD_MANIFEST,
+    SHARD_STATE_FILE, SHARD_SUBDIR, apply_journal, backup_status, compaction_lock, file_lock, ftp_credentials,
+    ftp_lock, ftp_pending, history_enabled, journal_lock, lease_owner, load_state_file,
+    merge_shards, outbox_engine, record_stage, reset_journal_count, save_state_file, shard_path,
+    sink_status, startup_state, app_context, write_backup,
+)
+from models import BackupLease, BackupOutbox
+
+
+# ── FTP ─────────────────────────────────────────────────────────────────────────
+
+_ftp_pool      = None              # backup_io.FTPPool, oprettes ved første brug
+_ftp_pool_lock = threading.Lock()
+FTP_POOL_SIZE  = int(os.environ.get('FTP_POOL_SIZE', '2'))
+
+
+def get_ftp_pool():
+    """Return the process-wide FTPS session pool (None if FTP is not configured).
+    Shared by uploads, startup restore and the admin FTP routes, so each worker
+    keeps at most FTP_POOL_SIZE logged-in connections instead of a TLS
+    handshake + login per operation."""
+    global _ftp_pool
+    host, user, passwd = ftp_credentials()
+    if not (host and user and passwd):
+        return None
+    with _ftp_pool_lock:
+        if _ftp_pool is None or (_ftp_pool.host, _ftp_pool.user, _ftp_pool.passwd) != (host, user, passwd):
+            if _ftp_pool is not None:
+                _ftp_pool.close()
+            _ftp_pool = backup_io.FTPPool(host, user, passwd, size=FTP_POOL_SIZE, timeout=30)
+        return _ftp_pool
+
+
+def _push_backup_to_ftp():
+    """Upload data/calendar_backup.json to FTP server.
+    Runs in a background daemon thread — never blocks a request."""
+    pool = get_ftp_pool()
+    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
+    if pool is None:
+        return
+
+    def _upload(sess):
+        sess.cd(remote_dir)
+        with open(BACKUP_FILE, 'rb') as f:
+            sess.ftp.storbinary('STOR calendar_backup.json', f)
+    try:
+        pool.run(_upload)
+        print(f'✓ Backup pushed til FTP ({pool.host}:{remote_dir}/calendar_backup.json)')
+    except Exception as exc:
+        print(f'⚠ FTP upload failed ({pool.host}:{remote_dir}): {exc}')
+
+
+def push_backup_to_ftp():
+    """Non-blocking wrapper — spawns a daemon thread."""
+    if get_ftp_pool() is not None:
+        threading.Thread(target=_push_backup_to_ftp, daemon=True).start()
+
+
+def _ftp_download(remote_dir: str, name: str, local_path: str):
+    """Download remote_dir/name to local_path over a pooled session — genoptaget
+    med REST og størrelses-/hash-tjekket (se FTPPool.download)."""
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    get_ftp_pool().download(remote_dir, name, local_path)
+
+
+def _download_backup_from_ftp():
+    """Download calendar_backup.json from FTP server into local data/ directory.
+    Called once at startup if no local backup file exists."""
+    pool = get_ftp_pool()
+    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
+    if pool is None:
+        return
+    try:
+        _ftp_download(remote_dir, 'calendar_backup.json', BACKUP_FILE)
+        print(f'✓ Backup hentet fra FTP ({pool.host}{remote_dir}/calendar_backup.json)')
+    except Exception as exc:
+        print(f'⚠ FTP download fejlede ({pool.host}:{remote_dir}): {exc}')
+
+
+def fetch_ftp_patches(remote_dir: str, base_ts: str) -> tuple:
+    """Hent delta-patches til FTP-basen med exported_at=base_ts.
+    Patches fra en ældre basis hentes også (pre_deploy.py kan have lagt en nyere
+    basis op mens den kørende app stadig sendte patches); restore afspiller kun
+    poster med ts >= basens exported_at. Returnerer (rå bytes i rækkefølge,
+    antal patch-filer til denne basis); (b'', 0) hvis ingen."""
+    prefix = f'{DELTA_PREFIX}{_delta_tag(base_ts)}.'
+
+    def _fetch(sess):
+        sess.cd(remote_dir, create=False)
+        names = sorted(n.rsplit('/', 1)[-1] for n in sess.ftp.nlst())
+        buf = io.BytesIO()
+        patches = [n for n in names if n.startswith(DELTA_PREFIX)  # tag = tidsstempel → ældste først
+                   and not n.endswith(backup_io.PART_SUFFIX)]
+        for name in patches:
+            sess.ftp.retrbinary(f'RETR {name}', buf.write)
+        return buf.getvalue(), sum(1 for n in patches if n.startswith(prefix))
+    return get_ftp_pool().run(_fetch)
+
+
+def _latest_journal_ts(raw: bytes) -> str:
+    """Tidsstempel for sidste gyldige journal-linje i `raw` ('' hvis ingen)."""
+    for line in reversed(raw.splitlines()):
+        try:
+            return json.loads(line).get('ts', '')
+        except ValueError:
+            continue
+    return ''
+
+
+def _ftp_backup_header(remote_dir: str, name: str):
+    """Headeren fra starten af en v3-backup på FTP uden at hente resten.
+    None hvis filen er v1/v2, mangler eller ikke kunne læses."""
+    def _head(sess):
+        sess.cd(remote_dir, create=False)
+        return sess.read_head(name)
+    try:
+        return backup_io.parse_backup_header(get_ftp_pool().run(_head))
+    except ftplib.error_perm:
+        return None  # findes ikke — downloaden nedenfor melder fejlen
+    except Exception as exc:
+        print(f'ℹ Kunne ikke læse FTP backup-header ({name}): {exc}')
+        return None
+
+
+def try_use_best_backup(empty: set = None) -> bool:
+    """Try FTP when configured. If both local and FTP backups exist, use the newer one.
+    Med v3-backups sammenlignes først headeren (de første bytes) og eventuelle
+    patches; selve filen hentes kun hvis FTP er nyere og har rækker til en af
+    de tomme tabeller i `empty`. Returnerer True hvis FTP er nyest og intet har
+    til de tomme tabeller, så restoren kan springes over."""
+    pool = get_ftp_pool()
+    if pool is None:
+        print('ℹ FTP ikke konfigureret — bruger kun lokal backup')
+        return False
+    host = pool.host
+
+    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
+    print(f'ℹ Forsøger FTP backup fra {host}:{remote_dir}/calendar_backup.json')
+
+    # Read local backup timestamp if available
+    local_ts = None
+    if os.path.exists(BACKUP_FILE):
+        try:
+            with open(BACKUP_FILE, 'rb') as f:
+                local_ts = backup_io.read_backup_header(f).get('exported_at', '')
+        except Exception:
+            pass
+    local_latest = local_ts
+    if local_ts and os.path.exists(JOURNAL_FILE):
+        with open(JOURNAL_FILE, 'rb') as f:
+            local_latest = max(local_ts, _latest_journal_ts(f.read()))
+
+    def _patches(ftp_ts):
+        # Delta-patches oven på FTP-basen tæller med i dens alder; det samme
+        # gør den lokale journal oven på det lokale snapshot
+        try:
+            return fetch_ftp_patches(remote_dir, ftp_ts)
+        except Exception as exc:
+            print(f'⚠ Kunne ikke hente FTP-patches: {exc}')
+            return b'', 0
+
+    # Billig sammenligning: kun headeren hentes, ikke hele backuppen
+    head = _ftp_backup_header(remote_dir, 'calendar_backup.json')
+    prefetched = None
+    if head is not None:
+        prefetched = _patches(head.get('exported_at', ''))
+        ftp_latest = max(head.get('exported_at', ''), _latest_journal_ts(prefetched[0]))
+        if local_ts and ftp_latest <= local_latest:
+            print(f'✓ Lokal backup er nyere — beholder lokal ({local_latest}), FTP-filen ikke hentet')
+            return False
+        rows = {e['name']: e['rows'] for e in head.get('sections', [])}
+        if empty is not None and not prefetched[0] and not any(rows.get(name) for name in empty):
+            print(f'✓ FTP backup ({ftp_latest}) har intet til de tomme tabeller — ikke hentet')
+            return True
+
+    # Download FTP version to a temp location
+    ftp_file = BACKUP_FILE + '.ftp_tmp'
+    try:
+        _ftp_download(remote_dir, 'calendar_backup.json', ftp_file)
+    except Exception as exc:
+        print(f'⚠ FTP download fejlede ({host}:{remote_dir}): {exc}')
+        if os.path.exists(ftp_file):
+            os.remove(ftp_file)
+        # Prøv nummererede backup-filer som fallback (backup_1 → backup_2 → backup_3)
+        # — over samme poolede forbindelse i stedet for et nyt login pr. fil
+        for n in (1, 2, 3):
+            try:
+                _ftp_download(remote_dir, f'calendar_backup_{n}.json', ftp_file)
+                with open(ftp_file, 'rb') as f2:
+                    bad = backup_io.verify_backup(f2)
+                if bad:
+                    raise ValueError(f'checksum fejl i {bad}')
+                os.replace(ftp_file, BACKUP_FILE)
+                print(f'✓ Bruger FTP fallback: calendar_backup_{n}.json')
+                return False
+            except Exception:
+                if os.path.exists(ftp_file):
+                    os.remove(ftp_file)
+        return False
+
+    # Compare timestamps — use FTP version if newer (and intact)
+    try:
+        with open(ftp_file, 'rb') as f:
+            ftp_header = backup_io.read_backup_header(f)
+            bad = backup_io.verify_backup(f, ftp_header)
+        if bad:
+            os.remove(ftp_file)
+            print(f'⚠ FTP backup er beskadiget (sektion {", ".join(bad)}) — beholder lokal')
+            return False
+        ftp_ts = ftp_header.get('exported_at', '')
+        if prefetched is None or ftp_ts != head.get('exported_at', ''):
+            prefetched = _patches(ftp_ts)  # filen er skiftet siden headeren blev læst
+        patch, n_patches = prefetched
+        ftp_latest = max(ftp_ts, _latest_journal_ts(patch))
+
+        if not local_ts or ftp_latest > local_latest:
+            # FTP is newer (or no local) — replace local, and its patches become the journal
+            with compaction_lock(), journal_lock():
+                os.replace(ftp_file, BACKUP_FILE)
+                with open(JOURNAL_FILE, 'wb') as f:
+                    f.write(patch)
+                reset_journal_count()
+            if FTP_DELTA:
+                with file_lock(DELTA_STATE_FILE + '.lock'):
+                    save_state_file(DELTA_STATE_FILE, {'base': ftp_ts, 'offset': len(patch), 'patches': n_patches})
+            print(f'✓ FTP backup er nyere — bruger FTP version ({ftp_ts}'
+                  + (f' + {n_patches} patches' if n_patches else '') + ')')
+        else:
+            os.remove(ftp_file)
+            print(f'✓ Lokal backup er nyere — beholder lokal ({local_latest})')
+    except Exception as exc:
+        print(f'⚠ Kunne ikke sammenligne backups: {exc}')
+        # If comparison fails but FTP file exists and no local, use FTP
+        if not os.path.exists(BACKUP_FILE) and os.path.exists(ftp_file):
+            os.replace(ftp_file, BACKUP_FILE)
+        elif os.path.exists(ftp_file):
+            os.remove(ftp_file)
+    return False
+
+
+# ── FTP upload ──────────────────────────────────────────────────────────────────
+
+def _ftp_rotate_remote(sess):
+    """Rotér på serveren: 2→3, 1→2 og nuværende calendar_backup→1. Rename i stedet
+    for at uploade backup_1 igen — den er byte for byte den forrige hovedfil."""
+    for src, dst in (('calendar_backup_2.json', 'calendar_backup_3.json'),
+                     ('calendar_backup_1.json', 'calendar_backup_2.json'),
+                     ('calendar_backup.json', 'calendar_backup_1.json')):
+        try:
+            sess.ftp.rename(src, dst)
+        except ftplib.error_perm:
+            pass  # Filen fandtes ikke endnu
+
+
+def _ftp_rotate_into_place(sess, part: str, name: str):
+    """finish-trin til FTPPool.upload: rotér først når den nye fil ligger komplet
+    på serveren, og flyt den så på plads som calendar_backup.json. Springes
+    over hvis outbox-leasen er mistet, så to workers ikke roterer samtidig."""
+    _check_lease()
+    _ftp_rotate_remote(sess)
+    sess.replace(part, name)
+
+
+def _delta_tag(exported_at: str) -> str:
+    """Basis-snapshottets exported_at som filnavns-venligt tag til patch-filerne."""
+    return re.sub(r'[^0-9A-Za-z]', '', exported_at)
+
+
+def _do_ftp_upload(snapshot: bool = False):
+    """Uploader BACKUP_FILE til FTP med rotation (backup→backup_1→backup_2→backup_3)
+    når snapshot=True (delta mode: patches, og ny basis hvis snapshottet er nyt;
+    med BACKUP_SHARDS: først de ændrede shards, så den samlede fil),
+    og sender derefter historik. Kaldes kun af outbox-uploaderen med ftp_lock.
+    En afbrudt overførsel genoptages (FTPPool.upload); rotationen køres først når
+    filen ligger komplet på serveren og aldrig to gange — fejler den, prøves
+    outbox-rækken igen senere.
+    Returnerer bytes sendt, None hvis der ikke var noget, False ved fejl."""
+    pool = get_ftp_pool()
+    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
+    if pool is None:
+        return
+    try:
+        sent = None  # None = kun historik denne tur
+        if FTP_DELTA:
+            sent = _do_ftp_delta_upload(pool, remote_dir)
+        elif snapshot:
+            with open(BACKUP_FILE, 'rb') as f:
+                exported_at = backup_io.read_backup_header(f).get('exported_at', '')
+                # Allerede sendt, hvis en tidligere tur kun fejlede på et shard
+                if exported_at != load_state_file(FTP_UPLOAD_STATE_FILE).get('exported_at'):
+                    started = time.perf_counter()
+                    sent = pool.upload(remote_dir, 'calendar_backup.json', f, finish=_ftp_rotate_into_place)
+                    record_stage('ftp_transfer', started)
+                    save_state_file(FTP_UPLOAD_STATE_FILE, {'exported_at': exported_at})
+                    print('✓ FTP-backup uploadet (calendar_backup + backup_1/2/3 roteret)')
+            if BACKUP_SHARDS:
+                shard_bytes = _do_ftp_shard_upload(pool, remote_dir)
+                if shard_bytes is not None:
+                    sent = (sent or 0) + shard_bytes
+        if sent is not None:
+            backup_status['ftp_ok']    = True
+            backup_status['ftp_time']  = datetime.utcnow().isoformat()
+            backup_status['ftp_error'] = None
+            backup_status['ftp_last_bytes'] = sent
+    except Exception as exc:
+        backup_status['ftp_ok']    = False
+        backup_status['ftp_time']  = datetime.utcnow().isoformat()
+        backup_status['ftp_error'] = str(exc)
+        print(f'⚠ FTP-upload fejlede: {exc}')
+        sent = False
+    if history_enabled() and not _lease_lost.is_set():
+        _ship_history(pool, remote_dir)
+    return sent
+
+
+def _do_ftp_shard_upload(pool, remote_dir: str) -> int:
+    """Shard mode: upload de shards hvis exported_at afviger fra det FTP har
+    (SHARD_STATE_FILE), parallelt over FTP-poolen, slet shards for slettede teams
+    og upload til sidst manifest.json. Et shard der fejler prøves igen næste tur;
+    de andre er gemt i tilstanden. Returnerer antal sendte bytes."""
+    manifest = load_state_file(SHARD_MANIFEST)
+    if not manifest.get('shards'):
+        return None
+    state = load_state_file(SHARD_STATE_FILE)
+    uploaded = state.get('shards', {})
+    changed = [n for n, ts in manifest['shards'].items() if uploaded.get(n) != ts]
+    removed = [n for n in uploaded if n not in manifest['shards']]
+    if not changed and not removed and state.get('exported_at') == manifest['exported_at']:
+        return None
+    shard_dir = f'{remote_dir.rstrip("/")}/{SHARD_SUBDIR}'
+
+    def _upload(name):
+        with open(shard_path(name), 'rb') as f:
+            exported_at = backup_io.read_backup_header(f).get('exported_at', '')
+            return exported_at, pool.upload(shard_dir, f'{name}.json', f)
+
+    started = time.perf_counter()
+    sent, errors = 0, []
+    with ThreadPoolExecutor(max_workers=FTP_POOL_SIZE) as executor:
+        futures = {executor.submit(_upload, name): name for name in changed}
+        for future in as_completed(futures):
+            try:
+                exported_at, size = future.result()
+                uploaded[futures[future]] = exported_at
+                sent += size
+            except Exception as exc:
+                errors.append(f'{futures[future]}: {exc}')
+    record_stage('ftp_transfer', started)
+    save_state_file(SHARD_STATE_FILE, {**state, 'shards': uploaded})
+    if errors:
+        raise RuntimeError('shard-upload fejlede — ' + '; '.join(errors))
+
+    def _delete(sess):
+        sess.cd(shard_dir)
+        for name in removed:
+            try:
+                sess.ftp.delete(f'{name}.json')
+            except ftplib.error_perm:
+                pass  # allerede væk
+    if removed:
+        pool.run(_delete)
+    body = json.dumps({'exported_at': manifest['exported_at'],
+                       'shards': {n: uploaded[n] for n in manifest['shards']}}).encode('utf-8')
+    sent += pool.upload(shard_dir, 'manifest.json', io.BytesIO(body))
+    for name in removed:
+        uploaded.pop(name, None)
+    save_state_file(SHARD_STATE_FILE, {'exported_at': manifest['exported_at'], 'shards': uploaded})
+    print(f'✓ FTP-shards uploadet ({len(changed)} ændret'
+          + (f', {len(removed)} slettet' if removed else '') + f' af {len(manifest["shards"])})')
+    return sent
+
+
+def fetch_ftp_shards() -> bool:
+    """Startup (shard mode): hent shards fra FTP_PATH/shards/ parallelt hvis FTP's
+    manifest er nyere end den lokale backup, og saml BACKUP_FILE af dem.
+    Kører efter try_use_best_backup(), så en nyere samlet fil (fx fra
+    pre_deploy.py) vinder. Returnerer True hvis shards blev brugt."""
+    pool = get_ftp_pool()
+    if pool is None:
+        return False
+    shard_dir = f'{os.environ.get("FTP_PATH", "/ambrotos").rstrip("/")}/{SHARD_SUBDIR}'
+
+    def _manifest(sess):
+        sess.cd(shard_dir, create=False)
+        buf = io.BytesIO()
+        sess.ftp.retrbinary('RETR manifest.json', buf.write)
+        return json.loads(buf.getvalue())
+    try:
+        remote = pool.run(_manifest)
+    except Exception:
+        return False  # ingen shards på FTP (endnu)
+    local_ts = ''
+    if os.path.exists(BACKUP_FILE):
+        with open(BACKUP_FILE, 'rb') as f:
+            local_ts = backup_io.read_backup_header(f).get('exported_at', '')
+    if remote.get('exported_at', '') <= local_ts:
+        return False
+
+    def _download(name):
+        tmp = shard_path(name) + '.ftp_tmp'
+        _ftp_download(shard_dir, f'{name}.json', tmp)
+        with open(tmp, 'rb') as f:
+            bad = backup_io.verify_backup(f)
+        if bad:
+            raise ValueError(f'{name}: checksum fejl i {", ".join(bad)}')
+        return tmp
+    names = list(remote['shards'])
+    try:
+        with ThreadPoolExecutor(max_workers=FTP_POOL_SIZE) as executor:
+            tmps = list(executor.map(_download, names))
+    except Exception as exc:
+        print(f'⚠ FTP-shards kunne ikke hentes — beholder {"lokal" if local_ts else "ingen"} backup: {exc}')
+        for name in names:
+            if os.path.exists(shard_path(name) + '.ftp_tmp'):
+                os.remove(shard_path(name) + '.ftp_tmp')
+        return False
+    with compaction_lock(), journal_lock():
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        for name in os.listdir(SHARD_DIR):
+            if name.endswith('.json') and name[:-5] not in remote['shards'] and name != 'manifest.json':
+                os.remove(os.path.join(SHARD_DIR, name))
+        for name, tmp in zip(names, tmps):
+            os.replace(tmp, shard_path(name))
+        manifest = {'exported_at': remote['exported_at'], 'shards': remote['shards']}
+        save_state_file(SHARD_MANIFEST, manifest)
+        with open(BACKUP_FILE + '.tmp', 'wb') as f:
+            merge_shards(f, manifest)
+        os.replace(BACKUP_FILE + '.tmp', BACKUP_FILE)
+        if os.path.exists(JOURNAL_FILE):
+            open(JOURNAL_FILE, 'w').close()
+            reset_journal_count(0)
+    save_state_file(SHARD_STATE_FILE, manifest)  # det er præcis hvad FTP har
+    print(f'✓ FTP-shards er nyere — bruger {len(names)} shards fra FTP ({remote["exported_at"]})')
+    return True
+
+
+def _do_ftp_delta_upload(pool, remote_dir: str) -> int:
+    """Delta mode: upload kun journal-linjer der ikke er sendt endnu, som
+    calendar_backup.delta.<basis-tag>.<n>.jsonl. Når det lokale snapshot er
+    kompakteret (ny exported_at) uploades det som ny basis, og de gamle patches
+    slettes. Returnerer antal sendte bytes.
+
+    Snapshot og journal læses under journal-låsen, så basis og patch altid passer
+    sammen; selve overførslen sker uden låsen. Under en kompaktering venter turen:
+    journalen er så nystartet oven på et snapshot der ikke er skrevet endnu, og
+    den nye basis tager linjerne med bagefter."""
+    with file_lock(DELTA_STATE_FILE + '.lock'):
+        state = load_state_file(DELTA_STATE_FILE)
+        base_copy = None
+        with journal_lock():
+            if os.path.exists(COMPACTING_FILE):
+                return 0
+            with open(BACKUP_FILE, 'rb') as f:
+                base_ts = backup_io.read_backup_header(f).get('exported_at', '')
+                rebase = state.get('base') != base_ts
+                if rebase:
+                    f.seek(0)
+                    base_copy = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_BYTES)
+                    shutil.copyfileobj(f, base_copy)
+                    base_copy.seek(0)
+            offset = 0 if rebase else state.get('offset', 0)
+            patch = b''
+            if os.path.exists(JOURNAL_FILE):
+                with open(JOURNAL_FILE, 'rb') as f:
+                    f.seek(offset)
+                    patch = f.read()
+        if not rebase and not patch:
+            return 0
+
+        tag = _delta_tag(base_ts)
+        sent = 0
+        def _drop_old_patches(sess):
+            sess.cd(remote_dir)
+            for name in sess.ftp.nlst():
+                name = name.rsplit('/', 1)[-1]
+                if name.startswith(DELTA_PREFIX) and not name.startswith(f'{DELTA_PREFIX}{tag}.'):
+                    try:
+                        sess.ftp.delete(name)
+                    except ftplib.error_perm:
+                        pass
+
+        try:
+            started = time.perf_counter()
+            if rebase:
+                sent += pool.upload(remote_dir, 'calendar_backup.json', base_copy, finish=_ftp_rotate_into_place)
+                _check_lease()
+                pool.run(_drop_old_patches)
+                state = {'base': base_ts, 'offset': 0, 'patches': 0}
+                save_state_file(DELTA_STATE_FILE, state)
+            if patch:
+                _check_lease()  # patch-nummeret må ikke bruges af to workers
+                n = state.get('patches', 0) + 1
+                sent += pool.upload(remote_dir, f'{DELTA_PREFIX}{tag}.{n:05d}.jsonl', io.BytesIO(patch))
+                state.update(offset=offset + len(patch), patches=n)
+                save_state_file(DELTA_STATE_FILE, state)
+            record_stage('ftp_transfer', started)
+        finally:
+            if base_copy is not None:
+                base_copy.close()
+
+    backup_status['ftp_patches'] = state.get('patches', 0)
+    if rebase:
+        print(f'✓ FTP-basis uploadet ({base_ts}) + gamle patches ryddet')
+    if patch:
+        print(f'✓ FTP-patch {state["patches"]} uploadet ({len(patch)} bytes)')
+    if state.get('patches', 0) >= FTP_REBASE_EVERY:
+        write_backup(compact=True)  # kompaktering → nyt snapshot → ny basis ved næste tur
+    return sent
+
+
+# ── Backup sinks ────────────────────────────────────────────────────────────────
+# Konfigurationen (BACKUP_SINKS) og køen ligger i backup_store.py.
+
+def _push_to_sink(name: str) -> bool:
+    """Send BACKUP_FILE til én sink. Filen åbnes én gang, så sinken får ét
+    helt snapshot selv om backup-writeren erstatter filen imens.
+    Returnerer False ved fejl."""
+    sink, status = BACKUP_SINKS[name], sink_status[name]
+    try:
+        with open(BACKUP_FILE, 'rb') as f:
+            exported_at = backup_io.read_backup_header(f).get('exported_at', '')
+            if exported_at == status['exported_at']:
+                return True  # sinken har allerede dette snapshot
+            status['bytes'] = sink.store(f, exported_at)
+        status.update(ok=True, time=datetime.utcnow().isoformat(), error=None, exported_at=exported_at)
+        print(f'✓ Backup sendt til {name} ({sink.target}, {status["bytes"]} bytes)')
+        return True
+    except Exception as exc:
+        status.update(ok=False, time=datetime.utcnow().isoformat(), error=str(exc))
+        print(f'⚠ Backup til {name} ({sink.target}) fejlede: {exc}')
+        return False
+
+
+# ── Backup outbox ───────────────────────────────────────────────────────────────
+# Uploads ligger i tabellen backup_outbox, så de overlever en worker-genstart og
+# ses af alle Gunicorn-workers. Hver worker har en uploader-tråd, men kun den der
+# holder leasen 'ftp_uploader' uploader (og roterer på FTP); de andre prøver at
+# overtage leasen hvert OUTBOX_POLL_SECONDS. Levering er at-least-once: en række
+# er 'pending' indtil uploaden er lykkedes, og fejl prøves igen med backoff.
+# Rækker til FTP og til hver backup-sink sendes samtidig i hver tur.
+# En tur kan vare længere end leasen (timeouts, retries med backoff), så den
+# fornyes af en heartbeat-tråd mens turen kører. Mistes den alligevel, roteres
+# der ikke på FTP, og rækkerne markeres ikke — den nye leder tager dem.
+OUTBOX_POLL_SECONDS  = float(os.environ.get('OUTBOX_POLL_SECONDS', '2'))
+OUTBOX_LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS', '60'))
+OUTBOX_MAX_BACKOFF   = 300   # sekunder mellem forsøg på en fejlende upload
+_lease_until = None          # hvornår vores egen lease udløber (None = ikke leder)
+_lease_lost  = threading.Event()  # sat af heartbeaten hvis leasen er overtaget under en tur
+
+
+class LeaseLost(RuntimeError):
+    """Leasen 'ftp_uploader' er udløbet og måske overtaget af en anden worker."""
+
+
+def _acquire_lease(name: str = 'ftp_uploader') -> bool:
+    """Tag eller forny leasen. Fornyes først når halvdelen af tiden er gået."""
+    global _lease_until
+    now = datetime.utcnow()
+    if _lease_until and _lease_until - now > timedelta(seconds=OUTBOX_LEASE_SECONDS / 2):
+        return True
+    lease = BackupLease.__table__
+    me, until = lease_owner(), now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    engine = outbox_engine()
+    with engine.begin() as conn:
+        taken = conn.execute(
+            lease.update()
+            .where(lease.c.name == name)
+            .where((lease.c.owner == me) | (lease.c.expires_at < now))
+            .values(owner=me, expires_at=until)
+        ).rowcount
+        exists = taken or conn.execute(sa_select(lease.c.name).where(lease.c.name == name)).first()
+    if not exists:
+        try:
+            with engine.begin() as conn:
+                conn.execute(lease.insert().values(name=name, owner=me, expires_at=until))
+            taken = True
+        except IntegrityError:
+            taken = False  # en anden worker nåede det først
+    if taken and not _lease_until:
+        print(f'✓ FTP-uploader: denne worker ({me}) er nu leder')
+    _lease_until = until if taken else None
+    return bool(taken)
+
+
+def _renew_lease(conn, name: str = 'ftp_uploader') -> bool:
+    """Forlæng vores egen lease på `conn` — kun hvis vi stadig ejer den og den
+    ikke er udløbet. Returnerer False (og sætter _lease_lost) hvis den er mistet."""
+    global _lease_until
+    lease = BackupLease.__table__
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    renewed = conn.execute(
+        lease.update()
+        .where(lease.c.name == name, lease.c.owner == lease_owner(), lease.c.expires_at > now)
+        .values(expires_at=until)
+    ).rowcount
+    if not renewed:
+        _lease_until = None
+        if not _lease_lost.is_set():
+            _lease_lost.set()
+            print(f'⚠ FTP-uploader: leasen er mistet ({lease_owner()}) — afbryder turen')
+        return False
+    _lease_until = until
+    return True
+
+
+def _check_lease():
+    """Kaldes før trin der ikke må køre samtidig i to workers (rotation på FTP,
+    patch-numre). Rejser LeaseLost hvis heartbeaten har mistet leasen."""
+    if _lease_lost.is_set():
+        raise LeaseLost('FTP-uploader-leasen er overtaget af en anden worker')
+
+
+class _LeaseHeartbeat:
+    """Forny leasen hver OUTBOX_LEASE_SECONDS/3 fra en tråd, mens en outbox-tur kører."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='outbox-lease')
+
+    def _run(self):
+        while not self._stop.wait(OUTBOX_LEASE_SECONDS / 3):
+            try:
+                with outbox_engine().begin() as conn:
+                    if not _renew_lease(conn):
+                        return
+            except Exception as exc:
+                print(f'⚠ FTP-uploader: lease ikke fornyet: {exc}')
+
+    def __enter__(self):
+        _lease_lost.clear()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def uploaded_exported_at() -> str:
+    """exported_at for det snapshot FTP senest har fået helt: delta-basis eller
+    fuld upload (med BACKUP_SHARDS den ældste af samlet fil og shard-sæt)."""
+    if FTP_DELTA:
+        return load_state_file(DELTA_STATE_FILE).get('base', '')
+    uploaded = load_state_file(FTP_UPLOAD_STATE_FILE).get('exported_at', '')
+    if BACKUP_SHARDS:
+        return min(uploaded, load_state_file(SHARD_STATE_FILE).get('exported_at', ''))
+    return uploaded
+
+
+def outbox_enabled() -> bool:
+    return bool(BACKUP_SINKS) or all(ftp_credentials())
+
+
+def _outbox_target(kind: str):
+    """Sink-navnet for 'sink:<navn>'-rækker, None for FTP."""
+    return kind.split(':', 1)[1] if kind.startswith('sink:') else None
+
+
+def _deliver_outbox(target, kinds: set):
+    """Én tur for ét mål (tråd i _process_outbox): FTP med ftp_lock eller en sink."""
+    with app_context():
+        if target is not None:
+            return _push_to_sink(target)
+        with ftp_lock:
+            return _do_ftp_upload(snapshot='snapshot' in kinds)
+
+
+def _process_outbox():
+    """Upload alt der venter i outboxen i én tur og markér rækkerne. FTP og
+    hver backup-sink er et mål for sig: de sendes parallelt, og et mål der
+    fejler får backoff uden at forsinke de andre."""
+    outbox = BackupOutbox.__table__
+    engine = outbox_engine()
+    now = datetime.utcnow()
+    with engine.connect() as conn:
+        rows = conn.execute(
+            sa_select(outbox)
+            .where(outbox.c.status == 'pending', outbox.c.next_attempt_at <= now)
+            .order_by(outbox.c.id)
+        ).all()
+    if not rows:
+        return
+    groups, dropped = {}, []
+    for r in rows:
+        target = _outbox_target(r.kind)
+        if target is None or target in BACKUP_SINKS:
+            groups.setdefault(target, []).append(r)
+        else:
+            dropped.append(r.id)  # sinken er fjernet fra BACKUP_SINKS
+    with ThreadPoolExecutor(max_workers=max(1, len(groups)), thread_name_prefix='outbox') as executor:
+        futures = {executor.submit(_deliver_outbox, target, {r.kind for r in group}): target
+                   for target, group in groups.items()}
+        results = {futures[f]: f.result() for f in as_completed(futures)}
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        # Forny leasen i samme transaktion som rækkerne markeres: er den mistet
+        # undervejs, markerer den nye leder dem i stedet
+        if not _renew_lease(conn):
+            return
+        if dropped:
+            conn.execute(outbox.update().where(outbox.c.id.in_(dropped)).values(status='superseded', done_at=now))
+        for target, group in groups.items():
+            if target is None:
+                error = backup_status['ftp_error']
+                uploaded = {'snapshot': uploaded_exported_at()}
+            else:
+                error = sink_status[target]['error']
+                uploaded = {f'sink:{target}': sink_status[target]['exported_at'] or ''}
+            for r in group:
+                if results[target] is False:
+                    delay = min(OUTBOX_MAX_BACKOFF, 5 * 2 ** r.attempts)
+                    conn.execute(outbox.update().where(outbox.c.id == r.id).values(
+                        attempts=r.attempts + 1, last_error=error,
+                        next_attempt_at=now + timedelta(seconds=delay)))
+                    continue
+                if r.kind != 'sync' and (r.exported_at or '') > uploaded[r.kind]:
+                    continue  # nyere end det der blev sendt — tages ved næste tur
+                status = 'superseded' if r.kind != 'sync' and r.exported_at != uploaded[r.kind] else 'done'
+                conn.execute(outbox.update().where(outbox.c.id == r.id, outbox.c.status == 'pending')
+                             .values(status=status, done_at=now))
+
+
+def _outbox_uploader():
+    """Uploader-tråd (én pr. worker). Vågner ved ftp_pending eller hvert
+    OUTBOX_POLL_SECONDS, så rækker lagt af andre workers også bliver sendt."""
+    while True:
+        ftp_pending.wait(timeout=OUTBOX_POLL_SECONDS)
+        ftp_pending.clear()
+        if startup_state['phase'] != 'ready' or not outbox_enabled():
+            continue
+        try:
+            if _acquire_lease():
+                with app_context(), _LeaseHeartbeat():
+                    _process_outbox()
+        except Exception as exc:
+            print(f'⚠ Outbox-uploader fejlede: {exc}')
+            time.sleep(OUTBOX_POLL_SECONDS)
+
+
+def start_outbox_uploader():
+    threading.Thread(target=_outbox_uploader, daemon=True, name='outbox-uploader').start()
+
+
+def outbox_status() -> dict:
+    """Ventende uploads, fejlende forsøg og hvem der er uploader — læst fra DB,
+    så alle workers svarer ens."""
+    outbox, lease = BackupOutbox.__table__, BackupLease.__table__
+    try:
+        with outbox_engine().connect() as conn:
+            pending = conn.execute(
+                sa_select(sa_func.count(), sa_func.min(outbox.c.created_at), sa_func.max(outbox.c.attempts))
+                .where(outbox.c.status == 'pending')
+            ).one()
+            last_error = conn.execute(
+                sa_select(outbox.c.last_error)
+                .where(outbox.c.status == 'pending', outbox.c.attempts > 0)
+                .order_by(outbox.c.id.desc()).limit(1)
+            ).scalar()
+            leader = conn.execute(sa_select(lease).where(lease.c.name == 'ftp_uploader')).first()
+    except Exception as exc:
+        return {'error': str(exc)}
+    return {
+        'pending': pending[0],
+        'oldest': pending[1].isoformat() if pending[1] else None,
+        'max_attempts': pending[2] or 0,
+        'last_error': last_error,
+        'uploader': leader.owner if leader and leader.expires_at > datetime.utcnow() else None,
+        'uploader_is_me': bool(_lease_until and _lease_until > datetime.utcnow()),
+    }
+
+
+# ── Point-in-time history ───────────────────────────────────────────────────────
+# FTP_PATH/history/ indeholder:
+#   checkpoint.<tag>.json            fuldt snapshot (samme format som BACKUP_FILE)
+#   segment.<første>.<sidste>.jsonl  journal-poster (alle tabeller) i det tidsrum
+# Tag = tidsstempel uden skilletegn (_delta_tag), så navnene sorterer kronologisk.
+# En tilstand genskabes ved at tage nyeste checkpoint <= tidspunktet og afspille
+# segmenternes poster frem til tidspunktet.
+
+def history_dir(remote_dir: str) -> str:
+    return remote_dir.rstrip('/') + '/' + HISTORY_SUBDIR
+
+
+def _tag_ts(tag: str) -> str:
+    """Inverse of _delta_tag(): '20261016T140500123456' → '2026-10-16T14:05:00.123456'."""
+    ts = datetime.strptime(tag[:15], '%Y%m%dT%H%M%S').isoformat()
+    return f'{ts}.{tag[15:]}' if tag[15:] else ts
+
+
+def _history_index(names) -> tuple:
+    """Split a history/ listing into (sorted checkpoint tags, sorted (first, last, name) segments)."""
+    checkpoints, segments = [], []
+    for name in names:
+        parts = name.rsplit('/', 1)[-1].split('.')
+        if len(parts) == 3 and parts[0] == 'checkpoint' and parts[2] == 'json':
+            checkpoints.append(parts[1])
+        elif len(parts) == 4 and parts[0] == 'segment' and parts[3] == 'jsonl':
+            segments.append((parts[1], parts[2], '.'.join(parts)))
+    return sorted(checkpoints), sorted(segments)
+
+
+def _journal_span(raw: bytes) -> tuple:
+    """(første, sidste) ts i journal-bytes."""
+    first = ''
+    for line in raw.splitlines():
+        try:
+            first = json.loads(line).get('ts', '')
+            break
+        except ValueError:
+            continue
+    return first, _latest_journal_ts(raw)
+
+
+def _history_consume(n: int):
+    """Fjern de første n bytes (= afsendt) fra HISTORY_FILE. Der appendes kun
+    bagtil, så præfikset er uændret siden det blev læst."""
+    with file_lock(HISTORY_FILE + '.lock'):
+        with open(HISTORY_FILE, 'rb') as f:
+            f.seek(n)
+            rest = f.read()
+        with open(HISTORY_FILE + '.tmp', 'wb') as f:
+            f.write(rest)
+        os.replace(HISTORY_FILE + '.tmp', HISTORY_FILE)
+
+
+def _checkpoint_due(state: dict, base_ts: str) -> bool:
+    last = state.get('checkpoint') or ''
+    if not base_ts or base_ts <= last:
+        return False
+    if not last or (state.get('checkpoint_after') and base_ts >= state['checkpoint_after']):
+        return True
+    age = datetime.fromisoformat(base_ts) - datetime.fromisoformat(last)
+    return age >= timedelta(hours=HISTORY_CHECKPOINT_HOURS)
+
+
+def prune_history(sess, names):
+    """Slet checkpoints og segmenter ældre end HISTORY_DAYS. Nyeste checkpoint
+    fra før grænsen beholdes, så starten af vinduet stadig kan genskabes."""
+    checkpoints, segments = _history_index(names)
+    cutoff = _delta_tag((datetime.utcnow() - timedelta(days=HISTORY_DAYS)).isoformat())
+    keep_from = max((t for t in checkpoints if t <= cutoff), default=None)
+    if keep_from is None:
+        return
+    doomed = [f'checkpoint.{t}.json' for t in checkpoints if t < keep_from]
+    doomed += [name for _, last, name in segments if last < keep_from]
+    for name in doomed:
+        try:
+            sess.ftp.delete(name)
+        except ftplib.error_perm:
+            pass
+    if doomed:
+        print(f'✓ Historik ryddet: {len(doomed)} filer ældre end {HISTORY_DAYS} dage')
+
+
+def _ship_history(pool, remote_dir: str):
+    """Send nye historik-poster til FTP som ét segment. Når BACKUP_FILE er nyt nok
+    til et checkpoint, uploades det, alle lokale poster siden sidste checkpoint
+    slås sammen til ét segment (de små slettes), og gammel historik ryddes.
+    Kaldes fra FTP-workeren; fil-låsen holder flere Gunicorn-workers fra hinanden."""
+    hist_dir = history_dir(remote_dir)
+    checkpoint = None
+    try:
+        with file_lock(HISTORY_STATE_FILE + '.lock'):
+            state = load_state_file(HISTORY_STATE_FILE)
+            raw = b''
+            with file_lock(HISTORY_FILE + '.lock'):
+                if os.path.exists(HISTORY_FILE):
+                    with open(HISTORY_FILE, 'rb') as f:
+                        raw = f.read()
+            offset = min(state.get('offset', 0), len(raw))
+            with journal_lock():
+                if os.path.exists(BACKUP_FILE):
+                    with open(BACKUP_FILE, 'rb') as f:
+                        base_ts = backup_io.read_backup_header(f).get('exported_at', '')
+                        if _checkpoint_due(state, base_ts):
+                            f.seek(0)
+                            checkpoint = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_BYTES)
+                            shutil.copyfileobj(f, checkpoint)
+                            checkpoint.seek(0)
+            segment = raw if checkpoint is not None else raw[offset:]
+            if not segment and checkpoint is None:
+                return
+
+            started = time.perf_counter()
+            if segment:
+                first, last = (_delta_tag(ts) for ts in _journal_span(segment))
+                name = f'segment.{first}.{last}.jsonl'
+                pool.upload(hist_dir, name, io.BytesIO(segment))
+            if checkpoint is not None:
+                pool.upload(hist_dir, f'checkpoint.{_delta_tag(base_ts)}.json', checkpoint)
+                with pool.session() as sess:
+                    sess.cd(hist_dir)
+                    names = [n.rsplit('/', 1)[-1] for n in sess.ftp.nlst()]
+                    if segment:
+                        # Sammenlagt segment dækker de små fra samme periode
+                        for seg_first, seg_last, seg_name in _history_index(names)[1]:
+                            if seg_name != name and seg_first >= first and seg_last <= last:
+                                try:
+                                    sess.ftp.delete(seg_name)
+                                except ftplib.error_perm:
+                                    pass
+                    prune_history(sess, names)
+            if checkpoint is not None:
+                if raw:
+                    _history_consume(len(raw))
+                state.update(offset=0, checkpoint=base_ts, checkpoint_after=None)
+                backup_status['history_checkpoint'] = base_ts
+                print(f'✓ Historik-checkpoint uploadet ({base_ts})')
+            else:
+                state['offset'] = len(raw)
+            save_state_file(HISTORY_STATE_FILE, state)
+            record_stage('history_upload', started)
+        backup_status['history_ok'] = True
+        backup_status['history_time'] = datetime.utcnow().isoformat()
+    except Exception as exc:
+        backup_status['history_ok'] = False
+        print(f'⚠ Historik-upload fejlede: {exc}')
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+
+def history_range(remote_dir: str) -> dict:
+    """Ældste og nyeste tidspunkt der kan gendannes til, samt checkpoints (ISO, UTC)."""
+    def _list(sess):
+        try:
+            sess.cd(history_dir(remote_dir), create=False)
+        except ftplib.error_perm:
+            return []
+        return sess.ftp.nlst()
+    checkpoints, segments = _history_index(get_ftp_pool().run(_list))
+    if not checkpoints:
+        return {'oldest': None, 'newest': None, 'checkpoints': []}
+    newest = max([checkpoints[-1]] + [last for _, last, _ in segments])
+    return {
+        'oldest': _tag_ts(checkpoints[0]),
+        'newest': _tag_ts(newest),
+        'checkpoints': [_tag_ts(t) for t in checkpoints],
+    }
+
+
+def history_state_at(remote_dir: str, at: str) -> tuple:
+    """Genskab backup-payloaden som den så ud på UTC-tidspunktet `at`: nyeste
+    checkpoint <= at + alle historik-poster i (checkpoint, at]. Kun det ene
+    checkpoint og de segmenter der overlapper perioden hentes.
+    Returns (data, {'checkpoint': ts, 'replayed': n}). LookupError hvis
+    tidspunktet ikke kan genskabes."""
+    at_tag = _delta_tag(at)
+
+    def _fetch(sess):
+        sess.cd(history_dir(remote_dir), create=False)
+        checkpoints, segments = _history_index(sess.ftp.nlst())
+        base = max((t for t in checkpoints if t <= at_tag), default=None)
+        if base is None:
+            raise LookupError('Ingen historik så langt tilbage')
+        snapshot = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_BYTES)
+        sess.ftp.retrbinary(f'RETR checkpoint.{base}.json', snapshot.write)
+        raw = io.BytesIO()
+        for first, last, name in segments:
+            if last >= base and first <= at_tag:
+                sess.ftp.retrbinary(f'RETR {name}', raw.write)
+        return snapshot, raw.getvalue()
+
+    snapshot, raw = get_ftp_pool().run(_fetch)
+    try:
+        snapshot.seek(0)
+        data = backup_io.load_backup(snapshot)
+    finally:
+        snapshot.close()
+    base_ts = data.get('exported_at', '')
+    records = []
+    for line in raw.splitlines():
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        if base_ts <= rec.get('ts', '') <= at:
+            records.append(rec)
+    records.sort(key=lambda r: r['ts'])  # segmenter kan overlappe; afspilning er idempotent
+    restores = [r['ts'] for r in records if r.get('op') == 'restore']
+    if restores:
+        raise LookupError(f'Data blev gendannet kl. {restores[-1][:19]} UTC og der findes endnu '
+                          'intet checkpoint efter — vælg et senere tidspunkt')
+    apply_journal(data, records)
+    return data, {'checkpoint': base_ts, 'replayed': len(records)}
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Benchmark af backup-pipelinen mod den lokale FTP-stand-in (ftp_standin.py).
+
+Måler:
+  1. skrivning → lokal backup → FTP: latens pr. ændring (p50/p95) og bytes
+     sendt til FTP pr. ændring, for FTP_UPLOAD_MODE=full og delta
+  2. kold opstart: tid for restore fra FTP ved 1k/10k/100k rækker
+
+Alt kører i en midlertidig mappe (BACKUP_DIR + SQLite) — den rigtige data/
+og DATABASE_URL røres ikke. Hver måling kører app.py i sin egen proces, da
+konfigurationen læses ved import.
+
+Kør med: python bench_backup.py [--rows 1000,10000,100000] [--writes 20]
+                                [--latency 0.01] [--bandwidth 0]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from ftp_standin import FTPStandIn
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+# ── Child processes (importerer app med bench-konfigurationen) ──────────────────
+
+def _wait_outbox(poll: float):
+    """Vent til outboxen er tom og ingen upload kører."""
+    import backup_store, backup_sync
+    while backup_store.ftp_lock.locked() or backup_sync.outbox_status().get('pending'):
+        time.sleep(poll)
+
+
+def _child_writes(n_writes: int):
+    """N ændringer via test-klienten; venter efter hver på at FTP-uploaden er færdig."""
+    import app as A
+    import backup_store as S
+    client = A.app.test_client()
+    client.post('/login', data={'username': 'Admin', 'password': '123'})
+    client.post('/api/admin/teams', json={'name': 'Bench'})
+    client.post('/api/admin/teams/1/members', json={'user_id': 1, 'is_team_admin': True})
+    time.sleep(1 + S.BACKUP_DEBOUNCE_SECONDS)
+    _wait_outbox(0.01)
+
+    request_ms, local_ms, ftp_ms, sent = [], [], [], []
+    for i in range(n_writes):
+        before_local = S.backup_status['local_time']
+        before_ftp = S.backup_status['ftp_time']
+        started = time.perf_counter()
+        client.post('/api/unavailable/toggle', json={'date': f'2030-01-{i % 28 + 1:02d}'})
+        request_ms.append((time.perf_counter() - started) * 1000)
+        deadline = started + 60
+        while S.backup_status['ftp_time'] == before_ftp and time.perf_counter() < deadline:
+            if S.backup_status['local_time'] != before_local and len(local_ms) <= i:
+                local_ms.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.002)
+        ftp_ms.append((time.perf_counter() - started) * 1000)
+        if len(local_ms) <= i:  # journal mode: ændringen er lokal når requesten er færdig
+            local_ms.append(request_ms[-1])
+        sent.append(S.backup_status['ftp_last_bytes'] or 0)
+        _wait_outbox(0.002)
+    print(json.dumps({'request_ms': request_ms, 'local_ms': local_ms, 'ftp_ms': ftp_ms, 'bytes': sent,
+                      'ftp_ok': S.backup_status['ftp_ok']}))
+
+
+def _child_seed(rows: int):
+    """Fyld DB med `rows` unavailable dates og læg en fuld backup på FTP."""
+    from datetime import date, timedelta
+    import app as A
+    import backup_store as S
+    with A.app.app_context():
+        users = [u.id for u in A.User.query.all()]
+        table = A.UnavailableDate.__table__
+        batch = []
+        for i in range(rows):
+            batch.append({'user_id': users[i % len(users)], 'team_id': None,
+                          'date': date(2000, 1, 1) + timedelta(days=i // len(users))})
+            if len(batch) >= 5000:
+                A.db.session.execute(table.insert(), batch)
+                batch = []
+        if batch:
+            A.db.session.execute(table.insert(), batch)
+        A.db.session.commit()
+        S.write_backup_now()
+    _wait_outbox(0.01)
+    print(json.dumps({'ftp_ok': S.backup_status['ftp_ok'],
+                      'size': os.path.getsize(S.BACKUP_FILE)}))
+
+
+def _child_coldstart():
+    """Tid for import af app (= skema + restore fra FTP med STARTUP_RESTORE=sync),
+    uden den faste tid for at importere Flask, SQLAlchemy og dateparser."""
+    started = time.perf_counter()
+    import dateparser, flask, flask_login, flask_sqlalchemy  # noqa: F401
+    deps = time.perf_counter()
+    import app as A
+    elapsed = time.perf_counter() - deps
+    with A.app.app_context():
+        rows = A.UnavailableDate.query.count()
+    print(json.dumps({'seconds': elapsed, 'imports': deps - started, 'rows': rows}))
+
+
+# ── Orchestrator ────────────────────────────────────────────────────────────────
+
+def _run_child(args, env):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', *args],
+                         capture_output=True, text=True, env=env, cwd=HERE)
+    lines = [l for l in out.stdout.splitlines() if l.startswith('{')]
+    if out.returncode or not lines:
+        raise RuntimeError(f'child {args} fejlede:\n{out.stdout[-2000:]}\n{out.stderr[-2000:]}')
+    return json.loads(lines[-1])
+
+
+def _env(srv, workdir, name, **extra):
+    data_dir = os.path.join(workdir, name)
+    os.makedirs(data_dir, exist_ok=True)
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(data_dir, "bench.db")}',
+        'BACKUP_DIR': data_dir,
+        'FTP_HOST': f'{srv.host}:{srv.port}',
+        'FTP_USER': srv.user,
+        'FTP_PASS': srv.passwd,
+        'FTP_PATH': '/ambrotos',
+        'FTP_TLS': '0',
+        'STARTUP_RESTORE': 'sync',
+        'BACKUP_DEBOUNCE_SECONDS': '0.05',
+    })
+    env.update({k: str(v) for k, v in extra.items()})
+    return env
+
+
+def _reset_remote(srv):
+    with srv.lock:
+        srv.files.clear()
+        srv.mtimes.clear()
+        srv.dirs.clear()
+        srv.dirs.add('/')
+    srv.reset_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark af backup → FTP → restore')
+    parser.add_argument('--rows', default='1000,10000,100000', help='rækkeantal til kold-start-målingen')
+    parser.add_argument('--writes', type=int, default=20, help='antal ændringer pr. upload-mode')
+    parser.add_argument('--latency', type=float, default=0.01, help='FTP-svartid i sekunder pr. kommando')
+    parser.add_argument('--bandwidth', type=int, default=0, help='FTP bytes/s (0 = ubegrænset)')
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, *rest = args.child
+        {'writes': lambda: _child_writes(int(rest[0])),
+         'seed': lambda: _child_seed(int(rest[0])),
+         'coldstart': _child_coldstart}[kind]()
+        return
+
+    workdir = tempfile.mkdtemp(prefix='ambrotos-bench-')
+    srv = FTPStandIn(latency=args.latency, bandwidth=args.bandwidth).start()
+    print(f'FTP-stand-in {srv.host}:{srv.port}  latency={args.latency}s  '
+          f'bandwidth={args.bandwidth or "∞"} B/s  workdir={workdir}\n')
+    try:
+        print('1) Skrivning → lokal backup → FTP')
+        print(f'   {"mode":<16}{"request p50":>12}{"lokal p50":>11}{"FTP p50":>10}{"FTP p95":>10}'
+              f'{"bytes/ændring":>15}{"FTP ind i alt":>15}')
+        for label, extra in (('full/snapshot', {'FTP_UPLOAD_MODE': 'full', 'BACKUP_MODE': 'snapshot'}),
+                             ('delta/journal', {'FTP_UPLOAD_MODE': 'delta', 'BACKUP_MODE': 'journal'})):
+            _reset_remote(srv)
+            name = label.replace('/', '-')
+            res = _run_child(['writes', str(args.writes)], _env(srv, workdir, name, **extra))
+            print(f'   {label:<16}{statistics.median(res["request_ms"]):>10.1f}ms'
+                  f'{statistics.median(res["local_ms"]):>9.1f}ms'
+                  f'{statistics.median(res["ftp_ms"]):>8.1f}ms{percentile(res["ftp_ms"], 95):>8.1f}ms'
+                  f'{statistics.median(res["bytes"]):>15,.0f}{srv.stats["bytes_in"]:>15,}')
+        print()
+
+        print('2) Kold opstart: restore fra FTP')
+        print(f'   {"rækker":>8}{"backup-fil":>14}{"opstart":>10}{"gendannet":>11}{"(+ imports)":>13}')
+        for rows in [int(r) for r in args.rows.split(',') if r]:
+            _reset_remote(srv)
+            seeded = _run_child(['seed', str(rows)], _env(srv, workdir, f'seed-{rows}'))
+            res = _run_child(['coldstart'], _env(srv, workdir, f'cold-{rows}'))
+            print(f'   {rows:>8,}{seeded["size"]:>12,} B{res["seconds"]:>9.2f}s{res["rows"]:>11,}'
+                  f'{res["imports"]:>12.2f}s')
+    finally:
+        srv.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
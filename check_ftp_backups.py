@@ -1,89 +1,214 @@
 #!/usr/bin/env python3
 """
-Diagnostik: Hent alle backup-filer fra FTP og vis indhold.
-Kør med: python check_ftp_backups.py
+Diagnostik: Hent alle backup-filer fra FTP parallelt og sammenlign dem.
+
+Henter calendar_backup.json + _1/_2/_3 samt de nyeste filer i predeploy/ og
+manualbackup/ over en begrænset pulje af FTPS-forbindelser, beregner et
+digest pr. række pr. tabel og viser en diff-matrix (tilføjede/fjernede rækker
+pr. tabel mellem alle par), så et gendannelsespunkt kan vælges på sekunder.
+
+Kør med: python check_ftp_backups.py [--workers 4] [--limit 10]
 """
-import ftplib
+import argparse
+import hashlib
 import io
 import json
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backup_io import BACKUP_SECTIONS, CATALOG_FILE, FTPPool, iter_backup
 
 FTP_HOST = os.environ.get('FTP_HOST', 'ftp.jrgrafisk.dk')
 FTP_USER = os.environ.get('FTP_USER', '')
 FTP_PASS = os.environ.get('FTP_PASS', '')
 FTP_PATH = os.environ.get('FTP_PATH', '/customers/5/2/d/jrgrafisk.dk/httpd.www/ambrotos')
+MANUAL_PATH = os.environ.get('FTP_MANUAL_PATH', '/ambrotos/manualbackup')
 
-if not FTP_USER or not FTP_PASS:
-    print("Angiv FTP-credentials:")
-    FTP_USER = input("  FTP_USER: ").strip()
-    FTP_PASS = input("  FTP_PASS: ").strip()
-
-FILES = [
+ROTATED = [
     'calendar_backup.json',
     'calendar_backup_1.json',
     'calendar_backup_2.json',
     'calendar_backup_3.json',
 ]
+SHORT = {
+    'teams': 'teams',
+    'users': 'users',
+    'user_teams': 'medl.',
+    'unavailable_dates': 'unavail',
+    'group_events': 'events',
+    'event_comments': 'komm.',
+}
+
+
+def _row_digest(row: dict) -> bytes:
+    canonical = json.dumps(row, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).digest()
+
+
+def _list_candidates(pool, limit: int) -> list:
+    """(remote_dir, filename) for the rotated files plus the newest `limit`
+    files in predeploy/ and manualbackup/."""
+    def _list(sess):
+        found = [(FTP_PATH, name) for name in ROTATED]
+        for remote_dir in (FTP_PATH.rstrip('/') + '/predeploy', MANUAL_PATH):
+            try:
+                sess.cd(remote_dir, create=False)
+                names = [n.rsplit('/', 1)[-1] for n in sess.ftp.nlst()]
+            except Exception:
+                continue  # mappen findes ikke (endnu)
+            names = sorted((n for n in names if n.endswith('.json') and n != CATALOG_FILE), reverse=True)[:limit]
+            found += [(remote_dir, n) for n in names]
+        return found
+    return pool.run(_list)
 
-print(f"\n→ Forbinder til {FTP_HOST}:{FTP_PATH} ...\n")
-try:
-    ftp = ftplib.FTP_TLS(FTP_HOST, timeout=30)
-    ftp.login(FTP_USER, FTP_PASS)
-    ftp.prot_p()
-    ftp.cwd(FTP_PATH)
-except Exception as e:
-    print(f"FTP-fejl: {e}")
-    sys.exit(1)
-
-backups = {}
-for fname in FILES:
-    buf = io.BytesIO()
+
+def _audit(pool, remote_dir: str, name: str) -> dict:
+    """Download one backup and digest it table by table while it streams in."""
+    def _fetch(sess):
+        sess.cd(remote_dir, create=False)
+        buf = io.BytesIO()
+        sess.ftp.retrbinary(f'RETR {name}', buf.write)
+        return buf.getvalue()
+
+    started = time.perf_counter()
+    result = {'dir': remote_dir, 'name': name, 'raw': None, 'error': None}
     try:
-        ftp.retrbinary(f'RETR {fname}', buf.write)
-        buf.seek(0)
-        data = json.loads(buf.read().decode('utf-8'))
-        backups[fname] = data
-        ud = data.get('unavailable_dates', [])
-        ge = data.get('group_events', [])
-        users = data.get('users', [])
-        ts = data.get('exported_at', '?')
-        print(f"✓ {fname}")
-        print(f"    exported_at:     {ts}")
-        print(f"    brugere:         {len(users)}")
-        print(f"    unavailable:     {len(ud)}")
-        print(f"    group events:    {len(ge)}")
+        raw = pool.run(_fetch)
+    except Exception as exc:
+        result['error'] = f'ikke hentet ({exc})'
+        return result
+    fetched = time.perf_counter()
+    digests = {section: set() for section in BACKUP_SECTIONS}
+    try:
+        header, rows = iter_backup(io.BytesIO(raw))
+        for section, row in rows:
+            if section in digests:
+                digests[section].add(_row_digest(row))
+    except Exception as exc:
+        result['error'] = f'beskadiget ({exc})'
+        return result
+    result.update(
+        raw=raw,
+        version=header.get('version', 1),
+        exported_at=header.get('exported_at', ''),
+        digests=digests,
+        size=len(raw),
+        fetch_ms=round((fetched - started) * 1000),
+        parse_ms=round((time.perf_counter() - fetched) * 1000),
+    )
+    return result
+
+
+def _label(result: dict) -> str:
+    rel = result['dir'].rstrip('/').rsplit('/', 1)[-1]
+    return result['name'] if result['dir'] == FTP_PATH else f'{rel}/{result["name"]}'
+
+
+def _print_summary(good: list, failed: list):
+    cols = ''.join(f'{SHORT[s]:>9}' for s in BACKUP_SECTIONS)
+    print(f'{"#":>3}  {"fil":<38}{"v":>2}  {"exported_at":<20}{cols}   hent/parse')
+    for i, r in enumerate(good, 1):
+        counts = ''.join(f'{len(r["digests"][s]):>9}' for s in BACKUP_SECTIONS)
+        print(f'{i:>3}  {_label(r):<38}{r["version"]:>2}  {r["exported_at"][:19]:<20}{counts}'
+              f'   {r["fetch_ms"]}/{r["parse_ms"]} ms')
+    for r in failed:
+        print(f'  ⚠ {_label(r)}: {r["error"]}')
+    print()
+
+
+def _print_matrix(good: list):
+    """Pr. tabel: celle (række i, kolonne j) = +tilføjet/-fjernet fra fil i til fil j."""
+    n = len(good)
+    for section in BACKUP_SECTIONS:
+        sets = [r['digests'][section] for r in good]
+        if all(s == sets[0] for s in sets):
+            print(f'{section}: identisk i alle {n} filer ({len(sets[0])} rækker)')
+            continue
+        print(f'{section}  (fra række → til kolonne)')
+        print('     ' + ''.join(f'{j:>12}' for j in range(1, n + 1)))
+        for i in range(n):
+            cells = []
+            for j in range(n):
+                if i == j:
+                    cells.append(f'{"·":>12}')
+                else:
+                    added, removed = len(sets[j] - sets[i]), len(sets[i] - sets[j])
+                    cells.append(f'{("=" if not (added or removed) else f"+{added}/-{removed}"):>12}')
+            print(f'{i + 1:>3}  ' + ''.join(cells))
         print()
-    except ftplib.error_perm:
-        print(f"  (filen {fname} findes ikke på FTP)\n")
+
+
+def main():
+    global FTP_USER, FTP_PASS
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='samtidige FTPS-forbindelser (default 4)')
+    parser.add_argument('--limit', type=int, default=10,
+                        help='antal nyeste filer fra predeploy/ og manualbackup/ (default 10)')
+    args = parser.parse_args()
+
+    if not FTP_USER or not FTP_PASS:
+        print("Angiv FTP-credentials:")
+        FTP_USER = input("  FTP_USER: ").strip()
+        FTP_PASS = input("  FTP_PASS: ").strip()
+
+    print(f"\n→ Forbinder til {FTP_HOST}:{FTP_PATH} ({args.workers} forbindelser) ...\n")
+    pool = FTPPool(FTP_HOST, FTP_USER, FTP_PASS, size=args.workers)
+    started = time.perf_counter()
+    try:
+        candidates = _list_candidates(pool, args.limit)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(_audit, pool, d, n) for d, n in candidates]
+            results = [f.result() for f in as_completed(futures)]
     except Exception as e:
-        print(f"  Fejl ved {fname}: {e}\n")
-
-ftp.quit()
-
-if not backups:
-    print("Ingen backup-filer fundet på FTP.")
-    sys.exit(1)
-
-# Find nyeste backup (mest unavailable dates eller nyeste timestamp)
-best = max(backups.items(), key=lambda x: (
-    len(x[1].get('unavailable_dates', [])),
-    x[1].get('exported_at', '')
-))
-best_name, best_data = best
-print(f"─────────────────────────────────────────")
-print(f"Anbefalet backup: {best_name}")
-print(f"  ({len(best_data.get('unavailable_dates',[]))} unavailable dates, {best_data.get('exported_at','?')})")
-print()
-
-# Gem den anbefalede backup lokalt
-save = input("Gem denne backup lokalt som data/calendar_backup.json? [j/n]: ").strip().lower()
-if save == 'j':
+        print(f"FTP-fejl: {e}")
+        sys.exit(1)
+    finally:
+        pool.close()
+
+    good = sorted((r for r in results if not r['error']), key=lambda r: r['exported_at'], reverse=True)
+    failed = [r for r in results if r['error'] and 'ikke hentet' not in r['error']]
+    missing = len(results) - len(good) - len(failed)
+    print(f"Hentet og analyseret {len(good)} filer på {time.perf_counter() - started:.1f} s"
+          + (f" ({missing} fandtes ikke)" if missing else '') + "\n")
+    if not good:
+        print("Ingen backup-filer fundet på FTP.")
+        sys.exit(1)
+
+    _print_summary(good, failed)
+    _print_matrix(good)
+
+    # Anbefalet backup: mest unavailable dates, derefter nyeste timestamp
+    best = max(range(len(good)), key=lambda i: (
+        len(good[i]['digests']['unavailable_dates']),
+        good[i]['exported_at'],
+    ))
+    print("─────────────────────────────────────────")
+    print(f"Anbefalet backup: #{best + 1} {_label(good[best])}")
+    print(f"  ({len(good[best]['digests']['unavailable_dates'])} unavailable dates, "
+          f"{good[best]['exported_at'] or '?'})")
+    print()
+
+    # Gem den anbefalede (eller en valgt) backup lokalt
+    answer = input("Gem som data/calendar_backup.json? [j = anbefalet / nummer / n]: ").strip().lower()
+    if answer == 'j':
+        chosen = good[best]
+    elif answer.isdigit() and 1 <= int(answer) <= len(good):
+        chosen = good[int(answer) - 1]
+    else:
+        return
     os.makedirs('data', exist_ok=True)
-    with open('data/calendar_backup.json', 'w', encoding='utf-8') as f:
-        json.dump(best_data, f, ensure_ascii=False, indent=2)
-    print("✓ Gemt. Start appen igen for at gendanne data.")
+    with open('data/calendar_backup.json', 'wb') as f:
+        f.write(chosen['raw'])
+    print(f"✓ Gemt ({_label(chosen)}). Start appen igen for at gendanne data.")
     print()
     print("Unavailable dates i den valgte backup:")
-    for ud in sorted(best_data.get('unavailable_dates', []), key=lambda x: x['date']):
+    _, rows = iter_backup(io.BytesIO(chosen['raw']))
+    dates = [row for section, row in rows if section == 'unavailable_dates']
+    for ud in sorted(dates, key=lambda x: x['date']):
         print(f"  user_id={ud['user_id']}  {ud['date']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Danske datohjælpere: helligdage, månedsnavne og fortolkning af datoer i
+chat-beskeder. Bruges af app.py og af backup-eksporten (helligdagssektionen)."""
+
+import re
+import calendar as cal_module
+from datetime import datetime, date, timedelta
+
+from dateparser.search import search_dates
+
+# ── Danish date helpers ─────────────────────────────────────────────────────────
+
+DANISH_MONTHS = {
+    'januar': 1, 'jan': 1,
+    'februar': 2, 'feb': 2,
+    'marts': 3, 'mar': 3,
+    'april': 4, 'apr': 4,
+    'maj': 5,
+    'juni': 6, 'jun': 6,
+    'juli': 7, 'jul': 7,
+    'august': 8, 'aug': 8,
+    'september': 9, 'sep': 9,
+    'oktober': 10, 'okt': 10,
+    'november': 11, 'nov': 11,
+    'december': 12, 'dec': 12,
+}
+
+DANISH_MONTH_NAMES = {
+    1: 'januar', 2: 'februar', 3: 'marts', 4: 'april',
+    5: 'maj', 6: 'juni', 7: 'juli', 8: 'august',
+    9: 'september', 10: 'oktober', 11: 'november', 12: 'december',
+}
+
+DANISH_WEEKDAYS = {
+    'mandag': 0, 'tirsdag': 1, 'onsdag': 2, 'torsdag': 3,
+    'fredag': 4, 'lørdag': 5, 'lordag': 5, 'søndag': 6, 'sondag': 6,
+}
+
+
+def calculate_easter(year: int) -> date:
+    """Calculate Easter Sunday using the Meeus/Jones/Butcher algorithm."""
+    a = year % 19
+    b = year // 100
+    c = year % 100
+    d = b // 4
+    e = b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i = c // 4
+    k = c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = ((h + l - 7 * m + 114) % 31) + 1
+    return date(year, month, day)
+
+
+HOLIDAY_DESCRIPTIONS = {
+    'Nytårsdag':            'Det nye år begynder',
+    'Skærtorsdag':          'Jesu sidste nadver med disciplene',
+    'Langfredag':           'Mindes Jesu korsfæstelse og død',
+    'Påskedag':             'Fejrer Jesu opstandelse fra de døde',
+    '2. påskedag':          'Anden dag af påskefejringen',
+    'Kristi Himmelfartsdag':'Jesus steg op til Himmelen, 39 dage efter påske',
+    'Pinsedag':             'Helligåndens komme over apostlene, 50 dage efter påske',
+    '2. pinsedag':          'Anden dag af pinsefejringen',
+    'Grundlovsdag':         'Grundloven underskrevet 5. juni 1849',
+    'Juleaften':            'Traditionel julefejring og familiemiddag',
+    '1. juledag':           'Fejrer Jesu fødsel',
+    '2. juledag':           'Anden dag af julefejringen',
+}
+
+
+def get_danish_holidays(year: int) -> list:
+    """Return list of (date, name, description) tuples for Danish public holidays."""
+    easter = calculate_easter(year)
+    holidays = [
+        (date(year, 1, 1),               'Nytårsdag'),
+        (easter - timedelta(days=3),      'Skærtorsdag'),
+        (easter - timedelta(days=2),      'Langfredag'),
+        (easter,                          'Påskedag'),
+        (easter + timedelta(days=1),      '2. påskedag'),
+        (easter + timedelta(days=39),     'Kristi Himmelfartsdag'),
+        (easter + timedelta(days=49),     'Pinsedag'),
+        (easter + timedelta(days=50),     '2. pinsedag'),
+        (date(year, 6, 5),               'Grundlovsdag'),
+        (date(year, 12, 24),             'Juleaften'),
+        (date(year, 12, 25),             '1. juledag'),
+        (date(year, 12, 26),             '2. juledag'),
+    ]
+    return [(d, name, HOLIDAY_DESCRIPTIONS.get(name, '')) for d, name in sorted(holidays, key=lambda x: x[0])]
+
+
+def parse_dates_from_message(message: str) -> list:
+    """Extract date objects from a Danish natural-language message."""
+    today = date.today()
+    msg = message.lower().strip()
+
+    # Pattern 1: "alle <ugedag>e i <måned> [år]"
+    m = re.search(r'alle\s+(\w+)\s+i\s+(\w+)(?:\s+(\d{4}))?', msg)
+    if m:
+        wday_raw = m.group(1)
+        wday = DANISH_WEEKDAYS.get(wday_raw) or DANISH_WEEKDAYS.get(wday_raw.rstrip('e'))
+        month = DANISH_MONTHS.get(m.group(2))
+        year = int(m.group(3)) if m.group(3) else today.year
+        if wday is not None and month:
+            _, n = cal_module.monthrange(year, month)
+            return [date(year, month, d) for d in range(1, n + 1)
+                    if date(year, month, d).weekday() == wday]
+
+    # Pattern 2: "fra <d>. [m] til <d>. <m> [år]"
+    m = re.search(r'fra\s+(\d+)\.?\s*(\w+)?\s+til\s+(\d+)\.?\s*(\w+)(?:\s+(\d{4}))?', msg)
+    if m:
+        start_d = int(m.group(1))
+        start_mn = m.group(2)
+        end_d = int(m.group(3))
+        end_mn = m.group(4)
+        year = int(m.group(5)) if m.group(5) else today.year
+        end_month = DANISH_MONTHS.get(end_mn)
+        start_month = DANISH_MONTHS.get(start_mn) if start_mn else end_month
+        if start_month and end_month:
+            start = date(year, start_month, start_d)
+            end = date(year, end_month, end_d)
+            cur, result = start, []
+            while cur <= end:
+                result.append(cur)
+                cur += timedelta(days=1)
+            return result
+
+    # Pattern 3: list of days sharing one month — e.g. "5., 12. og 19. januar"
+    months_in_msg = set()
+    for name, num in DANISH_MONTHS.items():
+        if re.search(r'\b' + re.escape(name) + r'\b', msg):
+            months_in_msg.add(num)
+
+    if len(months_in_msg) == 1:
+        month = next(iter(months_in_msg))
+        year_m = re.search(r'\b(\d{4})\b', msg)
+        year = int(year_m.group(1)) if year_m else today.year
+        day_nums = [int(d) for d in re.findall(r'\b(\d{1,2})\.', msg) if int(d) <= 31]
+        result = []
+        for day in day_nums:
+            try:
+                d = date(year, month, day)
+                if d < today and not year_m:
+                    d = date(year + 1, month, day)
+                if d not in result:
+                    result.append(d)
+            except ValueError:
+                pass
+        if result:
+            return sorted(result)
+
+    # Fallback: dateparser.search.search_dates
+    settings = {
+        'LANGUAGES': ['da'],
+        'PREFER_DATES_FROM': 'future',
+        'RELATIVE_BASE': datetime.combine(today, datetime.min.time()),
+    }
+    found = search_dates(message, languages=['da'], settings=settings)
+    if found:
+        seen, result = set(), []
+        for _, dt in found:
+            d = dt.date()
+            if d not in seen:
+                seen.add(d)
+                result.append(d)
+        return result
+
+    return []
+
+
+def format_dates_danish(date_strings: list) -> str:
+    """Format a list of ISO date strings into a readable Danish string."""
+    if not date_strings:
+        return ""
+    dates_obj = [date.fromisoformat(s) for s in date_strings]
+    formatted = [f"{d.day}. {DANISH_MONTH_NAMES[d.month]}" for d in dates_obj]
+    if len(formatted) == 1:
+        return formatted[0]
+    return ", ".join(formatted[:-1]) + " og " + formatted[-1]
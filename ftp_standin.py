@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Lokal FTP-stand-in til udvikling og benchmarks af backup-pipelinen.
+
+En lille FTP-server (kun standardbiblioteket, filer i RAM) der taler det
+udsnit af protokollen som app.py, pre_deploy.py og check_ftp_backups.py
+bruger: login, CWD/MKD, PASV/EPSV, STOR/APPE/RETR med REST, NLST/LIST,
+SIZE/MDTM, RNFR/RNTO, DELE og NOOP. Ingen TLS — kør klienterne med FTP_TLS=0.
+
+Forsinkelse, båndbredde og fejl kan injiceres:
+  latency    sekunder før hvert svar på kontrolforbindelsen
+  bandwidth  bytes/s pr. dataforbindelse (0 = ubegrænset)
+  fail_rate  sandsynlighed for at en kommando svarer 421 og lukker forbindelsen
+  fail_next(cmd, n, reply)     de næste n kald af cmd fejler med reply
+  drop_transfer_after          afbryd dataoverførsler efter så mange bytes
+
+I kode (fx bench_backup.py):
+    with FTPStandIn(latency=0.02) as srv:
+        os.environ['FTP_HOST'] = f'127.0.0.1:{srv.port}'
+
+Fra kommandolinjen:
+    python ftp_standin.py --port 2121 --latency 0.05 --bandwidth 500000
+    FTP_HOST=127.0.0.1:2121 FTP_USER=u FTP_PASS=p FTP_TLS=0 python app.py
+"""
+import argparse
+import posixpath
+import random
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+
+_CHUNK = 8192
+
+
+class _Transfer:
+    """Passiv dataforbindelse: lytter på en ledig port indtil klienten forbinder."""
+
+    def __init__(self, host):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind((host, 0))
+        self.listener.listen(1)
+        self.listener.settimeout(10)
+        self.port = self.listener.getsockname()[1]
+
+    def accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        finally:
+            self.listener.close()
+        return conn
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Én kontrolforbindelse."""
+
+    def setup(self):
+        super().setup()
+        self.srv = self.server.standin
+        self.cwd = '/'
+        self.user = None
+        self.logged_in = False
+        self.transfer = None
+        self.rest = 0
+        self.rename_from = None
+
+    def reply(self, line):
+        if self.srv.latency:
+            time.sleep(self.srv.latency)
+        self.wfile.write((line + '\r\n').encode('utf-8'))
+
+    def handle(self):
+        self.reply('220 ambrotos FTP stand-in')
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            cmd, _, arg = line.partition(' ')
+            cmd = cmd.upper()
+            with self.srv.lock:
+                self.srv.stats['commands'] += 1
+            injected = self.srv._injected_failure(cmd)
+            if injected:
+                self.reply(injected)
+                if injected.startswith('421'):
+                    return
+                continue
+            method = getattr(self, f'ftp_{cmd}', None)
+            if method is None:
+                self.reply(f'502 {cmd} not implemented')
+                continue
+            if not self.logged_in and cmd not in ('USER', 'PASS', 'QUIT', 'FEAT', 'SYST', 'OPTS'):
+                self.reply('530 Not logged in')
+                continue
+            try:
+                if method(arg) is False:
+                    return
+            except (ConnectionError, socket.timeout) as exc:
+                self.reply(f'426 Transfer aborted: {exc}')
+
+    # ── Paths ──────────────────────────────────────────────────────────────────
+
+    def path(self, arg):
+        return posixpath.normpath(posixpath.join(self.cwd, arg or '.')).replace('//', '/')
+
+    # ── Session ────────────────────────────────────────────────────────────────
+
+    def ftp_USER(self, arg):
+        self.user = arg
+        self.reply('331 Password required')
+
+    def ftp_PASS(self, arg):
+        if self.srv.user and (self.user, arg) != (self.srv.user, self.srv.passwd):
+            self.reply('530 Login incorrect')
+            return
+        self.logged_in = True
+        self.reply('230 Logged in')
+
+    def ftp_QUIT(self, arg):
+        self.reply('221 Bye')
+        return False
+
+    def ftp_SYST(self, arg):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_FEAT(self, arg):
+        self.wfile.write(b'211-Features:\r\n SIZE\r\n MDTM\r\n REST STREAM\r\n EPSV\r\n UTF8\r\n')
+        self.reply('211 End')
+
+    def ftp_OPTS(self, arg):
+        self.reply('200 OK')
+
+    def ftp_TYPE(self, arg):
+        self.reply('200 Type set')
+
+    def ftp_NOOP(self, arg):
+        self.reply('200 NOOP ok')
+
+    # ── Directories ────────────────────────────────────────────────────────────
+
+    def ftp_PWD(self, arg):
+        self.reply(f'257 "{self.cwd}"')
+
+    def ftp_CWD(self, arg):
+        path = self.path(arg)
+        if path not in self.srv.dirs:
+            self.reply(f'550 {arg}: No such file or directory.')
+            return
+        self.cwd = path
+        self.reply('250 OK')
+
+    def ftp_CDUP(self, arg):
+        return self.ftp_CWD('..')
+
+    def ftp_MKD(self, arg):
+        path = self.path(arg)
+        with self.srv.lock:
+            if path in self.srv.dirs or path in self.srv.files:
+                self.reply(f'550 {arg}: File exists.')
+                return
+            if posixpath.dirname(path) not in self.srv.dirs:
+                self.reply(f'550 {arg}: No such file or directory.')
+                return
+            self.srv.dirs.add(path)
+        self.reply(f'257 "{path}" created')
+
+    # ── Files ──────────────────────────────────────────────────────────────────
+
+    def ftp_SIZE(self, arg):
+        data = self.srv.files.get(self.path(arg))
+        if data is None:
+            self.reply(f'550 {arg}: No such file.')
+        else:
+            self.reply(f'213 {len(data)}')
+
+    def ftp_MDTM(self, arg):
+        path = self.path(arg)
+        if path not in self.srv.files:
+            self.reply(f'550 {arg}: No such file.')
+        else:
+            self.reply('213 ' + datetime.utcfromtimestamp(self.srv.mtimes[path]).strftime('%Y%m%d%H%M%S'))
+
+    def ftp_DELE(self, arg):
+        path = self.path(arg)
+        with self.srv.lock:
+            if self.srv.files.pop(path, None) is None:
+                self.reply(f'550 {arg}: No such file.')
+                return
+            self.srv.mtimes.pop(path, None)
+        self.reply('250 Deleted')
+
+    def ftp_RNFR(self, arg):
+        path = self.path(arg)
+        if path not in self.srv.files:
+            self.reply(f'550 {arg}: No such file.')
+            return
+        self.rename_from = path
+        self.reply('350 Ready for RNTO')
+
+    def ftp_RNTO(self, arg):
+        if not self.rename_from:
+            self.reply('503 RNFR required first')
+            return
+        src, dst = self.rename_from, self.path(arg)
+        self.rename_from = None
+        with self.srv.lock:
+            if src not in self.srv.files:
+                self.reply('550 Source vanished')
+                return
+            self.srv.files[dst] = self.srv.files.pop(src)
+            self.srv.mtimes[dst] = self.srv.mtimes.pop(src, time.time())
+        self.reply('250 Renamed')
+
+    def ftp_REST(self, arg):
+        try:
+            self.rest = int(arg)
+        except ValueError:
+            self.reply('501 Bad offset')
+            return
+        self.reply(f'350 Restarting at {self.rest}')
+
+    # ── Data connections ───────────────────────────────────────────────────────
+
+    def ftp_PASV(self, arg):
+        host = self.request.getsockname()[0]
+        self.transfer = _Transfer(host)
+        p = self.transfer.port
+        self.reply(f'227 Entering Passive Mode ({host.replace(".", ",")},{p >> 8},{p & 0xff})')
+
+    def ftp_EPSV(self, arg):
+        self.transfer = _Transfer(self.request.getsockname()[0])
+        self.reply(f'229 Entering Extended Passive Mode (|||{self.transfer.port}|)')
+
+    def _open_data(self):
+        if self.transfer is None:
+            self.reply('425 Use PASV or EPSV first')
+            return None
+        transfer, self.transfer = self.transfer, None
+        self.reply('150 Opening data connection')
+        return transfer.accept()
+
+    def _send(self, conn, data: bytes):
+        limit = self.srv.drop_transfer_after
+        sent = 0
+        try:
+            for i in range(0, len(data), _CHUNK):
+                piece = data[i:i + _CHUNK]
+                if limit is not None and sent + len(piece) > limit:
+                    conn.sendall(piece[:max(limit - sent, 0)])
+                    raise ConnectionError('injected drop')
+                conn.sendall(piece)
+                sent += len(piece)
+                self.srv._throttle(len(piece))
+        finally:
+            with self.srv.lock:
+                self.srv.stats['bytes_out'] += sent
+            conn.close()
+        self.reply('226 Transfer complete')
+
+    def _receive(self, conn):
+        """Læs en upload. Returnerer (data, afbrudt) — en afbrudt upload
+        efterlader det modtagne, som en rigtig server."""
+        limit = self.srv.drop_transfer_after
+        buf = bytearray()
+        aborted = False
+        try:
+            while True:
+                piece = conn.recv(_CHUNK)
+                if not piece:
+                    break
+                buf += piece
+                self.srv._throttle(len(piece))
+                if limit is not None and len(buf) >= limit:
+                    del buf[limit:]
+                    aborted = True
+                    break
+        except (ConnectionError, socket.timeout):
+            aborted = True
+        finally:
+            with self.srv.lock:
+                self.srv.stats['bytes_in'] += len(buf)
+            conn.close()
+        return bytes(buf), aborted
+
+    def _store(self, arg, append):
+        path = self.path(arg)
+        if posixpath.dirname(path) not in self.srv.dirs:
+            self.transfer = None
+            self.reply(f'553 {arg}: No such directory.')
+            return
+        offset, self.rest = self.rest, 0
+        conn = self._open_data()
+        if conn is None:
+            return
+        data, aborted = self._receive(conn)
+        with self.srv.lock:
+            old = self.srv.files.get(path, b'')
+            if append:
+                new = old + data
+            elif offset:
+                new = old[:offset] + data
+            else:
+                new = data
+            self.srv.files[path] = new
+            self.srv.mtimes[path] = time.time()
+        self.reply('426 Transfer aborted' if aborted else '226 Transfer complete')
+
+    def ftp_STOR(self, arg):
+        self._store(arg, append=False)
+
+    def ftp_APPE(self, arg):
+        self._store(arg, append=True)
+
+    def ftp_RETR(self, arg):
+        data = self.srv.files.get(self.path(arg))
+        offset, self.rest = self.rest, 0
+        if data is None:
+            self.transfer = None
+            self.reply(f'550 {arg}: No such file or directory.')
+            return
+        conn = self._open_data()
+        if conn is not None:
+            self._send(conn, data[offset:])
+
+    def _listing(self, arg):
+        path = self.path(arg if arg and not arg.startswith('-') else '')
+        if path not in self.srv.dirs:
+            return None
+        prefix = path.rstrip('/') + '/'
+        names = {p[len(prefix):].split('/')[0] for p in list(self.srv.files) + list(self.srv.dirs)
+                 if p.startswith(prefix) and p != path}
+        return sorted(names), path
+
+    def ftp_NLST(self, arg):
+        listing = self._listing(arg)
+        if listing is None:
+            self.transfer = None
+            self.reply(f'550 {arg}: No such directory.')
+            return
+        conn = self._open_data()
+        if conn is not None:
+            self._send(conn, ''.join(f'{n}\r\n' for n in listing[0]).encode('utf-8'))
+
+    def ftp_LIST(self, arg):
+        listing = self._listing(arg)
+        if listing is None:
+            self.transfer = None
+            self.reply(f'550 {arg}: No such directory.')
+            return
+        names, path = listing
+        lines = []
+        for n in names:
+            full = posixpath.join(path, n)
+            if full in self.srv.dirs:
+                lines.append(f'drwxr-xr-x 1 ftp ftp 0 Jan 01 00:00 {n}\r\n')
+            else:
+                lines.append(f'-rw-r--r-- 1 ftp ftp {len(self.srv.files[full])} Jan 01 00:00 {n}\r\n')
+        conn = self._open_data()
+        if conn is not None:
+            self._send(conn, ''.join(lines).encode('utf-8'))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FTPStandIn:
+    """In-process FTP server med filer i RAM og injicerbare fejl."""
+
+    def __init__(self, host='127.0.0.1', port=0, user='u', passwd='p',
+                 latency=0.0, bandwidth=0, fail_rate=0.0, drop_transfer_after=None):
+        self.user, self.passwd = user, passwd
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_rate = fail_rate
+        self.drop_transfer_after = drop_transfer_after
+        self.files = {}      # absolut sti → bytes
+        self.mtimes = {}
+        self.dirs = {'/'}
+        self.stats = {'commands': 0, 'bytes_in': 0, 'bytes_out': 0, 'failures': 0}
+        self.lock = threading.Lock()
+        self._fail_next = {}
+        self._server = _Server((host, port), _Handler)
+        self._server.standin = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, cmd: str, n: int = 1, reply: str = '421 Injected failure'):
+        """Lad de næste n kald af kommandoen `cmd` fejle med `reply`."""
+        with self.lock:
+            self._fail_next[cmd.upper()] = (n, reply)
+
+    def reset_stats(self):
+        with self.lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _injected_failure(self, cmd):
+        with self.lock:
+            n, reply = self._fail_next.get(cmd, (0, None))
+            if n:
+                self._fail_next[cmd] = (n - 1, reply)
+            elif self.fail_rate and cmd not in ('USER', 'PASS', 'QUIT') and random.random() < self.fail_rate:
+                reply = '421 Injected random failure'
+            else:
+                return None
+            self.stats['failures'] += 1
+            return reply
+
+    def _throttle(self, nbytes):
+        if self.bandwidth:
+            time.sleep(nbytes / self.bandwidth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lokal FTP-stand-in (ingen TLS, filer i RAM)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2121)
+    parser.add_argument('--user', default='u')
+    parser.add_argument('--password', default='p')
+    parser.add_argument('--latency', type=float, default=0.0, help='sekunder pr. kommando-svar')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes/s pr. dataforbindelse (0 = ubegrænset)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='andel kommandoer der svarer 421')
+    args = parser.parse_args()
+
+    srv = FTPStandIn(args.host, args.port, args.user, args.password,
+                     latency=args.latency, bandwidth=args.bandwidth, fail_rate=args.fail_rate)
+    print(f'✓ FTP-stand-in lytter på {srv.host}:{srv.port} (bruger {args.user}/{args.password}, ingen TLS)')
+    print(f'  FTP_HOST={srv.host}:{srv.port} FTP_USER={args.user} FTP_PASS={args.password} FTP_TLS=0')
+    try:
+        srv._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Databasemodeller. `db` bindes til Flask-appen i app.py (db.init_app), så
+andre moduler kan importere modellerne uden at importere app.py."""
+
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from werkzeug.security import generate_password_hash, check_password_hash
+
+db = SQLAlchemy()
+
+# ── Models ─────────────────────────────────────────────────────────────────────
+
+class Team(db.Model):
+    __tablename__ = 'teams'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    description = db.Column(db.Text, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class UserTeam(db.Model):
+    __tablename__ = 'user_teams'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id', ondelete='CASCADE'), primary_key=True)
+    is_team_admin = db.Column(db.Boolean, nullable=False, default=False)
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class User(UserMixin, db.Model):
+    __tablename__ = 'users'
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)
+    color = db.Column(db.String(7), nullable=False, default='#1e88e5')
+    is_admin = db.Column(db.Boolean, nullable=False, default=False)
+    ics_token = db.Column(db.String(64), unique=True, nullable=True)
+    unavailable_dates = db.relationship(
+        'UnavailableDate', backref='user', lazy=True, cascade='all, delete-orphan'
+    )
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+    def is_team_admin_for(self, team_id: int) -> bool:
+        """Returnerer True hvis brugeren er team-admin ELLER global super-admin."""
+        if self.is_admin:
+            return True
+        ut = UserTeam.query.filter_by(user_id=self.id, team_id=team_id).first()
+        return ut.is_team_admin if ut else False
+
+
+class UnavailableDate(db.Model):
+    __tablename__ = 'unavailable_dates'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=True)
+    date = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='unique_user_date'),
+    )
+
+
+class GroupEvent(db.Model):
+    __tablename__ = 'group_events'
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, default='')
+    date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    organizer1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    organizer2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    creator = db.relationship('User', foreign_keys=[created_by], backref='created_events')
+    organizer1 = db.relationship('User', foreign_keys=[organizer1_id])
+    organizer2 = db.relationship('User', foreign_keys=[organizer2_id])
+    comments = db.relationship(
+        'EventComment', backref='event', lazy=True,
+        cascade='all, delete-orphan', order_by='EventComment.created_at',
+    )
+
+
+class EventComment(db.Model):
+    __tablename__ = 'event_comments'
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('group_events.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    is_hidden = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    author = db.relationship('User')
+
+
+class PasswordResetToken(db.Model):
+    __tablename__ = 'password_reset_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    used = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user = db.relationship('User')
+
+
+class DataVersion(db.Model):
+    """Ændringstæller pr. scope (tabelnavn). Tælles op i samme transaktion som
+    ændringen, så backup-fingerprints kan beregnes uden at læse rækkerne."""
+    __tablename__ = 'data_versions'
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class JobRun(db.Model):
+    """Én kørsel af et planlagt job (se _SCHEDULED_JOBS) — vises i /api/backup-status."""
+    __tablename__ = 'job_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(64), nullable=False, index=True)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Integer, nullable=False)
+    ok = db.Column(db.Boolean, nullable=False)
+    message = db.Column(db.Text)
+
+
+class BackupOutbox(db.Model):
+    """Ventende FTP- og sink-uploads, delt mellem alle Gunicorn-workers (se outbox_enqueue).
+    kind='snapshot' = upload BACKUP_FILE (shard mode: plus de ændrede shards) med exported_at;
+    kind='sync' = send delta-patches/historik;
+    kind='sink:<navn>' = BACKUP_FILE til en backup-sink (se BACKUP_SINKS).
+    Rækker markeres først 'done' efter en vellykket upload."""
+    __tablename__ = 'backup_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    exported_at = db.Column(db.String(32))
+    status = db.Column(db.String(16), nullable=False, default='pending', index=True)  # pending | done | superseded
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    done_at = db.Column(db.DateTime)
+
+
+class BackupLease(db.Model):
+    """Tidsbegrænset lease: den worker der holder 'ftp_uploader' er eneste uploader."""
+    __tablename__ = 'backup_leases'
+    name = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class AdminJob(db.Model):
+    """Admin-handling der kører i baggrunden (FTP-backup, gendannelse). Status og
+    fremskridt ligger i DB, så /api/admin/jobs/<id> svarer ens fra alle workers;
+    `result` er det JSON-svar endpointet tidligere gav direkte."""
+    __tablename__ = 'admin_jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    user_id = db.Column(db.Integer)
+    owner = db.Column(db.String(128))  # hostname:pid for workeren der kører jobbet
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)  # queued | running | done | failed
+    phase = db.Column(db.String(64))
+    done = db.Column(db.Integer, nullable=False, default=0)  # rækker behandlet i nuværende fase
+    total = db.Column(db.Integer)                           # None = ukendt (ingen ETA)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    phase_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    http_status = db.Column(db.Integer)
+    result = db.Column(db.Text)
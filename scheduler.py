@@ -0,0 +1,252 @@
+"""Planlagte jobs (snapshot, FTP-push, oprydning) med APScheduler."""
+
+import os
+import ftplib
+import threading
+import time
+import atexit
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text as sa_text, select as sa_select
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+
+import backup_io
+from backup_store import (
+    BACKUP_DIR, BACKUP_FILE, backup_status, ftp_credentials, has_changes_since_backup, history_enabled,
+    outbox_engine, outbox_enqueue, signal_ftp_upload, sink_status, startup_state, write_backup_now,
+    app_context,
+)
+from backup_sync import (
+    get_ftp_pool, history_dir, outbox_enabled, outbox_status, prune_history, uploaded_exported_at,
+)
+from models import db, AdminJob, BackupOutbox, JobRun, PasswordResetToken
+
+
+# ── Scheduler ───────────────────────────────────────────────────────────────────
+# APScheduler med jobs i databasen (tabellen apscheduler_jobs): next_run_time
+# overlever et redeploy, så en kørsel der blev misset mens appen var nede, køres
+# én gang (coalesce) når scheduleren starter igen. Kun én Gunicorn-worker kører
+# scheduleren (fcntl-lås); de andre prøver igen hvert minut, så en ny leder
+# overtager hvis workeren genstartes. Jobs konfigureres som crontab-udtryk i
+# dansk tid; tom streng slår et job fra.
+SCHEDULER_TIMEZONE = 'Europe/Copenhagen'
+JOB_HISTORY_KEEP   = 50   # JobRun-rækker pr. job
+PREDEPLOY_KEEP     = int(os.environ.get('PREDEPLOY_KEEP', '20'))
+_scheduler = None
+_scheduler_lock_file = None
+
+
+def _job_snapshot():
+    """Fuldt snapshot hvis DB har ændret sig siden seneste backup."""
+    if not has_changes_since_backup():
+        return 'ingen ændringer siden sidst'
+    write_backup_now()
+    if backup_status['local_ok'] is False:
+        raise RuntimeError('lokal backup fejlede')
+    return 'snapshot skrevet'
+
+
+def _job_ftp_push():
+    """Læg det der mangler på FTP og backup-sinks i outboxen: hovedfilen hvis
+    målet har en ældre version, og en sync af delta-patches/historik. Fejler (og
+    vises rødt i job-historikken) hvis outboxen har uploads der bliver ved med at fejle."""
+    if not outbox_enabled():
+        return 'FTP ikke konfigureret'
+    ftp = all(ftp_credentials())
+    if os.path.exists(BACKUP_FILE):
+        with open(BACKUP_FILE, 'rb') as f:
+            local_ts = backup_io.read_backup_header(f).get('exported_at', '')
+        if ftp and local_ts != uploaded_exported_at():
+            outbox_enqueue('snapshot', local_ts)
+        for name, status in sink_status.items():
+            if local_ts != status['exported_at']:
+                outbox_enqueue(f'sink:{name}', local_ts)
+    signal_ftp_upload()
+    status = outbox_status()
+    if status.get('max_attempts', 0) >= 3:
+        raise RuntimeError(f'{status["pending"]} uploads venter, seneste fejl: {status["last_error"]}')
+    return f'{status.get("pending", 0)} uploads i kø (uploader: {status.get("uploader") or "ingen"})'
+
+
+def _job_prune():
+    """Retention: predeploy/ på FTP beholder de PREDEPLOY_KEEP nyeste filer,
+    historik ældre end HISTORY_DAYS ryddes, og efterladte temp-filer lokalt slettes.
+    Færdige outbox-rækker og admin-jobs slettes efter 7 dage.
+    Manuelle backups slettes aldrig automatisk."""
+    removed = 0
+    for name in os.listdir(BACKUP_DIR) if os.path.isdir(BACKUP_DIR) else []:
+        path = os.path.join(BACKUP_DIR, name)
+        if name.endswith(('.tmp', '.ftp_tmp')) and time.time() - os.path.getmtime(path) > 86400:
+            os.remove(path)
+            removed += 1
+    pool = get_ftp_pool()
+    if pool is None:
+        return f'{removed} lokale temp-filer slettet'
+    remote_dir = os.environ.get('FTP_PATH', '/ambrotos')
+
+    def _prune(sess):
+        deleted = 0
+        try:
+            sess.cd(remote_dir.rstrip('/') + '/predeploy', create=False)
+            names = sorted((n.rsplit('/', 1)[-1] for n in sess.ftp.nlst()), reverse=True)
+            for name in [n for n in names if n.endswith('.json')][PREDEPLOY_KEEP:]:
+                sess.ftp.delete(name)
+                deleted += 1
+        except ftplib.error_perm:
+            pass  # mappen findes ikke (endnu)
+        if history_enabled():
+            try:
+                sess.cd(history_dir(remote_dir), create=False)
+                prune_history(sess, [n.rsplit('/', 1)[-1] for n in sess.ftp.nlst()])
+            except ftplib.error_perm:
+                pass
+        return deleted
+    deleted = pool.run(_prune)
+    outbox, jobs = BackupOutbox.__table__, AdminJob.__table__
+    with outbox_engine().begin() as conn:
+        conn.execute(outbox.delete().where(outbox.c.status != 'pending',
+                                           outbox.c.done_at < datetime.utcnow() - timedelta(days=7)))
+        conn.execute(jobs.delete().where(jobs.c.finished_at < datetime.utcnow() - timedelta(days=7)))
+    return f'{removed} lokale temp-filer og {deleted} predeploy-filer slettet'
+
+
+def _job_token_cleanup():
+    """Slet brugte og udløbne password-reset-tokens."""
+    n = PasswordResetToken.query.filter(
+        (PasswordResetToken.used.is_(True)) | (PasswordResetToken.expires_at < datetime.utcnow())
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return f'{n} tokens slettet'
+
+
+# job-id → (env-variabel med crontab-udtryk, default, funktion, beskrivelse)
+_SCHEDULED_JOBS = {
+    'snapshot':      ('SCHEDULE_SNAPSHOT',      '0 6,13,22 * * *', _job_snapshot,      'Planlagt backup'),
+    'ftp_push':      ('SCHEDULE_FTP_PUSH',      '*/30 * * * *',    _job_ftp_push,      'FTP-synkronisering'),
+    'prune':         ('SCHEDULE_PRUNE',         '30 3 * * *',      _job_prune,         'Oprydning af gamle backups'),
+    'token_cleanup': ('SCHEDULE_TOKEN_CLEANUP', '45 3 * * *',      _job_token_cleanup, 'Oprydning af reset-tokens'),
+}
+
+
+def _run_job(job_id: str):
+    """Fælles indpakning for alle planlagte jobs: app context, springes over mens
+    opstart/gendannelse kører, og hver kørsel logges som en JobRun."""
+    fn = _SCHEDULED_JOBS[job_id][2]
+    if startup_state['phase'] != 'ready':
+        print(f'ℹ Job {job_id} springes over — opstart/gendannelse er ikke færdig')
+        return
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    with app_context():
+        try:
+            message, ok = fn(), True
+            print(f'✓ Job {job_id}: {message}')
+        except Exception as exc:
+            db.session.rollback()
+            message, ok = str(exc), False
+            print(f'⚠ Job {job_id} fejlede: {exc}')
+        try:
+            db.session.add(JobRun(job_id=job_id, started_at=started_at, ok=ok, message=message,
+                                  duration_ms=round((time.perf_counter() - started) * 1000)))
+            keep = sa_select(JobRun.id).where(JobRun.job_id == job_id) \
+                .order_by(JobRun.id.desc()).limit(JOB_HISTORY_KEEP)
+            JobRun.query.filter(JobRun.job_id == job_id, JobRun.id.not_in(keep)) \
+                .delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            print(f'⚠ Kunne ikke gemme job-historik: {exc}')
+
+
+def _build_scheduler():
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(SCHEDULER_TIMEZONE)
+    except Exception as exc:
+        print(f'⚠ Scheduler: ZoneInfo fejlede ({exc}), falder tilbage til UTC')
+        tz = timezone.utc
+    with app_context():
+        engine = db.engine
+    scheduler = BackgroundScheduler(
+        jobstores={'default': SQLAlchemyJobStore(engine=engine)},
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': None},
+        timezone=tz,
+    )
+    scheduler.start(paused=True)
+    for job_id, (env_name, default, _, name) in _SCHEDULED_JOBS.items():
+        expr = os.environ.get(env_name, default).strip()
+        existing = scheduler.get_job(job_id)
+        if not expr:
+            if existing:
+                existing.remove()
+            continue
+        trigger = CronTrigger.from_crontab(expr, timezone=tz)
+        # Behold det gemte job (og dermed dets next_run_time) når intet er ændret —
+        # ellers ville replace_existing nulstille tiden og catch-up gå tabt
+        if existing and repr(existing.trigger) == repr(trigger) and existing.args == (job_id,):
+            continue
+        scheduler.add_job(_run_job, trigger, args=[job_id], id=job_id, name=name, replace_existing=True)
+    scheduler.resume()
+    return scheduler
+
+
+def start_scheduler():
+    """Starter en daemon-tråd der venter på scheduler-låsen og på at opstarten er
+    færdig, og derefter kører APScheduler i denne worker."""
+    import fcntl
+
+    lock_path = os.path.join(BACKUP_DIR, '.backup.lock')
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    def _run():
+        global _scheduler, _scheduler_lock_file
+        lf = open(lock_path, 'w')
+        while True:
+            try:
+                fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(60)  # En anden worker kører scheduleren
+        _scheduler_lock_file = lf  # holdes åben (= låst) resten af processens levetid
+        while startup_state['phase'] != 'ready':
+            time.sleep(1)
+        try:
+            _scheduler = _build_scheduler()
+        except Exception as exc:
+            print(f'⚠ Scheduler kunne ikke starte: {exc}')
+            return
+        atexit.register(lambda: _scheduler.shutdown(wait=False))
+        jobs = ', '.join(f'{job.id} ({job.next_run_time:%d/%m %H:%M})' for job in _scheduler.get_jobs())
+        print(f'✓ Scheduler startet: {jobs or "ingen jobs"}')
+
+    threading.Thread(target=_run, daemon=True, name='scheduler-leader').start()
+
+
+def scheduler_status() -> list:
+    """Pr. job: næste kørsel (fra job-tabellen, så alle workers kan svare) og de
+    seneste kørsler med varighed."""
+    next_runs = {}
+    try:
+        rows = db.session.execute(sa_text('SELECT id, next_run_time FROM apscheduler_jobs'))
+        next_runs = {job_id: ts for job_id, ts in rows}
+    except Exception:
+        db.session.rollback()  # tabellen oprettes først når scheduleren starter
+    jobs = []
+    for job_id, (env_name, default, _, name) in _SCHEDULED_JOBS.items():
+        runs = JobRun.query.filter_by(job_id=job_id).order_by(JobRun.id.desc()).limit(5).all()
+        next_ts = next_runs.get(job_id)
+        jobs.append({
+            'id': job_id,
+            'name': name,
+            'schedule': os.environ.get(env_name, default).strip() or None,
+            'next_run': datetime.fromtimestamp(next_ts, timezone.utc).isoformat() if next_ts else None,
+            'runs': [{
+                'started_at': r.started_at.isoformat(),
+                'duration_ms': r.duration_ms,
+                'ok': r.ok,
+                'message': r.message,
+            } for r in runs],
+        })
+    return jobs
@@ -0,0 +1,225 @@
+"""
+Fælles opsætning for testene af backup-pipelinen.
+
+app.py læser sin konfiguration ved import, så miljøet sættes her — før nogen
+testfil importerer app, backup_store eller backup_io: en midlertidig SQLite-
+database og BACKUP_DIR, journal mode med delta-upload til en FTPStandIn, og
+ingen planlagte jobs. Appen importeres én gang for hele kørslen.
+
+Kør fra repo-roden (pytest er ikke med i requirements.txt):
+    pip install pytest && python -m pytest -q
+"""
+import atexit
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ftp_standin import FTPStandIn  # noqa: E402
+
+_TMP = tempfile.mkdtemp(prefix='ambrotos-test-')
+FTP_SERVER = FTPStandIn().start()
+
+os.makedirs(os.path.join(_TMP, 'data'))
+os.environ.update(
+    DATABASE_URL=f'sqlite:///{os.path.join(_TMP, "test.db")}',
+    BACKUP_DIR=os.path.join(_TMP, 'data'),
+    FTP_HOST=f'{FTP_SERVER.host}:{FTP_SERVER.port}',
+    FTP_USER=FTP_SERVER.user,
+    FTP_PASS=FTP_SERVER.passwd,
+    FTP_TLS='0',
+    FTP_PATH='/ambrotos',
+    FTP_BACKOFF_SECONDS='0.01',
+    STARTUP_RESTORE='sync',
+    BACKUP_MODE='journal',
+    FTP_UPLOAD_MODE='delta',
+    JOURNAL_COMPACT_EVERY='1000',
+    BACKUP_DEBOUNCE_SECONDS='0.05',
+    OUTBOX_POLL_SECONDS='0.1',
+    BACKUP_SHARDS='0',
+    BACKUP_SINKS='',
+    HISTORY_DAYS='0',
+    RESTORE_SHADOW='1',
+    SCHEDULE_SNAPSHOT='',
+    SCHEDULE_FTP_PUSH='',
+    SCHEDULE_PRUNE='',
+    SCHEDULE_TOKEN_CLEANUP='',
+)
+
+PASSWORD = '123'
+
+
+@atexit.register
+def _cleanup():
+    # Registreret før app importeres, så den kører efter appens egne
+    # atexit-handlere (scheduler-stop, sidste backup-flush)
+    FTP_SERVER.stop()
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+# ── Testdata ────────────────────────────────────────────────────────────────────
+# To teams med hver sin bruger, events og kommentarer; Admin er med i begge.
+
+def dataset() -> dict:
+    """Standard-datasættet som en version 2 backup (rækker i BACKUP_COLUMNS-format)."""
+    from werkzeug.security import generate_password_hash
+    pw = generate_password_hash(PASSWORD)
+    return {
+        'version': 2,
+        'exported_at': '2026-01-01T00:00:00',
+        'teams': [
+            {'id': 1, 'name': 'Alpha', 'description': ''},
+            {'id': 2, 'name': 'Beta', 'description': 'Andet hold'},
+        ],
+        'users': [
+            {'id': 1, 'username': 'Admin', 'password_hash': pw, 'color': '#111111', 'is_admin': True},
+            {'id': 2, 'username': 'Bruger 1', 'password_hash': pw, 'color': '#222222', 'is_admin': False},
+            {'id': 3, 'username': 'Bruger 2', 'password_hash': pw, 'color': '#333333', 'is_admin': False},
+        ],
+        'user_teams': [
+            {'user_id': 1, 'team_id': 1, 'is_team_admin': True},
+            {'user_id': 1, 'team_id': 2, 'is_team_admin': False},
+            {'user_id': 2, 'team_id': 1, 'is_team_admin': False},
+            {'user_id': 3, 'team_id': 2, 'is_team_admin': True},
+        ],
+        'unavailable_dates': [
+            {'user_id': 2, 'team_id': 1, 'date': '2030-01-01'},
+            {'user_id': 3, 'team_id': 2, 'date': '2030-01-02'},
+        ],
+        'group_events': [
+            {'id': 1, 'team_id': 1, 'title': 'Alpha-fest', 'description': '', 'date': '2030-02-01',
+             'end_date': None, 'created_by': 2, 'organizer1_id': 2, 'organizer2_id': None,
+             'created_at': '2026-01-01T10:00:00'},
+            {'id': 2, 'team_id': 2, 'title': 'Beta-tur', 'description': 'Skovtur', 'date': '2030-03-01',
+             'end_date': '2030-03-02', 'created_by': 3, 'organizer1_id': None, 'organizer2_id': None,
+             'created_at': '2026-01-02T10:00:00'},
+        ],
+        'event_comments': [
+            {'id': 1, 'event_id': 1, 'user_id': 1, 'text': 'Hej', 'is_hidden': False,
+             'created_at': '2026-01-03T10:00:00'},
+            {'id': 2, 'event_id': 2, 'user_id': 3, 'text': 'Skjult', 'is_hidden': True,
+             'created_at': '2026-01-04T10:00:00'},
+        ],
+    }
+
+
+def normalized(data: dict) -> dict:
+    """Backup-sektionerne med rækkerne i en fast orden (journal-afspilning og
+    delta-patches bevarer ikke eksportens rækkefølge)."""
+    import json
+    from backup_io import BACKUP_SECTIONS
+    return {name: sorted(data.get(name, []), key=lambda row: json.dumps(row, sort_keys=True))
+            for name in BACKUP_SECTIONS}
+
+
+# ── Fixtures ────────────────────────────────────────────────────────────────────
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture(scope='session')
+def ftp_server():
+    return FTP_SERVER
+
+
+@pytest.fixture
+def wait_idle(app_module):
+    """Vent til backup-writeren har skrevet og outboxen er tømt til FTP."""
+    import backup_store
+    import backup_sync
+
+    def _wait(timeout: float = 15.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if (not backup_store.backup_status['pending']
+                    and not backup_store.ftp_lock.locked()
+                    and backup_sync.outbox_status().get('pending') == 0):
+                # én runde mere, så en upload der lige er startet også når at blive færdig
+                time.sleep(0.2)
+                if (not backup_store.backup_status['pending'] and not backup_store.ftp_lock.locked()
+                        and backup_sync.outbox_status().get('pending') == 0):
+                    return
+            time.sleep(0.05)
+        raise AssertionError(f'Backup/upload blev ikke færdig: {backup_sync.outbox_status()}')
+    return _wait
+
+
+@pytest.fixture
+def load_data(app_module, wait_idle):
+    """Erstat hele databasen med `data` (som admin-restore uden skyggetabeller)
+    og vent til snapshot og FTP-basis er skrevet."""
+    import backup_store
+
+    def _load(data: dict):
+        wait_idle()
+        with app_module.app.app_context():
+            db = app_module.db
+            db.session.info['skip_journal'] = True
+            try:
+                tokens = backup_store.clear_backup_tables()
+                backup_store.restore_tables(data)
+                backup_store.restore_reset_tokens(tokens)
+                db.session.commit()
+            finally:
+                db.session.info.pop('skip_journal', None)
+            backup_store.write_backup(compact=True)
+        wait_idle()
+    return _load
+
+
+@pytest.fixture
+def seeded(load_data):
+    data = dataset()
+    load_data(data)
+    return data
+
+
+@pytest.fixture
+def export(app_module):
+    """Den levende database eksporteret og læst tilbage som backup-payload."""
+    import backup_io
+    import backup_store
+
+    def _export() -> dict:
+        buf = io.BytesIO()
+        with app_module.app.app_context():
+            backup_store.stream_backup(buf)
+        buf.seek(0)
+        return backup_io.load_backup(buf)
+    return _export
+
+
+@pytest.fixture
+def client(app_module, seeded):
+    """Testklient logget ind som Admin på standard-datasættet."""
+    c = app_module.app.test_client()
+    resp = c.post('/login', data={'username': 'Admin', 'password': PASSWORD})
+    assert resp.status_code in (200, 302)
+    return c
+
+
+@pytest.fixture
+def run_job(client):
+    """Kør et admin-job til ende: svaret fra endpointet → (http_status, result)."""
+    def _run(resp, timeout: float = 30.0):
+        if resp.status_code != 202:
+            return resp.status_code, resp.get_json()
+        url = resp.get_json()['status_url']
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            body = client.get(url).get_json()
+            if body['status'] in ('done', 'failed') and 'result' in body:
+                return body['http_status'], body['result']
+            time.sleep(0.05)
+        raise AssertionError(f'Job blev ikke færdigt: {url}')
+    return _run
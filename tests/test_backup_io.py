@@ -0,0 +1,111 @@
+"""backup_io: filformaterne (v1/v2 JSON og den komprimerede v3 med checksums)
+og FTP-overførsler der genoptages efter afbrydelse."""
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+import backup_io
+from conftest import dataset
+from ftp_standin import FTPStandIn
+
+
+def _sections(data):
+    return [(name, iter(data[name])) for name in backup_io.BACKUP_SECTIONS]
+
+
+@pytest.mark.parametrize('version', [2, 3])
+def test_write_load_round_trip(version):
+    data = dataset()
+    buf = io.BytesIO()
+    backup_io.write_backup(buf, {'exported_at': data['exported_at']}, _sections(data), version=version)
+    buf.seek(0)
+    loaded = backup_io.load_backup(buf)
+    assert loaded['exported_at'] == data['exported_at']
+    for name in backup_io.BACKUP_SECTIONS:
+        assert loaded[name] == data[name]
+
+
+def test_v3_checksum_detects_corruption():
+    buf = io.BytesIO()
+    backup_io.write_backup(buf, {'exported_at': 'x'}, _sections(dataset()), version=3)
+    raw = bytearray(buf.getvalue())
+    assert backup_io.verify_backup(io.BytesIO(raw)) == []
+    buf.seek(0)
+    header = backup_io.read_backup_header(buf)
+    entry = next(e for e in header['sections'] if e['name'] == 'group_events')
+    raw[header['_body'] + entry['offset'] + entry['length'] // 2] ^= 0xFF
+    assert backup_io.verify_backup(io.BytesIO(raw)) == ['group_events']
+    with pytest.raises(ValueError):
+        backup_io.load_backup(io.BytesIO(raw))
+
+
+def test_v1_is_read_as_single_team_backup():
+    v1 = {k: v for k, v in dataset().items() if k not in ('version', 'teams', 'user_teams')}
+    loaded = backup_io.load_backup(io.BytesIO(json.dumps(v1).encode('utf-8')))
+    assert loaded['users'] == v1['users']
+    assert loaded.get('teams', []) == []
+
+
+def test_iter_backup_streams_sections_in_order():
+    data = dataset()
+    buf = io.BytesIO()
+    backup_io.write_backup(buf, {'exported_at': 'x'}, _sections(data), version=3)
+    buf.seek(0)
+    header, rows = backup_io.iter_backup(buf)
+    assert {e['name']: e['rows'] for e in header['sections']} == {
+        name: len(data[name]) for name in backup_io.BACKUP_SECTIONS}
+    assert list(rows) == [(name, row) for name in backup_io.BACKUP_SECTIONS for row in data[name]]
+
+
+@pytest.fixture
+def flaky_ftp():
+    """En separat stand-in der afbryder hver dataoverførsel efter 40.000 bytes."""
+    with FTPStandIn(drop_transfer_after=40_000) as srv:
+        srv.dirs.add('/up')
+        yield srv
+
+
+def _pool(srv):
+    return backup_io.FTPPool(f'{srv.host}:{srv.port}', srv.user, srv.passwd, use_tls=False)
+
+
+def test_store_part_resumes_after_dropped_transfer(flaky_ftp):
+    data = os.urandom(100_000)
+    digest = hashlib.sha256(data).hexdigest()
+    pool = _pool(flaky_ftp)
+
+    with pytest.raises(backup_io.FTP_CONNECTION_ERRORS):
+        with pool.session() as sess:
+            sess.cd('/up')
+            sess.store_part('f.bin', io.BytesIO(data), len(data), digest, resume=False)
+    partial = flaky_ftp.files['/up/f.bin.part']
+    assert 0 < len(partial) < len(data)
+
+    flaky_ftp.drop_transfer_after = None
+    flaky_ftp.reset_stats()
+    with pool.session() as sess:
+        sess.cd('/up')
+        sess.store_part('f.bin', io.BytesIO(data), len(data), digest, resume=True)
+    assert flaky_ftp.files['/up/f.bin.part'] == data
+    # kun resten blev sendt (APPE fra serverens SIZE)
+    assert flaky_ftp.stats['bytes_in'] == len(data) - len(partial)
+
+
+def test_upload_completes_across_dropped_transfers(flaky_ftp):
+    data = os.urandom(100_000)
+    size = _pool(flaky_ftp).upload('/up', 'g.bin', io.BytesIO(data), retries=5)
+    assert size == len(data)
+    assert flaky_ftp.files['/up/g.bin'] == data
+    assert '/up/g.bin.part' not in flaky_ftp.files
+    assert flaky_ftp.stats['bytes_in'] == len(data)  # ingen bytes sendt to gange
+
+
+def test_download_resumes_after_dropped_transfer(flaky_ftp, tmp_path):
+    data = os.urandom(100_000)
+    flaky_ftp.files['/up/h.bin'] = data
+    local = tmp_path / 'h.bin'
+    assert _pool(flaky_ftp).download('/up', 'h.bin', str(local), retries=5) == len(data)
+    assert local.read_bytes() == data
@@ -0,0 +1,42 @@
+"""DataVersion: alle scopes findes på forhånd, så flush-hooket kun opdaterer."""
+from sqlalchemy import select as sa_select
+
+import backup_store
+from conftest import dataset
+from models import DataVersion
+
+
+def _versions(app_module) -> dict:
+    dv = DataVersion.__table__
+    with app_module.app.app_context():
+        return dict(app_module.db.session.execute(sa_select(dv.c.scope, dv.c.version)).all())
+
+
+def test_new_team_gets_scopes_with_the_team(client, app_module):
+    resp = client.post('/api/admin/teams', json={'name': 'Gamma'})
+    assert resp.status_code == 201
+    team_id = resp.get_json()['id']
+    versions = _versions(app_module)
+    assert versions[f'team:{team_id}'] == 1
+    assert f'shard:team_{team_id}' in versions
+
+
+def test_core_restore_seeds_scopes_for_restored_teams(load_data, app_module):
+    data = dataset()
+    data['teams'].append({'id': 7, 'name': 'Syv', 'description': ''})
+    load_data(data)
+    versions = _versions(app_module)
+    assert {'team:7', 'shard:team_7', 'shard:global'} <= versions.keys()
+
+
+def test_flush_hook_only_updates(client, app_module):
+    dv = DataVersion.__table__
+    with app_module.app.app_context():
+        app_module.db.session.execute(dv.delete().where(dv.c.scope == 'team:1'))
+        app_module.db.session.commit()
+    assert client.post('/api/unavailable/toggle', json={'date': '2030-05-05'}).status_code == 200
+    assert 'team:1' not in _versions(app_module)
+
+    with app_module.app.app_context():
+        backup_store.seed_data_versions()
+    assert _versions(app_module)['team:1'] == 0
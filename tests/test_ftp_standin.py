@@ -0,0 +1,64 @@
+"""FTPStandIn: det udsnit af FTP som backup-pipelinen bruger, og fejlinjektionen."""
+import ftplib
+import io
+
+import pytest
+
+from ftp_standin import FTPStandIn
+
+
+@pytest.fixture
+def srv():
+    with FTPStandIn() as server:
+        yield server
+
+
+def _connect(srv):
+    ftp = ftplib.FTP()
+    ftp.connect(srv.host, srv.port, timeout=5)
+    ftp.login(srv.user, srv.passwd)
+    return ftp
+
+
+def test_store_list_retrieve_rename(srv):
+    ftp = _connect(srv)
+    ftp.mkd('/a')
+    ftp.cwd('/a')
+    ftp.storbinary('STOR f.part', io.BytesIO(b'hello '))
+    ftp.storbinary('APPE f.part', io.BytesIO(b'world'))
+    ftp.rename('f.part', 'f.txt')
+    assert ftp.size('f.txt') == 11
+    assert [n.rsplit('/', 1)[-1] for n in ftp.nlst()] == ['f.txt']
+    buf = io.BytesIO()
+    ftp.retrbinary('RETR f.txt', buf.write, rest=6)
+    assert buf.getvalue() == b'world'
+    ftp.quit()
+    assert srv.files == {'/a/f.txt': b'hello world'}
+    assert srv.stats['bytes_in'] == 11
+
+
+def test_wrong_password_is_rejected(srv):
+    ftp = ftplib.FTP()
+    ftp.connect(srv.host, srv.port, timeout=5)
+    with pytest.raises(ftplib.error_perm):
+        ftp.login(srv.user, 'forkert')
+
+
+def test_fail_next_injects_reply(srv):
+    srv.fail_next('SIZE', 2, '550 Injected')
+    srv.files['/x'] = b'abc'
+    ftp = _connect(srv)
+    for _ in range(2):
+        with pytest.raises(ftplib.error_perm):
+            ftp.size('/x')
+    assert ftp.size('/x') == 3
+    assert srv.stats['failures'] == 2
+
+
+def test_drop_transfer_after_truncates_upload(srv):
+    srv.dirs.add('/a')
+    srv.drop_transfer_after = 1000
+    ftp = _connect(srv)
+    with pytest.raises((ftplib.error_temp, OSError)):
+        ftp.storbinary('STOR /a/big', io.BytesIO(b'x' * 50_000))
+    assert srv.files['/a/big'] == b'x' * 1000
@@ -0,0 +1,77 @@
+"""ICS-feedet: ETag/Last-Modified fra DataVersion og 304 når kalenderen ikke er ændret."""
+import base64
+from datetime import timedelta
+
+import pytest
+from werkzeug.http import http_date
+
+from conftest import PASSWORD
+
+
+def _login(app_module, username):
+    c = app_module.app.test_client()
+    assert c.post('/login', data={'username': username, 'password': PASSWORD}).status_code in (200, 302)
+    return c
+
+
+@pytest.fixture
+def member(app_module, seeded):
+    """Bruger 2 — kun med i team 2."""
+    return _login(app_module, 'Bruger 2')
+
+
+def test_etag_gives_304_until_own_team_changes(client, member):
+    first = client.get('/calendar.ics')
+    assert first.status_code == 200
+    assert first.mimetype == 'text/calendar'
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"ics-1-')
+
+    resp = client.get('/calendar.ics', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+    assert not resp.data
+
+    # Ændringer i et andet team rører ikke team 1's feed
+    assert member.post('/api/unavailable/toggle', json={'date': '2030-09-09'}).status_code == 200
+    assert client.get('/calendar.ics', headers={'If-None-Match': etag}).status_code == 304
+
+    assert client.post('/api/unavailable/toggle', json={'date': '2030-09-10'}).status_code == 200
+    resp = client.get('/calendar.ics', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_if_modified_since_only_for_strictly_older_changes(client):
+    first = client.get('/calendar.ics')
+    last_modified = first.last_modified
+    assert last_modified is not None
+
+    # Samme sekund som ændringen kan ikke skelnes fra en senere ændring → fuldt svar
+    resp = client.get('/calendar.ics', headers={'If-Modified-Since': http_date(last_modified)})
+    assert resp.status_code == 200
+    resp = client.get('/calendar.ics', headers={'If-Modified-Since': http_date(last_modified + timedelta(seconds=1))})
+    assert resp.status_code == 304
+
+
+def test_basic_auth_feed_follows_first_team(client, app_module, seeded):
+    anon = app_module.app.test_client()
+    assert anon.get('/calendar.ics').status_code == 401
+
+    token = base64.b64encode(f'Bruger 1:{PASSWORD}'.encode()).decode()
+    resp = anon.get('/calendar.ics', headers={'Authorization': f'Basic {token}'})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == client.get('/calendar.ics').headers['ETag']
+
+    bad = base64.b64encode(b'Bruger 1:forkert').decode()
+    assert anon.get('/calendar.ics', headers={'Authorization': f'Basic {bad}'}).status_code == 401
+
+
+def test_restore_changes_etag(client, run_job, wait_idle):
+    etag = client.get('/calendar.ics').headers['ETag']
+    status, result = run_job(client.post('/api/admin/backup-now'))
+    assert status == 200, result
+    status, result = run_job(client.post('/api/admin/restore-from-ftp', json={'filename': result['filename']}))
+    assert status == 200, result
+    wait_idle()
+    assert client.get('/calendar.ics', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,110 @@
+"""Journal mode: snapshot + journal og FTP-basis + delta-patches skal begge
+kunne genskabe databasen."""
+import io
+import json
+import os
+import threading
+
+import pytest
+
+import backup_io
+import backup_store
+import backup_sync
+from conftest import normalized
+
+REMOTE_DIR = '/ambrotos'
+
+
+@pytest.fixture
+def changed(client, wait_idle):
+    """En række ændringer gennem API'et: tilføj/fjern datoer, opret og slet
+    events, kommentér og ændr et team."""
+    assert client.post('/api/unavailable/toggle', json={'date': '2030-06-06'}).json['action'] == 'added'
+    assert client.post('/api/unavailable/toggle', json={'date': '2030-06-07'}).json['action'] == 'added'
+    assert client.post('/api/unavailable/toggle', json={'date': '2030-06-06'}).json['action'] == 'removed'
+    event = client.post('/api/group-events', json={'title': 'Journal-fest', 'date': '2030-08-08'}).json
+    assert client.post(f'/api/group-events/{event["id"]}/comments', json={'text': 'Med!'}).status_code == 201
+    assert client.delete('/api/group-events/1').status_code == 200
+    assert client.put('/api/admin/teams/2', json={'name': 'Beta 2'}).status_code == 200
+    wait_idle()
+
+
+def test_journal_replay_matches_database(changed, export):
+    with open(backup_store.BACKUP_FILE, 'rb') as f:
+        base = backup_io.load_backup(f)
+    records = backup_store.read_journal(base['exported_at'])
+    assert records
+    assert normalized(backup_store.apply_journal(base, records)) == normalized(export())
+
+
+def test_delta_patches_rebuild_database(changed, export, ftp_server):
+    base = backup_io.load_backup(io.BytesIO(ftp_server.files[f'{REMOTE_DIR}/calendar_backup.json']))
+    patch, n_patches = backup_sync.fetch_ftp_patches(REMOTE_DIR, base['exported_at'])
+    assert n_patches > 0
+    records = [json.loads(line) for line in patch.splitlines() if line.strip()]
+    records = [rec for rec in records if rec['ts'] >= base['exported_at']]
+    assert normalized(backup_store.apply_journal(base, records)) == normalized(export())
+
+
+def test_startup_prefers_ftp_base_and_patches(changed, export, app_module):
+    """Uden lokale filer (ny deploy) hentes FTP-basen, og dens patches bliver journalen."""
+    live = normalized(export())
+    for path in (backup_store.BACKUP_FILE, backup_store.JOURNAL_FILE):
+        os.remove(path)
+    with app_module.app.app_context():
+        backup_sync.try_use_best_backup()
+    with open(backup_store.BACKUP_FILE, 'rb') as f:
+        base = backup_io.load_backup(f)
+    records = backup_store.read_journal(base['exported_at'])
+    assert normalized(backup_store.apply_journal(base, records)) == live
+
+
+NOOP = {'op': 'upsert', 'table': 'teams', 'row': {'id': 1, 'name': 'Alpha', 'description': ''}}
+
+
+def _append_from_other_thread():
+    """Som en requests after_commit-hook: append i en anden tråd, der ikke må
+    vente på snapshottet."""
+    worker = threading.Thread(target=backup_store._journal_append, args=([NOOP],))
+    worker.start()
+    worker.join(timeout=5)
+    return not worker.is_alive()
+
+
+def test_compaction_does_not_block_journal_appends(changed, app_module, monkeypatch, wait_idle):
+    real_stream = backup_store.stream_backup
+    seen = {}
+
+    def slow_stream(f, *args, **kwargs):
+        seen['appended'] = _append_from_other_thread()
+        seen['segment'] = os.path.exists(backup_store.COMPACTING_FILE)
+        return real_stream(f, *args, **kwargs)
+    monkeypatch.setattr(backup_store, 'stream_backup', slow_stream)
+
+    with app_module.app.app_context():
+        backup_store.write_backup_now()
+    assert seen == {'appended': True, 'segment': True}
+    assert not os.path.exists(backup_store.COMPACTING_FILE)
+    assert [r['row'] for r in backup_store.read_journal()] == [NOOP['row']]
+    wait_idle()
+
+
+def test_failed_snapshot_puts_segment_back(changed, export, app_module, monkeypatch):
+    with open(backup_store.BACKUP_FILE, 'rb') as f:
+        base = backup_io.load_backup(f)
+    before = backup_store.read_journal()
+    live = normalized(export())
+
+    def failing_stream(f, *args, **kwargs):
+        assert _append_from_other_thread()
+        raise OSError('disk fuld')
+    monkeypatch.setattr(backup_store, 'stream_backup', failing_stream)
+
+    with app_module.app.app_context():
+        backup_store.write_backup_now()
+    assert backup_store.backup_status['local_ok'] is False
+    assert not os.path.exists(backup_store.COMPACTING_FILE)
+    records = backup_store.read_journal()
+    assert records[:len(before)] == before and records[-1]['row'] == NOOP['row']
+    assert backup_store.journal_length() == len(records)
+    assert normalized(backup_store.apply_journal(base, records)) == live
@@ -0,0 +1,73 @@
+"""Outbox-uploaderens lease: fornyes under en lang tur, og en mistet lease må
+hverken rotere på FTP eller markere outbox-rækker."""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select as sa_select
+
+import backup_store
+import backup_sync
+from models import BackupLease, BackupOutbox
+
+LEASE = 'ftp_uploader'
+
+
+def _lease_row():
+    lease = BackupLease.__table__
+    with backup_store.outbox_engine().connect() as conn:
+        return conn.execute(sa_select(lease).where(lease.c.name == LEASE)).first()
+
+
+def _set_lease(owner: str, seconds: float):
+    lease = BackupLease.__table__
+    with backup_store.outbox_engine().begin() as conn:
+        conn.execute(lease.update().where(lease.c.name == LEASE)
+                     .values(owner=owner, expires_at=datetime.utcnow() + timedelta(seconds=seconds)))
+
+
+@pytest.fixture
+def lease(seeded, wait_idle, monkeypatch):
+    """Denne worker er leder; bagefter frigives leasen til uploader-tråden igen."""
+    monkeypatch.setattr(backup_sync, 'OUTBOX_LEASE_SECONDS', 0.6)
+    assert backup_sync._acquire_lease()
+    yield
+    _set_lease(backup_store.lease_owner(), -1)
+    backup_sync._lease_lost.clear()
+    backup_sync._lease_until = None
+    backup_store.ftp_pending.set()
+    wait_idle()
+
+
+def test_heartbeat_keeps_lease_during_long_round(lease):
+    with backup_sync._LeaseHeartbeat():
+        time.sleep(1.5)  # mere end to gange leasens længde
+        row = _lease_row()
+        assert row.owner == backup_store.lease_owner()
+        assert row.expires_at > datetime.utcnow()
+        backup_sync._check_lease()
+
+
+def test_lost_lease_stops_rotation(lease, ftp_server):
+    _set_lease('anden-worker:1', 60)
+    with backup_sync._LeaseHeartbeat():
+        time.sleep(0.5)  # første heartbeat opdager det
+        with pytest.raises(backup_sync.LeaseLost):
+            backup_sync._check_lease()
+        before = dict(ftp_server.files)
+        with backup_sync.get_ftp_pool().session() as sess:
+            sess.cd('/ambrotos')
+            with pytest.raises(backup_sync.LeaseLost):
+                backup_sync._ftp_rotate_into_place(sess, 'calendar_backup.json.part', 'calendar_backup.json')
+        assert ftp_server.files == before
+
+
+def test_lost_lease_leaves_outbox_rows_pending(lease, app_module):
+    outbox = BackupOutbox.__table__
+    _set_lease('anden-worker:1', 60)
+    backup_store.outbox_enqueue('sync')
+    with app_module.app.app_context():
+        backup_sync._process_outbox()
+    with backup_store.outbox_engine().connect() as conn:
+        pending = conn.execute(sa_select(outbox.c.kind).where(outbox.c.status == 'pending')).scalars().all()
+    assert pending == ['sync']
@@ -0,0 +1,169 @@
+"""Admin-gendannelse fra FTP manualbackup/: hele databasen streamet fra
+downloaden (v1/v2/v3) via skyggetabellerne, og ét team."""
+import io
+import json
+
+import pytest
+from sqlalchemy import inspect as sa_inspect
+
+import backup_io
+import backup_store
+from conftest import dataset, normalized
+
+MANUAL = '/ambrotos/manualbackup'
+
+
+def _put_manual(ftp, name: str, raw: bytes):
+    ftp.dirs.update({'/ambrotos', MANUAL})
+    ftp.files[f'{MANUAL}/{name}'] = raw
+
+
+def _encode(data: dict, version: int) -> bytes:
+    if version == 1:
+        # v1: ét hold, ingen teams/user_teams og intet team_id
+        v1 = {name: [{k: v for k, v in row.items() if k != 'team_id'} for row in data[name]]
+              for name in ('users', 'unavailable_dates', 'group_events', 'event_comments')}
+        return json.dumps({'exported_at': data['exported_at'], **v1}).encode('utf-8')
+    buf = io.BytesIO()
+    backup_io.write_backup(buf, {'exported_at': data['exported_at']},
+                           [(name, iter(data[name])) for name in backup_io.BACKUP_SECTIONS], version=version)
+    return buf.getvalue()
+
+
+def _backup_data() -> dict:
+    """Et datasæt der tydeligt adskiller sig fra det seedede."""
+    data = dataset()
+    data['group_events'][0]['title'] = 'Fra backup'
+    data['unavailable_dates'].append({'user_id': 1, 'team_id': 1, 'date': '2030-04-04'})
+    data['event_comments'].pop()
+    return data
+
+
+@pytest.mark.parametrize('version', [1, 2, 3])
+def test_restore_from_ftp_by_version(version, client, run_job, ftp_server, export, wait_idle):
+    data = _backup_data()
+    _put_manual(ftp_server, f'v{version}.json', _encode(data, version))
+
+    status, result = run_job(client.post('/api/admin/restore-from-ftp', json={'filename': f'v{version}.json'}))
+    assert status == 200, result
+    wait_idle()
+
+    expected = normalized(data)
+    if version == 1:
+        expected['teams'] = expected['user_teams'] = []
+        for name in ('unavailable_dates', 'group_events'):
+            expected[name] = normalized({name: [{**row, 'team_id': None} for row in data[name]]})[name]
+    assert normalized(export()) == expected
+    assert result['restored']['users'] == 3
+
+
+def test_backup_now_round_trip(client, run_job, export, wait_idle):
+    before = normalized(export())
+    status, result = run_job(client.post('/api/admin/backup-now'))
+    assert status == 200, result
+
+    client.post('/api/unavailable/toggle', json={'date': '2030-06-06'})
+    client.delete('/api/group-events/1')
+    assert normalized(export()) != before
+
+    status, result = run_job(client.post('/api/admin/restore-from-ftp', json={'filename': result['filename']}))
+    assert status == 200, result
+    wait_idle()
+    assert normalized(export()) == before
+
+
+def _shadow_tables(app_module):
+    with app_module.app.app_context():
+        return [t for t in sa_inspect(app_module.db.engine).get_table_names()
+                if t.startswith(backup_store.SHADOW_PREFIX)]
+
+
+def test_shadow_swap_rolls_back_when_insert_fails(client, run_job, ftp_server, export, app_module, monkeypatch):
+    before = normalized(export())
+    _put_manual(ftp_server, 'swap.json', _encode(_backup_data(), 3))
+
+    real_clear = backup_store.clear_backup_tables
+
+    def clear_then_conflict():
+        # En række der dukker op mellem DELETE og INSERT … SELECT → unik nøgle fejler
+        tokens = real_clear()
+        app_module.db.session.execute(app_module.Team.__table__.insert().values(id=1, name='Konflikt'))
+        return tokens
+    monkeypatch.setattr(backup_store, 'clear_backup_tables', clear_then_conflict)
+
+    status, result = run_job(client.post('/api/admin/restore-from-ftp', json={'filename': 'swap.json'}))
+    assert status == 500
+    assert result['error'].startswith('Gendannelse fejlede') and 'teams.id' in result['error']
+    assert normalized(export()) == before
+    assert _shadow_tables(app_module) == []
+
+
+def test_shadow_load_rejects_duplicate_username(client, run_job, ftp_server, export, app_module):
+    before = normalized(export())
+    data = _backup_data()
+    data['users'][2]['username'] = data['users'][1]['username']
+    _put_manual(ftp_server, 'dup.json', _encode(data, 3))
+
+    status, result = run_job(client.post('/api/admin/restore-from-ftp', json={'filename': 'dup.json'}))
+    assert status == 500
+    assert normalized(export()) == before
+    assert _shadow_tables(app_module) == []
+
+
+def test_reset_tokens_survive_restore(client, run_job):
+    status, result = run_job(client.post('/api/admin/backup-now'))
+    assert status == 200, result
+    reset_url = client.post('/api/admin/users/2/reset-token').get_json()['reset_url']
+    path = reset_url.split('://', 1)[1].split('/', 1)[1]
+
+    status, result = run_job(client.post('/api/admin/restore-from-ftp', json={'filename': result['filename']}))
+    assert status == 200, result
+    assert client.get(f'/{path}').status_code == 200  # udløbet/ukendt token → redirect til login
+
+
+def _team_rows(data: dict, team_id: int) -> dict:
+    events = {e['id'] for e in data['group_events'] if e['team_id'] == team_id}
+    return normalized({
+        'teams': [t for t in data['teams'] if t['id'] == team_id],
+        'user_teams': [r for r in data['user_teams'] if r['team_id'] == team_id],
+        'unavailable_dates': [r for r in data['unavailable_dates'] if r['team_id'] == team_id],
+        'group_events': [e for e in data['group_events'] if e['team_id'] == team_id],
+        'event_comments': [c for c in data['event_comments'] if c['event_id'] in events],
+    })
+
+
+def test_restore_team(client, run_job, export, wait_idle):
+    original = export()
+    status, result = run_job(client.post('/api/admin/backup-now'))
+    assert status == 200, result
+    filename = result['filename']
+
+    # Team 1 (Admins aktuelle) ændres; team 2 får et nyt event der skal overleve
+    client.post('/api/unavailable/toggle', json={'date': '2030-06-06'})
+    client.delete('/api/group-events/1')
+    client.post('/select-team/2')
+    assert client.post('/api/group-events', json={'title': 'Ny Beta', 'date': '2030-07-07'}).status_code == 201
+    changed = export()
+    assert _team_rows(changed, 1) != _team_rows(original, 1)
+
+    status, result = run_job(client.post('/api/admin/restore-team',
+                                         json={'filename': filename, 'team_id': 1, 'preview': True}))
+    assert status == 200, result
+    assert result['preview'] and result['restored']['group_events'] == 1
+    assert normalized(export()) == normalized(changed)
+
+    status, result = run_job(client.post('/api/admin/restore-team', json={'filename': filename, 'team_id': 1}))
+    assert status == 200, result
+    wait_idle()
+    after = export()
+    assert _team_rows(after, 1) == _team_rows(original, 1)
+    assert _team_rows(after, 2) == _team_rows(changed, 2)
+    assert normalized(after)['users'] == normalized(original)['users']
+
+
+def test_restore_team_missing_in_backup(client, run_job):
+    status, result = run_job(client.post('/api/admin/backup-now'))
+    assert status == 200, result
+    status, result = run_job(client.post('/api/admin/restore-team',
+                                         json={'filename': result['filename'], 'team_id': 99}))
+    assert status == 404